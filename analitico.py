@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing
+from typing import Dict, List, Optional
+
+import banco
+import modelos
+import relatorio
+import versoes
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # exportação indisponível sem pyarrow
+    pa = None
+
+try:
+    import duckdb
+except ImportError:  # consultas caem para o pyarrow puro
+    duckdb = None
+
+# ------------------------------------------------------------------
+# Exportação colunar do portfólio (Parquet) e consultas analíticas
+# ------------------------------------------------------------------
+# Achata clientes, CNPJs, processos, layouts e retornos (o JSON de
+# processo_config) em arquivos Parquet, um por cliente e tabela:
+#   <diretorio>/<tabela>/cliente_<id>.parquet
+# O manifesto guarda a versão de dados (cliente_versao) exportada de cada
+# cliente, de modo que uma nova exportação só regrava os clientes alterados.
+# As consultas do portfólio rodam sobre esses arquivos com DuckDB embarcado,
+# ou com pyarrow quando o DuckDB não está instalado.
+#
+# Uso:
+#   python analitico.py exportar processos.db
+#   python analitico.py portfolio
+
+DIRETORIO_PADRAO = "analitico"
+ARQUIVO_MANIFESTO = "manifesto.json"
+
+if pa is not None:
+    SCHEMAS = {
+        "clientes": pa.schema([
+            ("cliente_id", pa.int64()),
+            ("nome_empresa", pa.string()),
+        ]),
+        "cnpjs": pa.schema([
+            ("cliente_id", pa.int64()),
+            ("cnpj_id", pa.int64()),
+            ("numero", pa.string()),
+        ]),
+        "processos": pa.schema([
+            ("cliente_id", pa.int64()),
+            ("processo_id", pa.int64()),
+            ("nome", pa.string()),
+            ("tipo", pa.string()),
+            ("frequencia", pa.string()),
+            ("configurado", pa.bool_()),
+            ("categoria_analise", pa.string()),
+        ]),
+        "layouts": pa.schema([
+            ("cliente_id", pa.int64()),
+            ("processo_id", pa.int64()),
+            ("posicao", pa.int32()),
+            ("tipo", pa.string()),
+            ("modo", pa.string()),
+            ("arquivo_tipo", pa.string()),
+            ("nome", pa.string()),
+            ("origem_processo_id", pa.int64()),
+            ("categoria_entrada", pa.string()),
+        ]),
+        "retornos": pa.schema([
+            ("cliente_id", pa.int64()),
+            ("processo_id", pa.int64()),
+            ("tipo", pa.string()),
+            ("proposito", pa.string()),
+            ("categoria_saida", pa.string()),
+        ]),
+    }
+
+class DependenciaAusente(RuntimeError):
+    """Biblioteca opcional necessária para a operação não está instalada."""
+
+def _exigir_pyarrow() -> None:
+    if pa is None:
+        raise DependenciaAusente("A exportação analítica requer o pacote pyarrow (pip install pyarrow).")
+
+# ------------------------------------------------------------------
+# Exportação
+# ------------------------------------------------------------------
+def ler_manifesto(diretorio: str) -> Dict[int, int]:
+    """{cliente_id: versao exportada}; vazio se nada foi exportado ainda."""
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_MANIFESTO), encoding="utf-8") as f:
+            return {int(cid): versao for cid, versao in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print("DEBUG: Manifesto analítico inválido, exportando tudo:", e)
+        return {}
+
+def _gravar_manifesto(diretorio: str, manifesto: Dict[int, int]) -> None:
+    caminho = os.path.join(diretorio, ARQUIVO_MANIFESTO)
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({str(cid): versao for cid, versao in sorted(manifesto.items())}, f)
+    os.replace(caminho + ".tmp", caminho)
+
+def linhas_cliente(dados: modelos.DadosCliente) -> Dict[str, List[dict]]:
+    """Linhas achatadas de cada tabela analítica para um cliente."""
+    linhas = {tabela: [] for tabela in SCHEMAS}
+    cliente = dados.cliente
+    if cliente is None:
+        return linhas
+    linhas["clientes"].append({"cliente_id": cliente.id, "nome_empresa": cliente.nome_empresa})
+    for cnpj in dados.cnpjs:
+        linhas["cnpjs"].append({"cliente_id": cliente.id, "cnpj_id": cnpj.id, "numero": cnpj.numero})
+    for proc in dados.processos:
+        linhas["processos"].append({
+            "cliente_id": cliente.id,
+            "processo_id": proc.id,
+            "nome": proc.nome,
+            "tipo": proc.tipo,
+            "frequencia": proc.frequencia,
+            "configurado": proc.configurado,
+            "categoria_analise": relatorio.categoriza_processo(proc.tipo or ""),
+        })
+        config = dados.config(proc.id)
+        for posicao, layout in enumerate(config.layouts):
+            linhas["layouts"].append({
+                "cliente_id": cliente.id,
+                "processo_id": proc.id,
+                "posicao": posicao,
+                "tipo": layout.tipo,
+                "modo": layout.modo,
+                "arquivo_tipo": layout.arquivo_tipo,
+                "nome": layout.nome or layout.arquivo or layout.processo,
+                "origem_processo_id": layout.processo_id,
+                "categoria_entrada": (
+                    relatorio.categoriza_layout_entrada(layout.arquivo_tipo or "") if layout.tipo == "Arquivo" else None
+                ),
+            })
+        if config.retorno:
+            linhas["retornos"].append({
+                "cliente_id": cliente.id,
+                "processo_id": proc.id,
+                "tipo": config.retorno.tipo,
+                "proposito": config.retorno.proposito,
+                "categoria_saida": relatorio.categoriza_saida(config.retorno.tipo),
+            })
+    return linhas
+
+def _arquivo(diretorio: str, tabela: str, cliente_id: int) -> str:
+    return os.path.join(diretorio, tabela, f"cliente_{cliente_id}.parquet")
+
+def _gravar_cliente(diretorio: str, cliente_id: int, linhas: Dict[str, List[dict]]) -> None:
+    for tabela, schema in SCHEMAS.items():
+        destino = _arquivo(diretorio, tabela, cliente_id)
+        # Grava em arquivo temporário e troca, para que leitores nunca vejam um Parquet pela metade
+        pq.write_table(pa.Table.from_pylist(linhas[tabela], schema=schema), destino + ".tmp")
+        os.replace(destino + ".tmp", destino)
+
+def _remover_cliente(diretorio: str, cliente_id: int) -> None:
+    for tabela in SCHEMAS:
+        try:
+            os.remove(_arquivo(diretorio, tabela, cliente_id))
+        except FileNotFoundError:
+            pass
+
+def exportar(caminhos: List[str], diretorio: str = DIRETORIO_PADRAO, tarefa=None) -> dict:
+    """
+    Exporta para Parquet os clientes cuja versão de dados mudou desde a última
+    exportação e remove os arquivos de clientes que não existem mais.
+    `caminhos` são os bancos SQLite de origem (o banco único ou as partições);
+    `tarefa` (opcional) recebe o progresso quando roda no GerenciadorTarefas.
+    Retorna {"exportados": [...], "inalterados": n, "removidos": [...], "segundos": s}.
+    """
+    _exigir_pyarrow()
+    inicio = time.perf_counter()
+    for tabela in SCHEMAS:
+        os.makedirs(os.path.join(diretorio, tabela), exist_ok=True)
+    manifesto = ler_manifesto(diretorio)
+
+    pendentes = []
+    existentes = set()
+    for caminho in caminhos:
+        with closing(sqlite3.connect(caminho)) as conn:
+            for (cliente_id,) in conn.execute("SELECT id FROM cliente ORDER BY id").fetchall():
+                existentes.add(cliente_id)
+                versao = versoes.versao_cliente(conn, cliente_id)
+                if manifesto.get(cliente_id) != versao:
+                    pendentes.append((caminho, cliente_id))
+
+    exportados = []
+    for i, (caminho, cliente_id) in enumerate(pendentes, start=1):
+        if tarefa is not None:
+            tarefa.atualizar(i / (len(pendentes) + 1), f"Exportando cliente {cliente_id} ({i}/{len(pendentes)})")
+        # carregar_cliente lê versão e dados na mesma transação: não exporta um estado intermediário
+        with closing(sqlite3.connect(caminho)) as conn:
+            dados = modelos.carregar_cliente(conn, cliente_id)
+        _gravar_cliente(diretorio, cliente_id, linhas_cliente(dados))
+        manifesto[cliente_id] = dados.versao
+        exportados.append(cliente_id)
+
+    removidos = [cid for cid in manifesto if cid not in existentes]
+    for cliente_id in removidos:
+        _remover_cliente(diretorio, cliente_id)
+        del manifesto[cliente_id]
+
+    if exportados or removidos:
+        _gravar_manifesto(diretorio, manifesto)
+    return {
+        "exportados": exportados,
+        "inalterados": len(existentes) - len(exportados),
+        "removidos": removidos,
+        "segundos": time.perf_counter() - inicio,
+    }
+
+# ------------------------------------------------------------------
+# Consultas do portfólio
+# ------------------------------------------------------------------
+def carregar(diretorio: str = DIRETORIO_PADRAO) -> Dict[str, "pa.Table"]:
+    """Tabelas analíticas exportadas, uma pyarrow.Table por tabela (vazias se não houver arquivos)."""
+    _exigir_pyarrow()
+    tabelas = {}
+    for tabela, schema in SCHEMAS.items():
+        pasta = os.path.join(diretorio, tabela)
+        arquivos = sorted(
+            os.path.join(pasta, nome) for nome in (os.listdir(pasta) if os.path.isdir(pasta) else [])
+            if nome.endswith(".parquet")
+        )
+        tabelas[tabela] = (
+            pa.concat_tables([pq.read_table(arquivo, schema=schema) for arquivo in arquivos])
+            if arquivos else schema.empty_table()
+        )
+    return tabelas
+
+def _contagem(tabelas: dict, con, tabela: str, coluna: str, filtro: Optional[tuple] = None) -> Counter:
+    """Quantidade de linhas de `tabela` por valor de `coluna` (nulos ignorados); filtro = (coluna, valor)."""
+    if con is not None:
+        sql = f"SELECT {coluna}, COUNT(*) FROM {tabela} WHERE {coluna} IS NOT NULL"
+        params = []
+        if filtro:
+            sql += f" AND {filtro[0]} = ?"
+            params.append(filtro[1])
+        return Counter(dict(con.execute(sql + " GROUP BY 1", params).fetchall()))
+    dados = tabelas[tabela]
+    if filtro:
+        dados = dados.filter(pc.equal(dados[filtro[0]], filtro[1]))
+    dados = dados.filter(pc.is_valid(dados[coluna]))
+    return Counter(dict(zip(*dados.group_by(coluna).aggregate([(coluna, "count")]).to_pydict().values())))
+
+def portfolio(diretorio: str = DIRETORIO_PADRAO) -> dict:
+    """
+    Versão do relatório de quantidades para todos os clientes exportados, mais a
+    distribuição de frequências e um resumo por cliente.
+    Retorna {"entrada", "analise", "saida", "frequencia", "clientes": [...], "motor": str, "segundos": s}.
+    """
+    inicio = time.perf_counter()
+    tabelas = carregar(diretorio)
+    con = None
+    if duckdb is not None:
+        con = duckdb.connect()
+        for tabela, dados in tabelas.items():
+            con.register(tabela, dados)
+    try:
+        entrada = _contagem(tabelas, con, "layouts", "categoria_entrada", ("tipo", "Arquivo"))
+        analise = _contagem(tabelas, con, "processos", "categoria_analise")
+        saida = _contagem(tabelas, con, "retornos", "categoria_saida")
+        frequencia = _contagem(tabelas, con, "processos", "frequencia")
+        processos_cliente = _contagem(tabelas, con, "processos", "cliente_id")
+        layouts_cliente = _contagem(tabelas, con, "layouts", "cliente_id", ("tipo", "Arquivo"))
+        retornos_cliente = _contagem(tabelas, con, "retornos", "cliente_id")
+        cnpjs_cliente = _contagem(tabelas, con, "cnpjs", "cliente_id")
+    finally:
+        if con is not None:
+            con.close()
+
+    nomes = dict(zip(*tabelas["clientes"].select(["cliente_id", "nome_empresa"]).to_pydict().values()))
+    return {
+        "entrada": [{"TIPO ENTRADA": rotulo, "QUANTIDADE": entrada[chave]} for chave, rotulo in relatorio.ENTRADAS],
+        "analise": [{"TIPO ANÁLISE": chave, "QUANTIDADE": analise[chave]} for chave in relatorio.ANALISES],
+        "saida": [{"TIPO SAÍDA": chave, "QUANTIDADE": saida[chave]} for chave in relatorio.SAIDAS],
+        "frequencia": [
+            {"FREQUÊNCIA": chave, "QUANTIDADE": quantidade} for chave, quantidade in frequencia.most_common()
+        ],
+        "clientes": [
+            {
+                "CLIENTE": nomes[cid],
+                "CNPJS": cnpjs_cliente[cid],
+                "PROCESSOS": processos_cliente[cid],
+                "LAYOUTS DE ENTRADA": layouts_cliente[cid],
+                "RETORNOS": retornos_cliente[cid],
+            }
+            for cid in sorted(nomes)
+        ],
+        "motor": "duckdb" if duckdb is not None else "pyarrow",
+        "segundos": time.perf_counter() - inicio,
+    }
+
+def atualizar_portfolio(tarefa, caminhos: List[str], diretorio: str = DIRETORIO_PADRAO) -> dict:
+    """Tarefa em segundo plano: exportação incremental seguida da consulta do portfólio."""
+    exportacao = exportar(caminhos, diretorio, tarefa)
+    tarefa.atualizar(0.95, "Consultando o portfólio...")
+    return {"exportacao": exportacao, "portfolio": portfolio(diretorio)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportação analítica (Parquet) do portfólio de processos.")
+    parser.add_argument("--diretorio", default=DIRETORIO_PADRAO, help="Destino dos arquivos Parquet")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_exportar = sub.add_parser("exportar", help="Exporta os clientes alterados desde a última exportação.")
+    p_exportar.add_argument("bancos", nargs="+", help="Bancos SQLite de origem (processos.db ou as partições)")
+    sub.add_parser("portfolio", help="Mostra as quantidades consolidadas de todos os clientes.")
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        for caminho in args.bancos:
+            with closing(sqlite3.connect(caminho)) as conn:
+                banco.criar_schema(conn)
+                conn.commit()
+        resultado = exportar(args.bancos, args.diretorio)
+        print(
+            f"{len(resultado['exportados'])} cliente(s) exportado(s), {resultado['inalterados']} inalterado(s), "
+            f"{len(resultado['removidos'])} removido(s) em {resultado['segundos']:.2f}s."
+        )
+    elif args.comando == "portfolio":
+        resultado = portfolio(args.diretorio)
+        for secao in ("entrada", "analise", "saida", "frequencia", "clientes"):
+            print(f"\n[{secao.upper()}]")
+            for linha in resultado[secao]:
+                print("  " + " | ".join(f"{k}: {v}" for k, v in linha.items()))
+        print(f"\nConsulta ({resultado['motor']}) em {resultado['segundos'] * 1000:.1f} ms.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import banco
+import modelos
+import mudancas
+import particoes
+
+# ------------------------------------------------------------------
+# API JSON local (somente leitura)
+# ------------------------------------------------------------------
+# Expõe clientes, processos e layouts para outras ferramentas internas sem
+# passar pela interface do Streamlit. Usa só a biblioteca padrão e roda ao
+# lado do app, lendo os mesmos arquivos (banco único ou partições).
+#
+# Cada resposta leva um ETag derivado das versões por cliente (cliente_versao).
+# As versões ficam em memória e só são relidas quando PRAGMA data_version
+# indica que outra conexão gravou no arquivo; assim, uma consulta repetida com
+# If-None-Match recebe 304 sem ler nenhuma tabela.
+#
+# Uso:
+#   python api.py --banco processos.db --porta 8765
+#   python api.py --particoes particoes/
+#
+# Rotas:
+#   GET /clientes?limite=50&apos=<id>        resumo paginado dos clientes
+#   GET /clientes?ids=1,2,3                  vários clientes completos de uma vez
+#   GET /clientes/<id>                       cliente completo (CNPJs, processos e configs)
+#   GET /clientes/<id>/processos?limite=&apos=&ids=
+#   GET /layouts?limite=50&apos=<rótulo>     catálogo de layouts de arquivo com o número de usos
+#   GET /mudancas?desde=<seq>&limite=&cliente=<id>
+#                                            registro de mudanças depois do cursor (sem ETag); com
+#                                            partições, `cliente` escolhe o arquivo (cada um tem sua sequência)
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+MAX_CLIENTES_EM_CACHE = 256
+
+class RequisicaoInvalida(ValueError):
+    """Parâmetro de consulta inválido (resposta 400)."""
+
+class NaoEncontrado(KeyError):
+    """Recurso inexistente (resposta 404)."""
+
+# ------------------------------------------------------------------
+# Versões e dados decodificados
+# ------------------------------------------------------------------
+def _conectar_leitura(caminho: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+
+class Fonte:
+    """Um arquivo SQLite observado pela API, com o retrato das versões de seus clientes."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._sentinela = _conectar_leitura(caminho)
+        self._data_version = None
+        self._versoes: Dict[int, int] = {}
+
+    def versoes(self) -> Dict[int, int]:
+        """{cliente_id: versão}, relido apenas se o arquivo mudou desde a última consulta."""
+        with self._lock:
+            atual = self._sentinela.execute("PRAGMA data_version").fetchone()[0]
+            if atual != self._data_version:
+                # Clientes anteriores às triggers de versão não têm linha em cliente_versao: versão 0
+                self._versoes = dict(self._sentinela.execute("""
+                    SELECT c.id, COALESCE(v.versao, 0)
+                    FROM cliente c
+                    LEFT JOIN cliente_versao v ON v.cliente_id = c.id
+                """).fetchall())
+                self._data_version = atual
+            return self._versoes
+
+    def fechar(self) -> None:
+        self._sentinela.close()
+
+class Dados:
+    """Acesso de leitura aos clientes, no banco único ou nas partições do catálogo."""
+
+    def __init__(self, banco: str = "processos.db", diretorio_particoes: str = ""):
+        self._lock = threading.Lock()
+        self._fontes: Dict[str, Fonte] = {}
+        self._cache: "OrderedDict[Tuple[int, int], modelos.DadosCliente]" = OrderedDict()
+        self._catalogo = None
+        self._catalogo_versao = None
+        if diretorio_particoes:
+            caminho_catalogo = os.path.join(diretorio_particoes, particoes.ARQUIVO_CATALOGO)
+            particoes.Roteador(diretorio_particoes)  # cria o catálogo se ainda não existir
+            self._diretorio = diretorio_particoes
+            self._catalogo = _conectar_leitura(caminho_catalogo)
+        else:
+            self._fontes[banco] = Fonte(banco)
+
+    def _atualizar_fontes(self) -> None:
+        """No modo particionado, acompanha as partições criadas ou removidas pelo app."""
+        atual = self._catalogo.execute("PRAGMA data_version").fetchone()[0]
+        if atual == self._catalogo_versao:
+            return
+        caminhos = {
+            os.path.join(self._diretorio, arquivo)
+            for (arquivo,) in self._catalogo.execute("SELECT arquivo FROM cliente_particao WHERE arquivo != ''")
+        }
+        for caminho in set(self._fontes) - caminhos:
+            self._fontes.pop(caminho).fechar()
+        for caminho in caminhos - set(self._fontes):
+            if os.path.exists(caminho):
+                self._fontes[caminho] = Fonte(caminho)
+        self._catalogo_versao = atual
+
+    def versoes(self) -> Dict[int, Tuple[int, str]]:
+        """{cliente_id: (versão, arquivo)} de todos os clientes."""
+        with self._lock:
+            if self._catalogo is not None:
+                self._atualizar_fontes()
+            fontes = list(self._fontes.values())
+        return {cid: (versao, fonte.caminho) for fonte in fontes for cid, versao in fonte.versoes().items()}
+
+    def caminho_mudancas(self, cliente_id: Optional[int]) -> str:
+        """Arquivo cujo registro de mudanças será lido."""
+        if self._catalogo is None:
+            return next(iter(self._fontes))
+        if cliente_id is None:
+            raise RequisicaoInvalida("com partições, informe o cliente")
+        versao = self.versoes().get(cliente_id)
+        if versao is None:
+            raise NaoEncontrado(f"cliente {cliente_id} não encontrado")
+        return versao[1]
+
+    def cliente(self, cliente_id: int, versao: int, caminho: str) -> modelos.DadosCliente:
+        """Cliente decodificado, guardado por (cliente_id, versão) como no app."""
+        chave = (cliente_id, versao)
+        with self._lock:
+            if chave in self._cache:
+                self._cache.move_to_end(chave)
+                return self._cache[chave]
+        with closing(_conectar_leitura(caminho)) as conn:
+            dados = modelos.carregar_cliente(conn, cliente_id)
+        with self._lock:
+            self._cache[(cliente_id, dados.versao)] = dados
+            while len(self._cache) > MAX_CLIENTES_EM_CACHE:
+                self._cache.popitem(last=False)
+        return dados
+
+# ------------------------------------------------------------------
+# Conversão para JSON
+# ------------------------------------------------------------------
+def resumo_cliente(dados: modelos.DadosCliente) -> dict:
+    cliente = dados.cliente
+    return {
+        "id": cliente.id,
+        "nome_empresa": cliente.nome_empresa,
+        "versao": dados.versao,
+        "processos": len(dados.processos),
+        "cnpjs": len(dados.cnpjs),
+    }
+
+def processo_json(dados: modelos.DadosCliente, processo: modelos.Processo) -> dict:
+    config = dados.config(processo.id)
+    return {
+        "id": processo.id,
+        "nome": processo.nome,
+        "tipo": processo.tipo,
+        "frequencia": processo.frequencia,
+        "configurado": processo.configurado,
+        "descricao": processo.descricao,
+        "config": {
+            "versao": config.versao,
+            "layouts": config.layouts_dicts(),
+            "retorno": config.retorno_dict(),
+            "cnpjs": list(config.cnpjs),
+            "erros": list(config.erros),
+        },
+    }
+
+def cliente_json(dados: modelos.DadosCliente) -> dict:
+    cliente = dados.cliente
+    return {
+        "id": cliente.id,
+        "nome_empresa": cliente.nome_empresa,
+        "tem_logo": bool(cliente.logo),
+        "nome_pessoa": cliente.nome_pessoa,
+        "cargo": cliente.cargo,
+        "email": cliente.email,
+        "celular": cliente.celular,
+        "versao": dados.versao,
+        "cnpjs": [{"id": cnpj.id, "numero": cnpj.numero} for cnpj in dados.cnpjs],
+        "processos": [processo_json(dados, processo) for processo in dados.processos],
+    }
+
+# ------------------------------------------------------------------
+# Paginação e ETags
+# ------------------------------------------------------------------
+def _inteiro(valor: str, nome: str) -> int:
+    try:
+        return int(valor)
+    except ValueError:
+        raise RequisicaoInvalida(f"{nome} deve ser um inteiro: {valor!r}")
+
+def _limite(consulta: dict) -> int:
+    limite = _inteiro(consulta.get("limite", [str(LIMITE_PADRAO)])[0], "limite")
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        raise RequisicaoInvalida(f"limite deve estar entre 1 e {LIMITE_MAXIMO}")
+    return limite
+
+def _ids(consulta: dict) -> Optional[List[int]]:
+    if "ids" not in consulta:
+        return None
+    ids = [_inteiro(i, "ids") for valor in consulta["ids"] for i in valor.split(",") if i.strip()]
+    if len(ids) > LIMITE_MAXIMO:
+        raise RequisicaoInvalida(f"no máximo {LIMITE_MAXIMO} ids por requisição")
+    return list(dict.fromkeys(ids))
+
+def _pagina(chaves: list, consulta: dict, conversor=None) -> Tuple[list, Optional[object]]:
+    """Paginação por chave (keyset): itens depois de `apos`, até `limite`, e a chave do próximo."""
+    limite = _limite(consulta)
+    chaves = sorted(chaves)
+    if "apos" in consulta:
+        apos = conversor(consulta["apos"][0]) if conversor else consulta["apos"][0]
+        chaves = [chave for chave in chaves if chave > apos]
+    pagina = chaves[:limite]
+    return pagina, (pagina[-1] if len(chaves) > limite else None)
+
+def etag(*partes) -> str:
+    """ETag fraco calculado a partir das versões (e parâmetros) que determinam a resposta."""
+    return 'W/"' + hashlib.sha1(repr(partes).encode("utf-8")).hexdigest()[:20] + '"'
+
+# ------------------------------------------------------------------
+# Rotas
+# ------------------------------------------------------------------
+def rotear(dados: Dados, caminho: str, consulta: dict):
+    """
+    Resolve a rota e devolve (etag, gerar), onde gerar() monta o corpo da resposta.
+    O ETag sai apenas das versões em memória; gerar() só é chamado se o cliente
+    da API não tiver a mesma versão.
+    """
+    partes = [p for p in caminho.split("/") if p]
+    if partes == ["mudancas"]:
+        cursor = _inteiro(consulta.get("desde", ["0"])[0], "desde")
+        cliente = _inteiro(consulta["cliente"][0], "cliente") if "cliente" in consulta else None
+        limite = _limite(consulta)
+        arquivo = dados.caminho_mudancas(cliente)
+
+        def gerar():
+            with closing(_conectar_leitura(arquivo)) as conn:
+                lista, proximo = mudancas.mudancas_desde(conn, cursor, limite, cliente)
+            return {
+                "itens": [
+                    {"seq": m.seq, "tabela": m.tabela, "operacao": m.operacao, "registro_id": m.registro_id,
+                     "cliente_id": m.cliente_id, "dados": m.dados, "criado_em": m.criado_em}
+                    for m in lista
+                ],
+                "cursor": proximo,
+            }
+        return None, gerar
+
+    versoes = dados.versoes()
+
+    def versao_de(cid: int) -> Tuple[int, str]:
+        if cid not in versoes:
+            raise NaoEncontrado(f"cliente {cid} não encontrado")
+        return versoes[cid]
+
+    if partes == ["clientes"]:
+        ids = _ids(consulta)
+        if ids is not None:
+            alvos = [(cid, versao_de(cid)) for cid in ids]
+            return etag("clientes", alvos), lambda: {
+                "itens": [cliente_json(dados.cliente(cid, v, arq)) for cid, (v, arq) in alvos]
+            }
+        pagina, proximo = _pagina(list(versoes), consulta, lambda v: _inteiro(v, "apos"))
+        alvos = [(cid, versoes[cid]) for cid in pagina]
+        return etag("resumo", alvos, proximo), lambda: {
+            "itens": [resumo_cliente(dados.cliente(cid, v, arq)) for cid, (v, arq) in alvos],
+            "proximo": proximo,
+        }
+
+    if len(partes) in (2, 3) and partes[0] == "clientes":
+        cid = _inteiro(partes[1], "id do cliente")
+        versao, arquivo = versao_de(cid)
+        if len(partes) == 2:
+            return etag("cliente", cid, versao), lambda: cliente_json(dados.cliente(cid, versao, arquivo))
+        if partes[2] == "processos":
+            ids = _ids(consulta)
+            limite = _limite(consulta) if ids is None else None
+            apos = consulta.get("apos", [""])[0]
+
+            def gerar():
+                doc = dados.cliente(cid, versao, arquivo)
+                processos = {processo.id: processo for processo in doc.processos}
+                if ids is not None:
+                    faltando = [pid for pid in ids if pid not in processos]
+                    if faltando:
+                        raise NaoEncontrado(f"processos {faltando} não encontrados no cliente {cid}")
+                    return {"itens": [processo_json(doc, processos[pid]) for pid in ids]}
+                pagina, proximo = _pagina(list(processos), consulta, lambda v: _inteiro(v, "apos"))
+                return {"itens": [processo_json(doc, processos[pid]) for pid in pagina], "proximo": proximo}
+            return etag("processos", cid, versao, ids, limite, apos), gerar
+
+    if partes == ["layouts"]:
+        alvos = sorted(versoes.items())
+        limite = _limite(consulta)
+        apos = consulta.get("apos", [""])[0]
+
+        def gerar():
+            usos: Dict[str, dict] = {}
+            for cid, (versao, arquivo) in alvos:
+                doc = dados.cliente(cid, versao, arquivo)
+                for config in doc.configs.values():
+                    for layout in config.layouts:
+                        if layout.rotulo is None:
+                            continue
+                        item = usos.setdefault(layout.rotulo, {"rotulo": layout.rotulo, "arquivo_tipo": layout.arquivo_tipo, "usos": 0, "clientes": set()})
+                        item["usos"] += 1
+                        item["clientes"].add(cid)
+            pagina, proximo = _pagina(list(usos), consulta)
+            return {
+                "itens": [{**usos[r], "clientes": sorted(usos[r]["clientes"])} for r in pagina],
+                "proximo": proximo,
+            }
+        return etag("layouts", alvos, limite, apos), gerar
+
+    raise NaoEncontrado(f"rota desconhecida: {caminho}")
+
+class Manipulador(BaseHTTPRequestHandler):
+    dados: Dados = None
+    server_version = "DetalhamentoAPI/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            marca, gerar = rotear(self.dados, url.path, parse_qs(url.query))
+            if marca and marca in [m.strip() for m in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", marca)
+                self.end_headers()
+                return
+            self._responder(200, gerar(), marca)
+        except RequisicaoInvalida as e:
+            self._responder(400, {"erro": str(e)})
+        except NaoEncontrado as e:
+            self._responder(404, {"erro": e.args[0]})
+        except Exception as e:
+            print(f"DEBUG: Erro na API em {self.path}: {e}")
+            self._responder(500, {"erro": "erro interno"})
+
+    def _responder(self, status: int, corpo: dict, marca: Optional[str] = None) -> None:
+        conteudo = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(conteudo)))
+        if marca:
+            self.send_header("ETag", marca)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(conteudo)
+
+    def log_message(self, formato, *args):
+        print(f"DEBUG: API {self.address_string()} - {formato % args}")
+
+def criar_servidor(dados: Dados, host: str = "127.0.0.1", porta: int = 8765) -> ThreadingHTTPServer:
+    manipulador = type("ManipuladorDados", (Manipulador,), {"dados": dados})
+    return ThreadingHTTPServer((host, porta), manipulador)
+
+def main():
+    parser = argparse.ArgumentParser(description="API JSON local (somente leitura) sobre o banco de processos.")
+    parser.add_argument("--banco", default="processos.db", help="Banco único (ignorado com --particoes)")
+    parser.add_argument("--particoes", default=os.environ.get("DETALHAMENTO_PARTICOES", ""),
+                        help="Diretório das partições por cliente")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    args = parser.parse_args()
+
+    if not args.particoes:
+        # Garante cliente_versao e as triggers em bancos ainda não abertos pelo app
+        with closing(sqlite3.connect(args.banco)) as conn:
+            banco.criar_schema(conn)
+            conn.commit()
+    servidor = criar_servidor(Dados(args.banco, args.particoes), args.host, args.porta)
+    print(f"API disponível em http://{args.host}:{args.porta}/clientes")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
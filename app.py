@@ -1,9 +1,38 @@
 import streamlit as st
 import sqlite3
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 import json
 import unicodedata
 import streamlit.components.v1 as components
+import os
+import time
+from collections import Counter
+from contextlib import closing
+from functools import partial
+from datetime import date, datetime
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import analitico
+import backup
+import banco
+import calendario
+import encadeamento
+import escritor
+import espelho
+import diagramas
+import grade_layouts
+import historico
+import modelos
+import particoes
+import perfil
+import precarga
+import recomendacao
+import relatorio
+import similaridade
+import tarefas
+import templates
+import unidade
+import versoes
 
 # ------------------------------------------------------------------
 # Configuração da página (deve ser a primeira instrução)
@@ -22,143 +51,594 @@ st.set_page_config(
 # ------------------------------------------------------------------
 # Funções do Banco de Dados
 # ------------------------------------------------------------------
-def get_db_connection():
-    return sqlite3.connect("processos.db", check_same_thread=False)
+DB_PATH = "processos.db"
+# Diretório das partições por cliente (um arquivo SQLite por cliente); vazio usa o banco único
+PARTICOES_DIR = os.environ.get("DETALHAMENTO_PARTICOES", "")
+# Destino da exportação colunar (Parquet) usada pela visão do portfólio
+ANALITICO_DIR = os.environ.get("DETALHAMENTO_ANALITICO", analitico.DIRETORIO_PADRAO)
+# Quantos clientes (os mais alterados) carregar já na inicialização do servidor; 0 desliga
+PRECARREGAR_CLIENTES = int(os.environ.get("DETALHAMENTO_PRECARREGAR", "0") or 0)
+LOGO_PATH = "logo_dattos.png"
+# Cópias dos clientes excluídos com a opção de arquivar (um arquivo SQLite por cliente)
+ARQUIVADOS_DIR = os.environ.get("DETALHAMENTO_ARQUIVADOS", "arquivados")
+# Backup online agendado: intervalo em horas (0 desliga), destino e snapshots mantidos por banco
+BACKUP_HORAS = float(os.environ.get("DETALHAMENTO_BACKUP_HORAS", "0") or 0)
+BACKUP_DIR = os.environ.get("DETALHAMENTO_BACKUP_DIR", backup.DIRETORIO_PADRAO)
+BACKUP_MANTER = int(os.environ.get("DETALHAMENTO_BACKUP_MANTER", "7") or 7)
+# Memória (MB) para os dados pré-carregados após o login e ainda não usados; 0 desliga a pré-carga
+PRECARGA_MB = float(os.environ.get("DETALHAMENTO_PRECARGA_MB", "64") or 0)
+# Leituras servidas de um espelho em memória de cada banco (ver espelho.py)
+USAR_ESPELHO = os.environ.get("DETALHAMENTO_ESPELHO", "0") == "1"
+# Pasta no servidor com amostras grandes demais para o upload do navegador
+AMOSTRAS_DIR = os.environ.get("DETALHAMENTO_AMOSTRAS", "amostras")
+# Imprime o tempo e as consultas de cada execução do script (diagnóstico de desempenho)
+REGISTRAR_EXECUCOES = os.environ.get("DETALHAMENTO_REGISTRAR_EXECUCOES", "0") == "1"
+# Tipos de arquivo de retorno oferecidos na configuração do processo
+TIPOS_RETORNO = ["CSV", "XML", "TXT", "JSON"]
+
+@st.cache_resource
+def get_roteador() -> Optional[particoes.Roteador]:
+    """Roteador de partições, ou None quando o app usa o banco único."""
+    return particoes.Roteador(PARTICOES_DIR) if PARTICOES_DIR else None
+
+def caminho_banco(cliente_id: Optional[int] = None) -> str:
+    """
+    Arquivo SQLite que guarda os dados do cliente (por padrão, o cliente da sessão).
+    Sem partições é sempre DB_PATH. Levanta particoes.ClienteSemParticao para cliente desconhecido.
+    """
+    roteador = get_roteador()
+    if roteador is None:
+        return DB_PATH
+    if cliente_id is None:
+        cliente_id = st.session_state.get("cliente_id")
+    if cliente_id is None:
+        raise particoes.ClienteSemParticao(cliente_id)
+    return roteador.caminho_cliente(cliente_id)
+
+def caminhos_banco() -> List[str]:
+    """Todos os arquivos de dados, para consultas que atravessam clientes (fan-out)."""
+    roteador = get_roteador()
+    return roteador.caminhos() if roteador else [DB_PATH]
+
+def caminho_templates() -> str:
+    """Arquivo da biblioteca de templates: o catálogo das partições ou o banco único."""
+    return os.path.join(PARTICOES_DIR, particoes.ARQUIVO_CATALOGO) if get_roteador() else DB_PATH
+
+def get_db_connection(cliente_id: Optional[int] = None):
+    """Conexão de leitura do banco do cliente (usada pelas tarefas em segundo plano)."""
+    return conectar_leitura(caminho_banco(cliente_id))
 
 def init_db():
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS cliente (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_empresa TEXT,
-                logo BLOB,
-                nome_pessoa TEXT,
-                cargo TEXT,
-                email TEXT,
-                celular TEXT
-            )
-        ''')
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS cnpjs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                numero TEXT UNIQUE,
-                cliente_id INTEGER,
-                FOREIGN KEY(cliente_id) REFERENCES cliente(id)
-            )
-        ''')
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS processos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT,
-                tipo TEXT,
-                frequencia TEXT,
-                cliente_id INTEGER,
-                configurado INTEGER DEFAULT 0,
-                FOREIGN KEY(cliente_id) REFERENCES cliente(id)
-            )
-        ''')
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS processo_config (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                processo_id INTEGER,
-                cnpjs TEXT,
-                layouts TEXT,
-                encadeamento TEXT,
-                retorno TEXT,
-                FOREIGN KEY(processo_id) REFERENCES processos(id)
-            )
-        ''')
+    for caminho in caminhos_banco():
+        # Sem foreign_keys: a migração para exclusão em cascata reconstrói tabelas
+        with closing(sqlite3.connect(caminho)) as conn:
+            banco.criar_schema(conn)
+            # Constrói os índices de semelhança e de recomendação na primeira vez; depois só aplica o que mudou
+            similaridade.sincronizar(conn)
+            recomendacao.sincronizar(conn)
+            conn.commit()
+            if not banco.vacuum_incremental_ativo(conn):
+                # A conversão exige um VACUUM completo, que travaria as escritas de todos os servidores
+                print(f"DEBUG: {caminho} sem auto_vacuum incremental; converta com: python manutencao.py converter {caminho}")
+    with closing(sqlite3.connect(caminho_templates())) as conn:
+        templates.criar_tabelas(conn)
         conn.commit()
 
+@st.cache_resource
+def get_gerenciador_tarefas() -> tarefas.GerenciadorTarefas:
+    """Pool de tarefas em segundo plano, único por processo do servidor."""
+    return tarefas.GerenciadorTarefas()
+
+@st.cache_resource
+def get_escritor(caminho: str = DB_PATH) -> escritor.Escritor:
+    """Escritor único de cada arquivo de banco, compartilhado por todas as sessões do servidor."""
+    espelho_arquivo = get_espelho(caminho)
+    return escritor.Escritor(caminho, apos_commit=espelho_arquivo.atualizar if espelho_arquivo else None)
+
+@st.cache_resource
+def get_espelho(caminho: str) -> Optional[espelho.Espelho]:
+    """Espelho em memória do arquivo, com DETALHAMENTO_ESPELHO=1; None se desligado ou indisponível."""
+    if not USAR_ESPELHO:
+        return None
+    try:
+        return espelho.Espelho(caminho)
+    except (espelho.EspelhoIndisponivel, sqlite3.Error) as e:
+        print(f"DEBUG: Leituras de {caminho} seguem no disco: {e}")
+        return None
+
+@st.cache_resource
+def get_cache_precarga() -> precarga.CachePrecarga:
+    """Dados pré-carregados após o login, compartilhados pelo processo do servidor."""
+    return precarga.CachePrecarga(int(PRECARGA_MB * 1024 * 1024))
+
+def escrever(funcao, *args, **kwargs):
+    """Envia a mutação `funcao(conn, ...)` ao escritor do banco do cliente da sessão e aguarda o resultado."""
+    return unidade_trabalho.escrever(caminho_banco(), funcao, *args, **kwargs)
+
+def conectar_leitura(caminho: str) -> sqlite3.Connection:
+    espelho_arquivo = get_espelho(caminho)
+    if espelho_arquivo is not None:
+        return espelho_arquivo.conectar()
+    return banco.conectar(caminho, check_same_thread=False)
+
+def load_versao_cliente(cliente_id: int) -> int:
+    return unidade_trabalho.ler(
+        caminho_banco(cliente_id), ("versao", cliente_id), lambda conn: versoes.versao_cliente(conn, cliente_id)
+    )
+
 # ------------------------------------------------------------------
 # Funções de carregamento e inserção de dados
 # ------------------------------------------------------------------
+def load_dados_cliente(cliente_id: int) -> modelos.DadosCliente:
+    """
+    Cliente, CNPJs, processos e configs já decodificados, para a versão atual dos dados.
+    Levanta particoes.ClienteSemParticao para cliente desconhecido no modo particionado.
+    """
+    caminho = caminho_banco(cliente_id)
+    return unidade_trabalho.obter(
+        ("dados", cliente_id),
+        lambda: _load_dados_cliente(cliente_id, load_versao_cliente(cliente_id), partial(unidade_trabalho.ler, caminho, None)),
+        caminho
+    )
+
+@st.cache_resource(max_entries=256)
+def _load_dados_cliente(cliente_id: int, versao: int, _ler) -> modelos.DadosCliente:
+    # cache_resource em vez de cache_data: os modelos são imutáveis, então todas as
+    # sessões e reexecuções compartilham os mesmos objetos sem copiá-los a cada leitura.
+    # A versão na chave invalida a entrada assim que o cliente é alterado; a leitura
+    # usa o mesmo retrato em que a versão foi lida (_ler fica fora da chave).
+    dados = get_cache_precarga().retirar(("dados", cliente_id, versao))
+    if dados is not None:
+        return dados
+    return _ler(lambda conn: modelos.carregar_cliente(conn, cliente_id))
+
+def sessao_ativa() -> Callable[[], bool]:
+    """Função que diz, de outra thread, se a sessão atual ainda está aberta no servidor."""
+    contexto = get_script_run_ctx()
+    if contexto is None or not Runtime.exists():
+        return lambda: True
+    runtime, sessao = Runtime.instance(), contexto.session_id
+    return lambda: runtime.is_active_session(sessao)
+
+def iniciar_precarga(cliente_id: int) -> None:
+    """
+    Pré-carrega em segundo plano os dados e o relatório do cliente que acabou de entrar,
+    cancelando a pré-carga anterior da sessão.
+    """
+    cancelar_precarga()
+    if PRECARGA_MB <= 0:
+        return
+    contexto = get_script_run_ctx()
+    chave = ("precarga", cliente_id, contexto.session_id if contexto else None)
+    get_gerenciador_tarefas().submeter(
+        chave, precarga.precarregar_cliente, partial(get_db_connection, cliente_id), cliente_id,
+        get_cache_precarga(), sessao_ativa()
+    )
+    st.session_state.precarga = chave
+
+def cancelar_precarga() -> None:
+    chave = st.session_state.pop("precarga", None)
+    if chave is not None:
+        get_gerenciador_tarefas().descartar(chave)
+
+def load_cliente(cliente_id: int) -> Optional[modelos.Cliente]:
+    try:
+        return load_dados_cliente(cliente_id).cliente
+    except particoes.ClienteSemParticao:
+        return None
+
+def load_cnpjs(cliente_id: int) -> Tuple[modelos.Cnpj, ...]:
+    return load_dados_cliente(cliente_id).cnpjs
+
+def add_cnpj(cliente_id: int, numero: str) -> bool:
+    try:
+        escrever(lambda conn: conn.execute("INSERT INTO cnpjs (numero, cliente_id) VALUES (?, ?)", (numero, cliente_id)))
+    except sqlite3.IntegrityError:
+        st.warning(f"CNPJ {numero} já existe!")
+        return False
+    st.cache_data.clear()
+    return True
+
+def recuperar_espaco(caminho: str) -> None:
+    """Devolve as páginas livres do arquivo junto com as demais escritas adiadas, ao fim da execução."""
+    unidade_trabalho.adiar(caminho, banco.recuperar_espaco)
+
+def excluir_cliente(cliente_id: int, arquivar: bool) -> dict:
+    """
+    Exclui o cliente e tudo o que depende dele em uma única transação (cascata das FKs).
+    Com `arquivar`, copia antes os dados para ARQUIVADOS_DIR. Retorna as quantidades excluídas.
+    """
+    caminho = caminho_banco(cliente_id)
+    if arquivar:
+        os.makedirs(ARQUIVADOS_DIR, exist_ok=True)
+        destino = os.path.join(ARQUIVADOS_DIR, f"cliente_{cliente_id}_{datetime.now():%Y%m%d_%H%M%S}.db")
+        particoes.copiar_cliente(caminho, destino, cliente_id)
+    quantidades = unidade_trabalho.escrever(caminho, banco.expurgar_clientes, [cliente_id])
+    roteador = get_roteador()
+    if roteador is not None:
+        roteador.remover_cliente(cliente_id)
+    recuperar_espaco(caminho)
+    st.cache_data.clear()
+    return quantidades
+
 @st.cache_data(ttl=300)
-def load_cliente(cliente_id: int) -> Optional[tuple]:
-    with get_db_connection() as conn:
-        return conn.execute("SELECT * FROM cliente WHERE id = ?", (cliente_id,)).fetchone()
+def load_clientes() -> List[Tuple[int, str]]:
+    """(id, nome_empresa) de todos os clientes, de todos os bancos."""
+    return sorted(particoes.fan_out(caminhos_banco(), "SELECT id, nome_empresa FROM cliente", conectar=conectar_leitura))
 
 @st.cache_data(ttl=300)
-def load_cnpjs(cliente_id: int) -> List[tuple]:
-    with get_db_connection() as conn:
-        return conn.execute("SELECT id, numero FROM cnpjs WHERE cliente_id = ?", (cliente_id,)).fetchall()
+def load_templates() -> List[Tuple[int, str, str, int]]:
+    with closing(conectar_leitura(caminho_templates())) as conn:
+        return templates.listar_templates(conn)
 
-def add_cnpj(cliente_id: int, numero: str) -> bool:
-    with get_db_connection() as conn:
+def load_template(template_id: int) -> Optional[templates.Template]:
+    with closing(conectar_leitura(caminho_templates())) as conn:
+        return templates.carregar_template(conn, template_id)
+
+def aplicar_template(template: templates.Template, clientes: List[int], progresso=None) -> dict:
+    """
+    Copia os processos do template para cada cliente, em uma transação por cliente
+    (pelo escritor do banco de cada um). Retorna {cliente_id: resultado ou mensagem de erro}.
+    """
+    resultados = {}
+    for i, cliente_id in enumerate(clientes, start=1):
         try:
-            conn.execute("INSERT INTO cnpjs (numero, cliente_id) VALUES (?, ?)", (numero, cliente_id))
-            conn.commit()
-            st.cache_data.clear()
-            return True
-        except sqlite3.IntegrityError:
-            st.warning(f"CNPJ {numero} já existe!")
-        return False
+            resultados[cliente_id] = unidade_trabalho.escrever(
+                caminho_banco(cliente_id), templates.aplicar_template, template, cliente_id
+            )
+        except Exception as e:
+            print(f"DEBUG: Erro ao aplicar template {template.id} no cliente {cliente_id}: {e}")
+            resultados[cliente_id] = str(e)
+        if progresso is not None:
+            progresso(i / len(clientes))
+    st.cache_data.clear()
+    return resultados
 
 def remove_cnpj(cnpj_id: int) -> bool:
-    with get_db_connection() as conn:
-        conn.execute("DELETE FROM cnpjs WHERE id = ?", (cnpj_id,))
-        conn.commit()
+    escrever(lambda conn: conn.execute("DELETE FROM cnpjs WHERE id = ?", (cnpj_id,)))
     st.cache_data.clear()
     return True
 
-@st.cache_data(ttl=300)
-def load_processos(cliente_id: int) -> List[tuple]:
-    with get_db_connection() as conn:
-        return conn.execute(
-            "SELECT id, nome, tipo, frequencia FROM processos WHERE cliente_id = ?",
-            (cliente_id,)
-        ).fetchall()
+def load_processos(cliente_id: int) -> Tuple[modelos.Processo, ...]:
+    return load_dados_cliente(cliente_id).processos
 
 # Função para carregar todos os layouts disponíveis de todos os processos (para compartilhamento)
-@st.cache_data(ttl=300)
 def load_all_layouts() -> List[str]:
+    return unidade_trabalho.obter("layouts", _load_all_layouts)
+
+@st.cache_data(ttl=300)
+def _load_all_layouts() -> List[str]:
     layouts_set = set()
-    with get_db_connection() as conn:
-        rows = conn.execute("SELECT layouts FROM processo_config").fetchall()
-        for row in rows:
-            if row[0]:
-                try:
-                    layout_list = json.loads(row[0])
-                    for layout in layout_list:
-                        if layout.get("tipo") == "Arquivo":
-                            if layout.get("modo") == "novo":
-                                label = f"{layout.get('arquivo_tipo', 'Desconhecido')} - {layout.get('nome', 'SemNome')}"
-                            else:
-                                label = layout.get("arquivo", "Layout Existente")
-                            layouts_set.add(label)
-                except Exception as e:
-                    print("DEBUG: Erro ao carregar layouts: ", e)
+    # Catálogo compartilhado entre clientes: percorre todas as partições
+    for row in particoes.fan_out(caminhos_banco(), "SELECT layouts FROM processo_config", conectar=conectar_leitura):
+        if row[0]:
+            try:
+                layout_list = json.loads(row[0])
+                for layout in layout_list:
+                    if layout.get("tipo") == "Arquivo":
+                        if layout.get("modo") == "novo":
+                            label = f"{layout.get('arquivo_tipo', 'Desconhecido')} - {layout.get('nome', 'SemNome')}"
+                        else:
+                            label = layout.get("arquivo", "Layout Existente")
+                        layouts_set.add(label)
+            except Exception as e:
+                print("DEBUG: Erro ao carregar layouts: ", e)
     return sorted(list(layouts_set))
 
+def load_uso_layouts() -> Counter:
+    """
+    Quantos processos (de todos os clientes) usam cada layout, pela chave de layout_chave.
+    Calculado em uma única passada em vez de varrer os configs a cada layout exibido.
+    """
+    return unidade_trabalho.obter("uso_layouts", _load_uso_layouts)
+
+@st.cache_data(ttl=300)
+def _load_uso_layouts() -> Counter:
+    uso = Counter()
+    for (layouts_str,) in particoes.fan_out(caminhos_banco(), "SELECT layouts FROM processo_config", conectar=conectar_leitura):
+        if not layouts_str:
+            continue
+        try:
+            uso.update({layout_chave(item) for item in json.loads(layouts_str)})
+        except Exception as e:
+            print("DEBUG: Erro ao contar uso de layouts:", e)
+    return uso
+
+def layout_chave(layout: dict) -> str:
+    # O perfil da amostra documenta o layout, mas não o torna um layout diferente
+    return json.dumps({k: v for k, v in layout.items() if k != "perfil"}, sort_keys=True)
+
+def impacto_layout_global(rotulo: str) -> List[dict]:
+    """Processos de todos os clientes afetados por uma mudança no layout (fan-out nas partições)."""
+    linhas = []
+    def consultar(conn):
+        afetados = encadeamento.impacto_layout(conn, rotulo)
+        if not afetados:
+            return afetados, {}
+        return afetados, {
+            pid: (cliente, nome)
+            for pid, nome, cliente in conn.execute(f"""
+                SELECT p.id, p.nome, c.nome_empresa FROM processos p
+                LEFT JOIN cliente c ON c.id = p.cliente_id
+                WHERE p.id IN ({','.join('?' * len(afetados))})
+            """, list(afetados)).fetchall()
+        }
+
+    for caminho in caminhos_banco():
+        afetados, nomes = unidade_trabalho.ler(caminho, ("impacto_layout", rotulo), consultar)
+        for pid, nivel in sorted(afetados.items(), key=lambda item: item[1]):
+            cliente, nome = nomes.get(pid, ("?", pid))
+            linhas.append({
+                "CLIENTE": cliente,
+                "PROCESSO": nome,
+                "RELAÇÃO": "Usa o layout" if nivel == 0 else f"Encadeado (nível {nivel})"
+            })
+    return linhas
+
+def sugerir_processos(nome: str, limite: int = 5) -> List[similaridade.Semelhante]:
+    """Processos já cadastrados (de todos os clientes) com nome parecido, pelo índice de semelhança."""
+    encontrados = []
+    for caminho in caminhos_banco():
+        encontrados += unidade_trabalho.ler(
+            caminho, ("sugestoes", nome), lambda conn: similaridade.sugerir(conn, caminho, nome, limite=limite)
+        )
+    return sorted(encontrados, key=lambda s: -s.semelhanca)[:limite]
+
+def sugerir_itens(tipo: str, itens: List[str], limite: int = 5) -> List[recomendacao.Sugestao]:
+    """Layouts e retornos mais usados por processos do tipo (de todos os clientes), pelo índice de recomendação."""
+    contagens = recomendacao.Contagens()
+    for caminho in caminhos_banco():
+        contagens.somar(unidade_trabalho.ler(
+            caminho, ("recomendacao", tipo, tuple(itens)), lambda conn: recomendacao.contagens(conn, tipo, itens)
+        ))
+    return recomendacao.recomendar(contagens, itens, limite)
+
+def load_arestas(cliente_id: int) -> List[tuple]:
+    """Arestas (origem_id, destino_id) de encadeamento entre os processos do cliente, no retrato da execução."""
+    return unidade_trabalho.ler(caminho_banco(cliente_id), ("arestas", cliente_id), lambda conn: conn.execute("""
+        SELECT e.origem_id, e.destino_id FROM processo_encadeamento e
+        JOIN processos p ON p.id = e.destino_id
+        WHERE p.cliente_id = ?
+    """, (cliente_id,)).fetchall())
+
+def load_linhagem(cliente_id: int) -> tuple:
+    """Dados do diagrama consolidado do cliente: processos, configs ({processo_id: ConfigProcesso}) e arestas."""
+    dados = load_dados_cliente(cliente_id)
+    return dados.processos, dados.configs, load_arestas(cliente_id)
+
 def save_cliente(nome_empresa, logo, nome_pessoa, cargo, email, celular):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        if st.session_state.cliente_id:
-            c.execute("""
+    cliente_id = st.session_state.cliente_id
+    novo_id = None
+    roteador = get_roteador()
+    if not cliente_id and roteador is not None:
+        # Com partições, o catálogo gera o id e cria o arquivo do novo cliente
+        novo_id, _ = roteador.novo_cliente()
+
+    def gravar(conn):
+        if cliente_id:
+            conn.execute("""
                 UPDATE cliente
                 SET nome_empresa=?, logo=?, nome_pessoa=?, cargo=?, email=?, celular=?
                 WHERE id=?
-            """, (nome_empresa, logo, nome_pessoa, cargo, email, celular, st.session_state.cliente_id))
-        else:
-            c.execute("""
-                INSERT INTO cliente (nome_empresa, logo, nome_pessoa, cargo, email, celular)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (nome_empresa, logo, nome_pessoa, cargo, email, celular))
-            st.session_state.cliente_id = c.lastrowid
-        conn.commit()
+            """, (nome_empresa, logo, nome_pessoa, cargo, email, celular, cliente_id))
+            return cliente_id
+        return conn.execute("""
+            INSERT INTO cliente (id, nome_empresa, logo, nome_pessoa, cargo, email, celular)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (novo_id, nome_empresa, logo, nome_pessoa, cargo, email, celular)).lastrowid
+
+    st.session_state.cliente_id = unidade_trabalho.escrever(caminho_banco(cliente_id or novo_id), gravar)
     st.cache_data.clear()
-    st.session_state.tela = "visao_cliente"
-    st.rerun()
+    redirecionar("visao_cliente")
+
+def gravar_config(conn, processo_id: int, layouts_config: list, retorno_config: Optional[dict] = None,
+                  cnpjs: Optional[list] = None, versao_esperada: Optional[int] = None) -> int:
+    """
+    Mutação (roda dentro do escritor) que grava o config do processo, atualizando o índice
+    de encadeamentos e o histórico na mesma transação. retorno_config/cnpjs None mantêm o valor atual.
+    Levanta escritor.ConflitoVersao se versao_esperada não for a versão gravada e
+    encadeamento.CicloEncadeamento se um encadeamento fechar um ciclo.
+    Retorna a nova versão do config.
+    """
+    atual = conn.execute(
+        "SELECT id, versao FROM processo_config WHERE processo_id = ? ORDER BY id LIMIT 1", (processo_id,)
+    ).fetchone()
+    versao_atual = atual[1] if atual else 0
+    if versao_esperada is not None and versao_esperada != versao_atual:
+        raise escritor.ConflitoVersao(processo_id, versao_esperada, versao_atual)
+    encadeamento.salvar_encadeamentos(conn, processo_id, layouts_config)
+    anterior = historico.estado_atual(conn, processo_id)
+    if retorno_config is None:
+        retorno_config = anterior["retorno"] if anterior else {}
+    if cnpjs is None:
+        cnpjs = anterior["cnpjs"] if anterior else []
+    if atual:
+        conn.execute("""
+            UPDATE processo_config
+            SET cnpjs = ?, layouts = ?, encadeamento = ?, retorno = ?, versao = versao + 1
+            WHERE id = ?
+        """, (json.dumps(cnpjs), json.dumps(layouts_config), "", json.dumps(retorno_config), atual[0]))
+    else:
+        conn.execute("""
+            INSERT INTO processo_config (processo_id, cnpjs, layouts, encadeamento, retorno, versao)
+            VALUES (?, ?, ?, ?, ?, 1)
+        """, (processo_id, json.dumps(cnpjs), json.dumps(layouts_config), "", json.dumps(retorno_config)))
+    historico.registrar(conn, processo_id, anterior, historico.estado(layouts_config, retorno_config, cnpjs))
+    return versao_atual + 1
+
+def salvar_config_processo(processo_id: int, layouts_config: list, retorno_config: dict,
+                           versao_esperada: Optional[int] = None) -> int:
+    """
+    Grava layouts e retorno do processo pelo escritor único e marca o processo como configurado.
+    Levanta escritor.ConflitoVersao ou encadeamento.CicloEncadeamento sem gravar nada.
+    Retorna a nova versão do config.
+    """
+    def gravar(conn):
+        versao = gravar_config(conn, processo_id, layouts_config, retorno_config, versao_esperada=versao_esperada)
+        conn.execute("UPDATE processos SET configurado = 1 WHERE id = ?", (processo_id,))
+        return versao
+
+    versao = escrever(gravar)
+    st.cache_data.clear()
+    return versao
+
+def load_layouts_processo(conn, processo_id: int) -> list:
+    row = conn.execute(
+        "SELECT layouts FROM processo_config WHERE processo_id = ? ORDER BY id LIMIT 1", (processo_id,)
+    ).fetchone()
+    if not row or not row[0]:
+        return []
+    try:
+        return json.loads(row[0])
+    except Exception as e:
+        print("DEBUG: Erro ao carregar layouts para edição:", e)
+        return []
+
+def descreve_ciclo(ciclo: List[int]) -> str:
+    """Texto legível de um ciclo de encadeamento, com os nomes dos processos."""
+    nomes = dict(unidade_trabalho.ler(caminho_banco(), None, lambda conn: conn.execute(
+        f"SELECT id, nome FROM processos WHERE id IN ({','.join('?' * len(ciclo))})", ciclo
+    ).fetchall()))
+    return "o encadeamento criaria um ciclo " + " → ".join(nomes.get(pid, str(pid)) for pid in ciclo)
 
 # ------------------------------------------------------------------
 # Inicialização do Banco de Dados e Session State
 # ------------------------------------------------------------------
-init_db()
-st.session_state.setdefault("cliente_id", None)
-st.session_state.setdefault("tela", "login")
-st.session_state.setdefault("selected_cnpjs", [])
-st.session_state.setdefault("grupar", False)
+@st.cache_resource
+def inicializar() -> dict:
+    """
+    Preparação única por processo do servidor (as reexecuções do script reaproveitam
+    o resultado): schema e migrações, escritores de cada banco, recursos estáticos e,
+    opcionalmente, os dados dos clientes mais alterados. Retorna os recursos e o tempo
+    de cada etapa.
+    """
+    etapas = []
+    inicio = time.perf_counter()
+
+    def etapa(nome: str, funcao, *args):
+        t0 = time.perf_counter()
+        resultado = funcao(*args)
+        etapas.append((nome, time.perf_counter() - t0))
+        return resultado
+
+    etapa("schema e migrações", init_db)
+    if USAR_ESPELHO:
+        etapa("espelhos em memória", lambda: [get_espelho(caminho) for caminho in caminhos_banco()])
+    caminhos = etapa("escritores", lambda: [get_escritor(caminho).caminho for caminho in caminhos_banco()])
+    etapa("tarefas em segundo plano", get_gerenciador_tarefas)
+    logo = etapa("recursos estáticos", lambda: open(LOGO_PATH, "rb").read() if os.path.exists(LOGO_PATH) else None)
+
+    def precarregar():
+        quentes = sorted(
+            particoes.fan_out(caminhos, """
+                SELECT c.id, COALESCE(v.versao, 0) FROM cliente c
+                LEFT JOIN cliente_versao v ON v.cliente_id = c.id
+            """, conectar=conectar_leitura),
+            key=lambda row: row[1], reverse=True
+        )[:PRECARREGAR_CLIENTES]
+        for cliente_id, _ in quentes:
+            load_dados_cliente(cliente_id)
+        return len(quentes)
+    precarregados = etapa("clientes pré-carregados", precarregar) if PRECARREGAR_CLIENTES > 0 else 0
+
+    def agendar_backup():
+        # Roda na fila das tarefas pesadas; a chave por horário evita dois backups simultâneos do mesmo ciclo
+        def disparar():
+            bancos = caminhos_banco() + ([caminho_templates()] if get_roteador() else [])
+            get_gerenciador_tarefas().submeter(
+                ("backup", datetime.now().strftime("%Y%m%d%H%M")), backup.fazer_backup, bancos, BACKUP_DIR, BACKUP_MANTER,
+                pesada=True
+            )
+        agendador = backup.Agendador(BACKUP_HORAS * 3600, disparar)
+        agendador.start()
+        return agendador
+    agendador = etapa("agendador de backup", agendar_backup) if BACKUP_HORAS > 0 else None
+
+    total = time.perf_counter() - inicio
+    print(
+        f"DEBUG: Inicialização concluída em {total * 1000:.0f} ms ("
+        + ", ".join(f"{nome}: {segundos * 1000:.0f} ms" for nome, segundos in etapas)
+        + f"; {len(caminhos)} banco(s), {precarregados} cliente(s) pré-carregado(s))"
+    )
+    return {
+        "logo": logo, "etapas": etapas, "total": total, "bancos": len(caminhos),
+        "precarregados": precarregados, "agendador_backup": agendador,
+    }
+
+# Unidade de trabalho desta execução: um retrato de leitura por arquivo, o mapa de
+# identidade e as escritas adiadas. O script é reexecutado em um módulo novo a cada
+# vez, então cada execução tem a sua; é concluída depois que a tela é desenhada.
+unidade_trabalho = unidade.UnidadeDeTrabalho(
+    conectar_leitura, get_escritor, (similaridade.sincronizar, recomendacao.sincronizar), registrar=REGISTRAR_EXECUCOES
+)
+
+bootstrap = inicializar()
+if "tela" not in st.session_state:
+    # Primeira execução desta sessão
+    st.session_state.setdefault("cliente_id", None)
+    st.session_state.setdefault("tela", "login")
+    st.session_state.setdefault("selected_cnpjs", [])
+    st.session_state.setdefault("grupar", False)
+
+# ------------------------------------------------------------------
+# Navegação
+# ------------------------------------------------------------------
+# A troca de tela acontece em callbacks (on_click), que o Streamlit executa
+# antes do script: a execução do clique já desenha apenas a tela de destino,
+# sem refazer as consultas da tela anterior para depois descartá-las com um
+# st.rerun(). A URL acompanha a tela, o cliente e o processo
+# (?tela=configurar_processo&cliente=3&processo=12), então qualquer tela
+# pode ser aberta por um link.
+
+# Telas que dependem de st.session_state.processo_id
+TELAS_DE_PROCESSO = {
+    "configurar_processo", "agrupamento", "layouts", "adicionar_layout",
+    "diagrama", "editar_processo", "impacto", "historico",
+}
+
+def navegar(tela: str, **estado):
+    """Callback de navegação: grava o estado informado (ex.: processo_id) e a tela de destino."""
+    st.session_state.update(estado)
+    st.session_state.tela = tela
+
+def redirecionar(tela: str, **estado):
+    """Troca de tela no meio da execução (estado inválido ou após uma gravação); reexecuta o script."""
+    navegar(tela, **estado)
+    st.rerun()
+
+def abrir_link() -> None:
+    """Na primeira execução da sessão, restaura tela, cliente e processo a partir da URL."""
+    parametros = st.query_params
+    tela = parametros.get("tela")
+    if tela not in telas or tela == "login":
+        return
+    try:
+        cliente_id = int(parametros["cliente"]) if "cliente" in parametros else None
+        processo_id = int(parametros["processo"]) if "processo" in parametros else None
+    except ValueError:
+        return
+    if cliente_id is None:
+        if tela == "inicial":
+            st.session_state.tela = tela
+        return
+    if load_cliente(cliente_id) is None:
+        return
+    st.session_state.cliente_id = cliente_id
+    if processo_id is not None and load_dados_cliente(cliente_id).processo(processo_id) is not None:
+        st.session_state.processo_id = processo_id
+    elif tela in TELAS_DE_PROCESSO:
+        tela = "processos"
+    st.session_state.tela = tela
+
+def atualizar_link(tela: str) -> None:
+    """Mantém a URL igual à tela exibida, para que ela possa ser copiada e reaberta."""
+    parametros = {"tela": tela}
+    if tela != "login" and st.session_state.get("cliente_id"):
+        parametros["cliente"] = str(st.session_state.cliente_id)
+        if tela in TELAS_DE_PROCESSO and st.session_state.get("processo_id"):
+            parametros["processo"] = str(st.session_state.processo_id)
+    if st.query_params.to_dict() != parametros:
+        st.query_params.from_dict(parametros)
 
 # ------------------------------------------------------------------
 # Função para remover acentuação e caracteres especiais
@@ -177,6 +657,8 @@ def tela_login():
     """
     Tela de login simples com estilo básico e seguro.
     """
+    # A sessão saiu do cliente: a pré-carga dele deixa de ser útil
+    cancelar_precarga()
     st.markdown("""
         <style>
             .stApp {
@@ -214,37 +696,35 @@ def tela_login():
         with st.form("login_form"):
             col_logo1, col_logo2, col_logo3 = st.columns([1,2,1])
             with col_logo2:
-                st.image("logo_dattos.png", width=250)
+                st.image(bootstrap["logo"] or LOGO_PATH, width=250)
 
             st.markdown('<div class="login-title">Gerador de Detalhamento de Escopo Dattos</div>', unsafe_allow_html=True)
             st.markdown('<div class="login-subtitle">Bem-vindo ao sistema que gera o detalhamento de escopo para seus processos financeiros.<br>Insira seu código de cliente para prosseguir.</div>', unsafe_allow_html=True)
 
-            codigo = st.text_input("Digite o código do cliente:", placeholder="Ex: 123")
+            st.text_input("Digite o código do cliente:", placeholder="Ex: 123", key="codigo_login")
 
             col1, col2, col3 = st.columns(3)
             with col1:
-                entrar = st.form_submit_button("Entrar")
+                st.form_submit_button("Entrar", on_click=entrar)
             with col3:
-                cadastrar = st.form_submit_button("Cadastrar Novo Cliente", use_container_width=True)
-
-            if entrar:
-                try:
-                    codigo_int = int(codigo)
-                except ValueError:
-                    st.error("Por favor, digite um código numérico válido.")
-                    return
-                cliente = load_cliente(codigo_int)
-                if cliente:
-                    st.session_state.cliente_id = codigo_int
-                    st.success("Cliente encontrado! Carregando informações...")
-                    st.session_state.tela = "visao_cliente"
-                    st.rerun()
-                else:
-                    st.error("Código não encontrado. Verifique ou cadastre um novo cliente.")
-
-            if cadastrar:
-                st.session_state.tela = "inicial"
-                st.rerun()
+                st.form_submit_button("Cadastrar Novo Cliente", on_click=navegar, args=("inicial",), use_container_width=True)
+
+            erro = st.session_state.pop("erro_login", None)
+            if erro:
+                st.error(erro)
+
+def entrar():
+    """Callback do login: valida o código e abre a visão do cliente."""
+    try:
+        cliente_id = int(st.session_state.get("codigo_login", ""))
+    except ValueError:
+        st.session_state.erro_login = "Por favor, digite um código numérico válido."
+        return
+    if load_cliente(cliente_id) is None:
+        st.session_state.erro_login = "Código não encontrado. Verifique ou cadastre um novo cliente."
+        return
+    iniciar_precarga(cliente_id)
+    navegar("visao_cliente", cliente_id=cliente_id)
 
 def tela_inicial():
     """Tela para cadastro de novo cliente."""
@@ -254,13 +734,13 @@ def tela_inicial():
     with st.form("cliente_form", clear_on_submit=False):
         col1, col2 = st.columns(2)
         with col1:
-            nome_empresa = st.text_input("Nome da Empresa", value=cliente[1] if cliente else "Minha Empresa")
-            nome_pessoa  = st.text_input("Nome Completo", value=cliente[3] if cliente else "")
-            cargo        = st.text_input("Cargo", value=cliente[4] if cliente else "")
+            nome_empresa = st.text_input("Nome da Empresa", value=cliente.nome_empresa if cliente else "Minha Empresa")
+            nome_pessoa  = st.text_input("Nome Completo", value=cliente.nome_pessoa if cliente else "")
+            cargo        = st.text_input("Cargo", value=cliente.cargo if cliente else "")
         with col2:
             logo_file = st.file_uploader("Logo do Cliente", type=["png", "jpg", "jpeg"])
-            email     = st.text_input("E-mail", value=cliente[5] if cliente else "")
-            celular   = st.text_input("Celular", value=cliente[6] if cliente else "")
+            email     = st.text_input("E-mail", value=cliente.email if cliente else "")
+            celular   = st.text_input("Celular", value=cliente.celular if cliente else "")
         if st.form_submit_button("Salvar Cliente"):
             logo_bytes = logo_file.read() if logo_file is not None else None
             save_cliente(nome_empresa, logo_bytes, nome_pessoa, cargo, email, celular)
@@ -273,21 +753,20 @@ def tela_visao_cliente():
     cliente = load_cliente(st.session_state.cliente_id)
     if not cliente:
         st.error("Cliente não encontrado!")
-        st.session_state.tela = "login"
-        st.rerun()
+        redirecionar("login")
         return
-    st.title(f"📁 {cliente[1]} - Detalhes do Cliente")
+    st.title(f"📁 {cliente.nome_empresa} - Detalhes do Cliente")
     st.write(f"**Código do Cliente:** {st.session_state.cliente_id}")
     col1, col2 = st.columns([3, 1])
     with col1:
         st.subheader("Informações Principais")
-        st.write(f"👤 **Nome:** {cliente[3]}")
-        st.write(f"🎓 **Cargo:** {cliente[4]}")
-        st.write(f"📧 **E-mail:** {cliente[5]}")
-        st.write(f"📱 **Celular:** {cliente[6]}")
+        st.write(f"👤 **Nome:** {cliente.nome_pessoa}")
+        st.write(f"🎓 **Cargo:** {cliente.cargo}")
+        st.write(f"📧 **E-mail:** {cliente.email}")
+        st.write(f"📱 **Celular:** {cliente.celular}")
     with col2:
-        if cliente[2]:
-            st.image(cliente[2], width=150)
+        if cliente.logo:
+            st.image(cliente.logo, width=150)
     
     st.subheader("Grupamentos de Negócio / CNPJ's")
     cnpjs = load_cnpjs(st.session_state.cliente_id)
@@ -295,12 +774,9 @@ def tela_visao_cliente():
         for cnpj in cnpjs:
             col1, col2 = st.columns([0.8, 0.2])
             with col1:
-                st.write(f"✅ {cnpj[1]}")
+                st.write(f"✅ {cnpj.numero}")
             with col2:
-                if st.button("Excluir", key=f"excluir_{cnpj[0]}"):
-                    remove_cnpj(cnpj[0])
-                    st.success("CNPJ excluído com sucesso!")
-                    st.rerun()
+                st.button("Excluir", key=f"excluir_{cnpj.id}", on_click=remove_cnpj, args=(cnpj.id,))
     
     novo_cnpj = st.text_input("Adicionar Novo CNPJ", key="novo_cnpj")
     if st.button("Adicionar CNPJ") and novo_cnpj:
@@ -308,9 +784,27 @@ def tela_visao_cliente():
             st.rerun()
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.button("✏️ Editar Cliente", on_click=lambda: st.session_state.update(tela="inicial"), use_container_width=True)
+        st.button("✏️ Editar Cliente", on_click=navegar, args=("inicial",), use_container_width=True)
+    with col2:
+        st.button("🗑️ Excluir Cliente", on_click=lambda: st.session_state.update(confirmar_exclusao_cliente=True), use_container_width=True)
     with col3:
-        st.button("⏭️ Continuar para Processos", on_click=lambda: st.session_state.update(tela="processos"), use_container_width=True)
+        st.button("⏭️ Continuar para Processos", on_click=navegar, args=("processos",), use_container_width=True)
+
+    if st.session_state.get("confirmar_exclusao_cliente"):
+        dados = load_dados_cliente(st.session_state.cliente_id)
+        st.warning(
+            f"Excluir **{cliente.nome_empresa}** apaga {len(dados.processos)} processo(s), "
+            f"{len(dados.cnpjs)} CNPJ(s) e todo o histórico de configurações. Esta ação não pode ser desfeita."
+        )
+        arquivar = st.checkbox("Arquivar uma cópia dos dados antes de excluir", value=True, key="arquivar_cliente")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Confirmar Exclusão", type="primary", use_container_width=True):
+                quantidades = excluir_cliente(st.session_state.cliente_id, arquivar)
+                print(f"DEBUG: Cliente {st.session_state.cliente_id} excluído: {quantidades}")
+                redirecionar("login", confirmar_exclusao_cliente=False, cliente_id=None)
+        with col2:
+            st.button("Cancelar", on_click=lambda: st.session_state.update(confirmar_exclusao_cliente=False), use_container_width=True)
 
 def tela_processos():
     """
@@ -320,15 +814,15 @@ def tela_processos():
     cliente = load_cliente(st.session_state.cliente_id)
     if not cliente:
         st.error("Cliente não encontrado!")
-        st.session_state.tela = "login"
-        st.rerun()
+        redirecionar("login")
         return
 
-    st.title(f"Configuração de Processos - {cliente[1]}")
+    st.title(f"Configuração de Processos - {cliente.nome_empresa}")
     st.write("Gerencie e adicione processos financeiros para este cliente.")
     st.write("---")
 
-    processos = load_processos(st.session_state.cliente_id)
+    dados = load_dados_cliente(st.session_state.cliente_id)
+    processos = dados.processos
     
     if processos:
         st.subheader("Processos Mapeados")
@@ -345,22 +839,10 @@ def tela_processos():
         </style>
         """, unsafe_allow_html=True)
 
-        conn = get_db_connection()
         for proc in processos:
-            proc_id, proc_nome, proc_tipo, proc_freq = proc[0], proc[1], proc[2], proc[3]
-            row_desc = conn.execute("SELECT descricao FROM processos WHERE id = ?", (proc_id,)).fetchone()
-            descricao = row_desc[0] if (row_desc and row_desc[0]) else ""
-            layout_count = 0
-            row_layouts = conn.execute(
-                "SELECT layouts FROM processo_config WHERE processo_id = ?",
-                (proc_id,)
-            ).fetchone()
-            if row_layouts and row_layouts[0]:
-                try:
-                    layouts_list = json.loads(row_layouts[0])
-                    layout_count = len(layouts_list)
-                except:
-                    pass
+            proc_id, proc_nome, proc_tipo, proc_freq = proc.id, proc.nome, proc.tipo, proc.frequencia
+            descricao = proc.descricao
+            layout_count = len(dados.config(proc_id).layouts)
             with st.container(border=True):
                 col_left, col_right = st.columns([0.85, 0.15])
                 with col_left:
@@ -374,17 +856,22 @@ def tela_processos():
                     if descricao:
                         st.markdown(f"<div style='font-size:0.85rem;color:#888;'>{descricao}</div>", unsafe_allow_html=True)
                 with col_right:
-                    if st.button("Editar", key=f"config_{proc_id}"):
-                        st.session_state.processo_id = proc_id
-                        st.session_state.tela = "configurar_processo"
-                        st.rerun()
-        conn.close()
+                    st.button(
+                        "Editar", key=f"config_{proc_id}",
+                        on_click=navegar, args=("configurar_processo",), kwargs={"processo_id": proc_id}
+                    )
     else:
         st.info("Nenhum processo cadastrado para este cliente.")
 
     st.write("---")
     st.subheader("Criar Novo Processo")
     nome_processo = st.text_input("Nome do Processo", placeholder="Ex: Conciliação de Saldos Bancários x Razão")
+    parecidos = sugerir_processos(nome_processo) if len(nome_processo.strip()) >= 3 else []
+    if parecidos:
+        st.info(
+            "Processos parecidos já cadastrados — verifique se não é o mesmo antes de criar:\n\n"
+            + "\n".join(f"- **{s.nome}** ({s.tipo}) — {s.cliente} · {s.semelhanca:.0%}" for s in parecidos)
+        )
     
     tipo_options = ["Conciliação", "Análise Tabular", "Composição de Saldos", "Pagamentos"]
     tipo_processo = st.selectbox("Tipo de Processo", options=tipo_options, index=0)
@@ -395,7 +882,7 @@ def tela_processos():
     agrupar = st.checkbox("Agrupar CNPJs para layouts diferentes?")
     if agrupar:
         cnpjs = load_cnpjs(st.session_state.cliente_id)
-        cnpj_options = [cnpj[1] for cnpj in cnpjs] if cnpjs else []
+        cnpj_options = [cnpj.numero for cnpj in cnpjs] if cnpjs else []
         selected_cnpjs = st.multiselect("Selecione os CNPJs para agrupamento", options=cnpj_options)
         st.session_state.selected_cnpjs = selected_cnpjs
         st.session_state.grupar = True
@@ -403,30 +890,23 @@ def tela_processos():
         st.session_state.grupar = False
 
     if st.button("Salvar Processo") and nome_processo:
-        with get_db_connection() as conn:
-            conn.execute("""
-                INSERT INTO processos (nome, tipo, frequencia, cliente_id)
-                VALUES (?, ?, ?, ?)
-            """, (nome_processo, tipo_processo, frequencia, st.session_state.cliente_id))
-            conn.commit()
-            proc_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-        st.session_state.processo_id = proc_id
+        cliente_id = st.session_state.cliente_id
+        proc_id = escrever(lambda conn: conn.execute("""
+            INSERT INTO processos (nome, tipo, frequencia, cliente_id)
+            VALUES (?, ?, ?, ?)
+        """, (nome_processo, tipo_processo, frequencia, cliente_id)).lastrowid)
         st.cache_data.clear()
-        if st.session_state.get("grupar", False):
-            st.session_state.tela = "agrupamento"
-        else:
-            st.session_state.tela = "configurar_processo"
-        st.rerun()
+        redirecionar("agrupamento" if st.session_state.get("grupar", False) else "configurar_processo", processo_id=proc_id)
     st.write("---")
     col1, col2, col3 = st.columns(3)
     with col1:
-        if st.button("Voltar à Visão do Cliente", use_container_width=True):
-            st.session_state.tela = "visao_cliente"
-            st.rerun()
+        st.button("Voltar à Visão do Cliente", use_container_width=True, on_click=navegar, args=("visao_cliente",))
+    with col2:
+        st.button("Diagrama do Cliente", use_container_width=True, on_click=navegar, args=("linhagem",))
+        st.button("Templates de Processos", use_container_width=True, on_click=navegar, args=("templates",))
+        st.button("Processos Duplicados", use_container_width=True, on_click=navegar, args=("duplicados",))
     with col3:
-        if st.button("Gerar Relatório", use_container_width=True):
-            st.session_state.tela = "relatorio"
-            st.rerun()
+        st.button("Gerar Relatório", use_container_width=True, on_click=navegar, args=("relatorio",))
 
 def tela_configurar_processo():
     """
@@ -436,142 +916,64 @@ def tela_configurar_processo():
     processo_id = st.session_state.get("processo_id")
     if not processo_id:
         st.error("Processo não selecionado.")
-        st.session_state.tela = "processos"
-        st.rerun()
-
-    with get_db_connection() as conn:
-        processo = conn.execute(
-            "SELECT id, nome, tipo, frequencia FROM processos WHERE id = ?", (processo_id,)
-        ).fetchone()
-        proc_conf = conn.execute(
-            "SELECT * FROM processo_config WHERE processo_id = ?", (processo_id,)
-        ).fetchone()
-
-    if proc_conf:
-        try:
-            default_layouts = json.loads(proc_conf[3]) if proc_conf[3] else []
-        except Exception as e:
-            print("DEBUG: Erro ao carregar layouts salvos:", e)
-            default_layouts = []
-        try:
-            default_retorno = json.loads(proc_conf[5]) if proc_conf[5] else {}
-        except Exception as e:
-            print("DEBUG: Erro ao carregar retorno salvos:", e)
-            default_retorno = {}
-    else:
-        default_layouts = []
-        default_retorno = {}
+        redirecionar("processos")
 
-    st.title(f"Configuração do Processo: {processo[1]}")
+    dados = load_dados_cliente(st.session_state.cliente_id)
+    processo = dados.processo(processo_id)
+    if not processo:
+        st.error("Processo não encontrado.")
+        redirecionar("processos")
+    config = dados.config(processo_id)
+
+    # Versão do config a partir da qual o usuário está editando; conferida ao salvar
+    chave_versao = f"versao_config_{processo_id}"
+    if st.session_state.get("nova_tela", True) or chave_versao not in st.session_state:
+        st.session_state[chave_versao] = config.versao
+        st.session_state.pop(f"grade_base_{processo_id}", None)
+
+    default_layouts = config.layouts_dicts()
+    default_retorno = config.retorno_dict()
+
+    st.title(f"Configuração do Processo: {processo.nome}")
+    if config.erros:
+        st.warning(
+            "Parte da configuração salva estava inválida e foi ignorada: " + "; ".join(config.erros)
+        )
     # Botão para editar informações básicas do processo
-    if st.button("Editar Informações do Processo", use_container_width=True):
-         st.session_state.tela = "editar_processo"
-         st.rerun()
+    st.button("Editar Informações do Processo", use_container_width=True, on_click=navegar, args=("editar_processo",))
     st.markdown("---")
     st.header("Definição dos Layouts de Entrada")
     st.markdown("Todas as fontes (arquivos) utilizadas no processo devem ser mencionadas.")
     
-    num_layouts = st.number_input(
-        "Número de Layouts de Entrada",
-        min_value=1,
-        step=1,
-        value=len(default_layouts) if default_layouts else 1,
-        key="num_layouts"
+    # Com muitos layouts, a grade evita um bloco de widgets por layout
+    em_grade = st.toggle(
+        "Editar layouts em grade (uma linha por layout; aceita colar do Excel)",
+        value=len(default_layouts) >= grade_layouts.LIMITE_FORMULARIO,
+        key="layouts_em_grade"
     )
-    layouts_config = []
-
-    for i in range(1, num_layouts + 1):
-        st.markdown(f"**Layout de Entrada #{i}**")
-        if default_layouts and i <= len(default_layouts):
-            layout_salvo = default_layouts[i-1]
-            default_tipo = layout_salvo.get("tipo", "Arquivo")
-        else:
-            layout_salvo = {}
-            default_tipo = "Arquivo"
-
-        layout_tipo = st.radio(
-            f"Selecione o tipo de entrada para o layout #{i}",
-            options=["Arquivo", "Encadeamento"],
-            index=0 if default_tipo == "Arquivo" else 1,
-            key=f"layout_tipo_{i}"
-        )
-
-        if layout_tipo == "Arquivo":
-            # Alterado o rótulo para "Modelo para o layout"
-            modo_default = layout_salvo.get("modo", "novo")
-            modo = st.radio(
-                f"Modelo para o layout #{i}",
-                options=["novo", "existente"],
-                index=0 if modo_default == "novo" else 1,
-                key=f"modo_layout_{i}"
-            )
-            if modo == "novo":
-                tipo_arquivo_options = ["Excel", "CSV", "TXT", "OFX", "CNAB", "SPED", "EDI", "XML", "SWIFT", "Extrato Adquirente", "API", "Banco de Dados", "PDF", "Outros"]
-                tipo_arquivo_default = layout_salvo.get("arquivo_tipo", "Excel")
-                tipo_arquivo = st.selectbox(
-                    f"Tipo de Arquivo para o layout #{i}",
-                    options=tipo_arquivo_options,
-                    index=tipo_arquivo_options.index(tipo_arquivo_default) if tipo_arquivo_default in tipo_arquivo_options else 0,
-                    key=f"tipo_layout_{i}"
-                )
-                detalhe = ""
-                if tipo_arquivo == "Outros":
-                    detalhe = st.text_input(f"Detalhe o tipo de arquivo para o layout #{i}", key=f"detalhe_layout_{i}")
-                nome_layout = st.text_input(
-                    f"Nome do Layout #{i}",
-                    value=layout_salvo.get("nome", ""),
-                    key=f"nome_layout_{i}"
-                )
-                layouts_config.append({
-                    "tipo": "Arquivo",
-                    "modo": "novo",
-                    "arquivo_tipo": tipo_arquivo,
-                    "detalhe": detalhe,
-                    "nome": nome_layout
-                })
-            else:
-                available_layouts = load_all_layouts()
-                if not available_layouts:
-                    st.info("Nenhum layout existente encontrado. Por favor, crie um novo layout.")
-                    escolha_layout = ""
-                else:
-                    escolha_layout = st.selectbox(f"Selecione um layout para a entrada #{i}", options=available_layouts, index=0, key=f"layout_escolha_{i}")
-                layouts_config.append({
-                    "tipo": "Arquivo",
-                    "modo": "existente",
-                    "arquivo": escolha_layout
-                })
-
-        else:
-            st.markdown("*Encadeamento: refere-se à vinculação de um processo pré-configurado que alimenta este processo com informações adicionais.*")
-            processos_existentes = load_processos(st.session_state.cliente_id)
-            processos_filtrados = [proc for proc in processos_existentes if proc[0] != processo_id]
-            if processos_filtrados:
-                processo_encadeado = st.selectbox(
-                    f"Selecione o processo de origem para a entrada #{i}",
-                    options=[f"{proc[1]} - {proc[2]}" for proc in processos_filtrados],
-                    key=f"proc_encadeado_{i}"
-                )
-            else:
-                st.info("Nenhum processo disponível para encadeamento.")
-                processo_encadeado = None
-            layouts_config.append({
-                "tipo": "Encadeamento",
-                "processo": processo_encadeado
-            })
+    erros_grade = []
+    if em_grade:
+        # Com sugestões adicionadas, a grade parte dos layouts em edição mais as sugestões
+        base_grade = st.session_state.get(f"grade_base_{processo_id}", default_layouts)
+        layouts_config, erros_grade = editar_layouts_em_grade(processo_id, base_grade)
+    else:
+        layouts_config = editar_layouts_em_formulario(processo_id, default_layouts)
+    layouts_config = perfil.preservar_perfis(layouts_config, default_layouts)
+    secao_sugestoes(processo, layouts_config)
+    secao_amostras(processo_id, default_layouts, chave_versao)
     # Removido o botão "Gerenciar Layouts" para evitar perda de dados não salvos.
 
     st.markdown("---")
     st.subheader("Especificação de Arquivos de Retorno (Opcional)")
-    usar_retorno = st.checkbox("Este processo requer arquivos de retorno?")
+    usar_retorno = st.checkbox("Este processo requer arquivos de retorno?", key="usar_retorno")
     retorno_config = {}
     if usar_retorno:
         tipo_retorno_default = default_retorno.get("tipo", "CSV")
         proposito_default = default_retorno.get("proposito", "")
         tipo_retorno = st.selectbox(
             "Tipo de Arquivo de Retorno",
-            options=["CSV", "XML", "TXT", "JSON"],
-            index=["CSV", "XML", "TXT", "JSON"].index(tipo_retorno_default) if tipo_retorno_default in ["CSV", "XML", "TXT", "JSON"] else 0,
+            options=TIPOS_RETORNO,
+            index=TIPOS_RETORNO.index(tipo_retorno_default) if tipo_retorno_default in TIPOS_RETORNO else 0,
             key="retorno_tipo"
         )
         proposito_retorno = st.text_input(
@@ -588,82 +990,55 @@ def tela_configurar_processo():
     with col1:
         if st.button("Salvar Processo", use_container_width=True):
             print(f"DEBUG: Salvando configuração para processo {processo_id}")
-            with get_db_connection() as conn:
-                existing_conf = conn.execute(
-                    "SELECT id FROM processo_config WHERE processo_id = ?",
-                    (processo_id,)
-                ).fetchone()
-                if existing_conf:
-                    conn.execute("""
-                        UPDATE processo_config
-                        SET layouts = ?, encadeamento = ?, retorno = ?
-                        WHERE processo_id = ?
-                    """, (
-                        json.dumps(layouts_config),
-                        "",
-                        json.dumps(retorno_config),
-                        processo_id
-                    ))
+            if erros_grade:
+                st.error("Configuração não salva: corrija as linhas indicadas na grade de layouts.")
+            else:
+                try:
+                    st.session_state[chave_versao] = salvar_config_processo(
+                        processo_id, layouts_config, retorno_config, st.session_state[chave_versao]
+                    )
+                except encadeamento.CicloEncadeamento as e:
+                    st.error(f"Configuração não salva: {descreve_ciclo(e.ciclo)}")
+                except escritor.ConflitoVersao:
+                    st.error(
+                        "Configuração não salva: este processo foi alterado em outra sessão enquanto você editava. "
+                        "Recarregue para ver a versão atual antes de salvar novamente."
+                    )
+                    st.button("Recarregar Versão Atual", on_click=descartar_edicao_config, args=(processo_id,), use_container_width=True)
                 else:
-                    conn.execute("""
-                        INSERT INTO processo_config (processo_id, layouts, encadeamento, retorno)
-                        VALUES (?, ?, ?, ?)
-                    """, (
-                        processo_id,
-                        json.dumps(layouts_config),
-                        "",
-                        json.dumps(retorno_config)
-                    ))
-                conn.execute("UPDATE processos SET configurado = 1 WHERE id = ?", (processo_id,))
-                conn.commit()
-            st.success("Configuração do processo salva com sucesso!")
-            st.rerun()  
+                    # A grade volta a partir do que foi gravado, sem reaplicar as edições
+                    st.session_state.pop(f"grade_layouts_{processo_id}", None)
+                    st.session_state.pop(f"grade_base_{processo_id}", None)
+                    st.success("Configuração do processo salva com sucesso!")
+                    st.rerun()
         if st.button("Excluir Processo", use_container_width=True):
-            with get_db_connection() as conn:
-                conn.execute("DELETE FROM processo_config WHERE processo_id = ?", (processo_id,))
-                conn.execute("DELETE FROM processos WHERE id = ?", (processo_id,))
-                conn.commit()
+            # Config, histórico e encadeamentos saem junto, pela cascata das FKs
+            escrever(lambda conn: conn.execute("DELETE FROM processos WHERE id = ?", (processo_id,)))
+            recuperar_espaco(caminho_banco())
+            st.cache_data.clear()
             st.success("Processo excluído com sucesso!")
-            st.session_state.tela = "processos"
-            st.rerun()
+            redirecionar("processos")
+    with col2:
+        st.button("Análise de Impacto", use_container_width=True, on_click=navegar, args=("impacto",))
+        st.button("Histórico de Versões", use_container_width=True, on_click=navegar, args=("historico",))
     with col3:
-        if st.button("Voltar para Processos", use_container_width=True):
-            st.session_state.tela = "processos"
-            st.rerun()
+        st.button("Voltar para Processos", use_container_width=True, on_click=navegar, args=("processos",))
     
     st.markdown("---")
     st.write("### Visualização do Diagrama do Processo")
 
-    with get_db_connection() as conn:
-        re_proc_conf = conn.execute(
-            "SELECT layouts, retorno FROM processo_config WHERE processo_id = ?",
-            (processo_id,)
-        ).fetchone()
-
-    if not re_proc_conf:
+    if processo_id not in dados.configs:
         st.info("Ainda não há configurações para gerar um diagrama.")
         return
 
-    layouts_str, retorno_str = re_proc_conf
-    final_layouts = []
-    final_retorno = {}
-
-    if layouts_str:
-        try:
-            final_layouts = json.loads(layouts_str)
-        except Exception as e:
-            print("DEBUG: Erro ao carregar layouts (diagrama):", e)
-    if retorno_str:
-        try:
-            final_retorno = json.loads(retorno_str)
-        except Exception as e:
-            print("DEBUG: Erro ao carregar retorno (diagrama):", e)
+    final_layouts = config.layouts_dicts()
+    final_retorno = config.retorno_dict()
 
     def remove_accents(s: str) -> str:
         nfkd = unicodedata.normalize('NFKD', s)
         return "".join([c for c in nfkd if not unicodedata.combining(c)])
 
-    nome_proc = remove_accents(processo[1])
+    nome_proc = remove_accents(processo.nome)
 
     mermaid_code = [
         "---",
@@ -727,15 +1102,358 @@ def tela_configurar_processo():
 
     components.html(mermaid_html, height=600, scrolling=True)
 
+def secao_sugestoes(processo: modelos.Processo, layouts_config: list):
+    """
+    Layouts e tipos de retorno que outros processos do mesmo tipo já usam, com um botão
+    para acrescentar cada um ao que está em edição (ainda sem gravar).
+    """
+    if not processo.tipo:
+        return
+    retorno_atual = {"tipo": st.session_state.get("retorno_tipo")} if st.session_state.get("usar_retorno") else None
+    itens = recomendacao.itens(layouts_config, retorno_atual)
+    existentes = set(load_all_layouts())
+    sugestoes = [
+        sugestao for sugestao in sugerir_itens(processo.tipo, itens, limite=10)
+        if (sugestao.rotulo in TIPOS_RETORNO if sugestao.retorno else sugestao.rotulo in existentes)
+    ]
+    sugestoes = [s for s in sugestoes if not s.retorno][:5] + (
+        [] if retorno_atual else [s for s in sugestoes if s.retorno][:1]
+    )
+    if not sugestoes:
+        return
+    with st.expander(f"Sugestões de Layouts (outros processos de {processo.tipo})", expanded=not itens):
+        for i, sugestao in enumerate(sugestoes):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.markdown(f"**{'Retorno ' if sugestao.retorno else ''}{sugestao.rotulo}**")
+                st.caption(recomendacao.motivo(sugestao, processo.tipo))
+            with col2:
+                st.button(
+                    "Adicionar", key=f"sugestao_{processo.id}_{i}", use_container_width=True,
+                    on_click=adicionar_sugestao, args=(processo.id, layouts_config, sugestao)
+                )
+
+def adicionar_sugestao(processo_id: int, layouts_config: list, sugestao: recomendacao.Sugestao):
+    """Acrescenta a sugestão aos widgets em edição (formulário ou grade) ou liga o retorno sugerido."""
+    if sugestao.retorno:
+        st.session_state["usar_retorno"] = True
+        st.session_state["retorno_tipo"] = sugestao.rotulo
+        return
+    novo = {"tipo": "Arquivo", "modo": "existente", "arquivo": sugestao.rotulo}
+    # Um layout novo ainda sem nome (o primeiro de um processo novo) dá lugar à sugestão
+    vazio = bool(layouts_config) and layouts_config[-1].get("tipo") == "Arquivo" \
+        and layouts_config[-1].get("modo", "novo") == "novo" and not str(layouts_config[-1].get("nome") or "").strip()
+    layouts = layouts_config[:-1] if vazio else list(layouts_config)
+    if st.session_state.get("layouts_em_grade"):
+        st.session_state[f"grade_base_{processo_id}"] = layouts + [novo]
+        st.session_state.pop(f"grade_layouts_{processo_id}", None)
+        return
+    i = len(layouts) + 1
+    st.session_state["num_layouts"] = i
+    st.session_state[f"layout_tipo_{i}"] = "Arquivo"
+    st.session_state[f"modo_layout_{i}"] = "existente"
+    st.session_state[f"layout_escolha_{i}"] = sugestao.rotulo
+
+def iniciar_perfil(enviado, caminho_servidor: str) -> Tuple[Optional[tuple], str]:
+    """
+    Submete o perfil do arquivo enviado (ou do arquivo na pasta de amostras do servidor).
+    Retorna (chave da tarefa, erro). Uploads são guardados pelo hash do conteúdo; arquivos
+    do servidor, pelo caminho, tamanho e data de modificação (sem reler o arquivo na tela).
+    """
+    gerenciador = get_gerenciador_tarefas()
+    if enviado is not None:
+        temporario = perfil.temporario(enviado.name)
+        chave = ("perfil", perfil.copiar_com_hash(enviado, temporario))
+        existente = gerenciador.obter(chave)
+        if existente is not None and (existente.em_andamento or existente.concluida):
+            os.remove(temporario)
+        else:
+            gerenciador.submeter(chave, perfil.perfilar, temporario, enviado.name, chave[1], remover=True, pesada=True)
+        return chave, ""
+    pasta = os.path.realpath(AMOSTRAS_DIR)
+    caminho = os.path.realpath(os.path.join(pasta, caminho_servidor.strip()))
+    if not caminho_servidor.strip() or os.path.commonpath([pasta, caminho]) != pasta:
+        return None, f"Informe um arquivo dentro da pasta de amostras ({pasta})."
+    if not os.path.isfile(caminho):
+        return None, f"Arquivo {caminho} não encontrado."
+    info = os.stat(caminho)
+    chave = ("perfil", caminho, info.st_size, info.st_mtime_ns)
+    gerenciador.submeter(chave, perfil.perfilar, caminho, caminho, pesada=True)
+    return chave, ""
+
+def secao_amostras(processo_id: int, default_layouts: list, chave_versao: str):
+    """
+    Anexa a um layout novo já salvo o perfil (colunas, tipos, nulos, linhas) de um arquivo de amostra.
+    O formato detectado no conteúdo (CNAB, OFX, SPED...) pode substituir o tipo escolhido à mão.
+    """
+    indices = [
+        i for i, layout in enumerate(default_layouts)
+        if layout.get("tipo") == "Arquivo" and layout.get("modo", "novo") == "novo"
+    ]
+    if not indices:
+        return
+    def rotulo(i):
+        layout = default_layouts[i]
+        return f"{layout.get('nome') or 'SemNome'} - {layout.get('arquivo_tipo', '')}"
+
+    with st.expander("Arquivos de Amostra dos Layouts"):
+        for i in indices:
+            if default_layouts[i].get("perfil"):
+                st.caption(f"{rotulo(i)} — {perfil.resumo(default_layouts[i]['perfil'])}")
+        indice = st.selectbox("Layout", indices, format_func=rotulo, key=f"amostra_layout_{processo_id}")
+        # Sem filtro de extensão: arquivos CNAB, OFX e SPED vêm com extensões de cada banco
+        enviado = st.file_uploader("Arquivo de amostra", key=f"amostra_arquivo_{processo_id}")
+        caminho_servidor = st.text_input(
+            f"Ou, para arquivos grandes, o caminho dentro da pasta de amostras do servidor ({AMOSTRAS_DIR})",
+            key=f"amostra_caminho_{processo_id}"
+        )
+        chave_pendente = f"perfil_pendente_{processo_id}"
+        if st.button("Analisar Amostra", disabled=enviado is None and not caminho_servidor.strip()):
+            chave, erro = iniciar_perfil(enviado, caminho_servidor)
+            if erro:
+                st.error(erro)
+            else:
+                st.session_state[chave_pendente] = (indice, chave)
+
+        pendente = st.session_state.get(chave_pendente)
+        if pendente is None:
+            return
+        indice_pendente, chave = pendente
+        tarefa = get_gerenciador_tarefas().obter(chave)
+        if tarefa is None or indice_pendente >= len(default_layouts):
+            st.session_state.pop(chave_pendente, None)
+        elif tarefa.em_andamento:
+            acompanhar_relatorio(chave)
+        elif not tarefa.concluida:
+            st.error(f"Erro ao analisar a amostra: {tarefa.erro}" if tarefa.erro else "Análise da amostra cancelada.")
+        else:
+            exibir_perfil(tarefa.resultado)
+            layout = default_layouts[indice_pendente]
+            detectado = {
+                "arquivo_tipo": tarefa.resultado.get("arquivo_tipo") or layout.get("arquivo_tipo"),
+                "detalhe": tarefa.resultado.get("detalhe", ""),
+            }
+            aplicar_tipo = False
+            if (detectado["arquivo_tipo"], detectado["detalhe"]) != (layout.get("arquivo_tipo"), layout.get("detalhe", "")):
+                aplicar_tipo = st.checkbox(
+                    f"Usar o formato detectado no layout: {detectado['arquivo_tipo']}"
+                    + (f" ({detectado['detalhe']})" if detectado["detalhe"] else ""),
+                    value=detectado["arquivo_tipo"] != layout.get("arquivo_tipo"),
+                    key=f"aplicar_tipo_{processo_id}"
+                )
+            if st.button(f"Gravar Perfil em {rotulo(indice_pendente)}", use_container_width=True):
+                def gravar_perfil(conn):
+                    atuais = load_layouts_processo(conn, processo_id)
+                    if layout not in atuais:
+                        return None
+                    atualizado = {**layout, "perfil": tarefa.resultado}
+                    if aplicar_tipo:
+                        atualizado.update(detectado)
+                    atuais[atuais.index(layout)] = atualizado
+                    return gravar_config(conn, processo_id, atuais)
+                versao_anterior = load_dados_cliente(st.session_state.cliente_id).config(processo_id).versao
+                nova_versao = escrever(gravar_perfil)
+                if nova_versao is None:
+                    st.error("Perfil não gravado: o layout foi alterado em outra sessão. Recarregue a tela.")
+                else:
+                    # Quem editava a partir da versão atual continua podendo salvar o restante
+                    if st.session_state.get(chave_versao) == versao_anterior:
+                        st.session_state[chave_versao] = nova_versao
+                    st.session_state.pop(chave_pendente, None)
+                    if aplicar_tipo:
+                        # Os widgets do layout voltam a partir do tipo gravado
+                        for chave_widget in (f"tipo_layout_{indice_pendente + 1}", f"detalhe_layout_{indice_pendente + 1}",
+                                             f"grade_layouts_{processo_id}", f"grade_base_{processo_id}"):
+                            st.session_state.pop(chave_widget, None)
+                    st.cache_data.clear()
+                    st.success("Perfil da amostra gravado no layout!")
+                    st.rerun()
+
+def exibir_perfil(resultado: dict):
+    detalhes = [f"{resultado.get('formato')} de {resultado.get('tamanho', 0) / 1024 / 1024:.1f} MB"]
+    if resultado.get("registros"):
+        st.write(f"**{perfil.resumo(resultado)}**")
+        if not resultado.get("linhas_exatas"):
+            detalhes.append("há registros fora do tamanho fixo; a contagem é aproximada")
+        st.caption("; ".join(detalhes))
+        st.dataframe(
+            [{"Registro": registro, "Quantidade": quantidade} for registro, quantidade in resultado["registros"].items()],
+            use_container_width=True, hide_index=True
+        )
+        return
+    if resultado.get("delimitador"):
+        detalhes.append(f"delimitador {resultado['delimitador']!r}, {resultado.get('codificacao')}")
+    if resultado.get("planilha"):
+        detalhes.append(f"planilha {resultado['planilha']}")
+    detalhes.append(f"tipos inferidos de {resultado.get('amostra', 0)} linha(s) de amostra")
+    st.write(f"**{perfil.resumo(resultado)}**")
+    st.caption("; ".join(detalhes))
+    st.dataframe([
+        {
+            "Coluna": coluna["nome"],
+            "Tipo": coluna["tipo"],
+            "Nulos": f"{coluna['nulos']:.1%}",
+            "Exemplos": " | ".join(coluna["exemplos"]),
+        }
+        for coluna in resultado.get("colunas", [])
+    ], use_container_width=True, hide_index=True)
+
+def editar_layouts_em_formulario(processo_id: int, default_layouts: list) -> list:
+    """Um bloco de widgets por layout, conforme o número de layouts informado."""
+    num_layouts = st.number_input(
+        "Número de Layouts de Entrada",
+        min_value=1,
+        step=1,
+        value=len(default_layouts) if default_layouts else 1,
+        key="num_layouts"
+    )
+    layouts_config = []
+
+    for i in range(1, num_layouts + 1):
+        st.markdown(f"**Layout de Entrada #{i}**")
+        if default_layouts and i <= len(default_layouts):
+            layout_salvo = default_layouts[i-1]
+            default_tipo = layout_salvo.get("tipo", "Arquivo")
+        else:
+            layout_salvo = {}
+            default_tipo = "Arquivo"
+
+        layout_tipo = st.radio(
+            f"Selecione o tipo de entrada para o layout #{i}",
+            options=["Arquivo", "Encadeamento"],
+            index=0 if default_tipo == "Arquivo" else 1,
+            key=f"layout_tipo_{i}"
+        )
+
+        if layout_tipo == "Arquivo":
+            # Alterado o rótulo para "Modelo para o layout"
+            modo_default = layout_salvo.get("modo", "novo")
+            modo = st.radio(
+                f"Modelo para o layout #{i}",
+                options=["novo", "existente"],
+                index=0 if modo_default == "novo" else 1,
+                key=f"modo_layout_{i}"
+            )
+            if modo == "novo":
+                tipo_arquivo_options = ["Excel", "CSV", "TXT", "OFX", "CNAB", "SPED", "EDI", "XML", "SWIFT", "Extrato Adquirente", "API", "Banco de Dados", "PDF", "Outros"]
+                tipo_arquivo_default = layout_salvo.get("arquivo_tipo", "Excel")
+                tipo_arquivo = st.selectbox(
+                    f"Tipo de Arquivo para o layout #{i}",
+                    options=tipo_arquivo_options,
+                    index=tipo_arquivo_options.index(tipo_arquivo_default) if tipo_arquivo_default in tipo_arquivo_options else 0,
+                    key=f"tipo_layout_{i}"
+                )
+                detalhe = ""
+                if tipo_arquivo == "Outros":
+                    detalhe = st.text_input(f"Detalhe o tipo de arquivo para o layout #{i}", value=layout_salvo.get("detalhe", ""), key=f"detalhe_layout_{i}")
+                elif tipo_arquivo in grade_layouts.TIPOS_COM_DETALHE:
+                    detalhe = st.text_input(f"Variante do formato para o layout #{i} (opcional)", value=layout_salvo.get("detalhe", ""), key=f"detalhe_layout_{i}")
+                nome_layout = st.text_input(
+                    f"Nome do Layout #{i}",
+                    value=layout_salvo.get("nome", ""),
+                    key=f"nome_layout_{i}"
+                )
+                layouts_config.append({
+                    "tipo": "Arquivo",
+                    "modo": "novo",
+                    "arquivo_tipo": tipo_arquivo,
+                    "detalhe": detalhe,
+                    "nome": nome_layout
+                })
+            else:
+                available_layouts = load_all_layouts()
+                if not available_layouts:
+                    st.info("Nenhum layout existente encontrado. Por favor, crie um novo layout.")
+                    escolha_layout = ""
+                else:
+                    escolha_layout = st.selectbox(f"Selecione um layout para a entrada #{i}", options=available_layouts, index=0, key=f"layout_escolha_{i}")
+                layouts_config.append({
+                    "tipo": "Arquivo",
+                    "modo": "existente",
+                    "arquivo": escolha_layout
+                })
+
+        else:
+            st.markdown("*Encadeamento: refere-se à vinculação de um processo pré-configurado que alimenta este processo com informações adicionais.*")
+            processos_existentes = load_processos(st.session_state.cliente_id)
+            processos_filtrados = [proc for proc in processos_existentes if proc.id != processo_id]
+            if processos_filtrados:
+                rotulos_proc = {proc.id: encadeamento.rotulo_processo(proc.nome, proc.tipo) for proc in processos_filtrados}
+                ids_proc = list(rotulos_proc)
+                origem_default = layout_salvo.get("processo_id")
+                if origem_default is None:
+                    origem_default = next((pid for pid, rot in rotulos_proc.items() if rot == layout_salvo.get("processo")), None)
+                origem_id = st.selectbox(
+                    f"Selecione o processo de origem para a entrada #{i}",
+                    options=ids_proc,
+                    index=ids_proc.index(origem_default) if origem_default in ids_proc else 0,
+                    format_func=lambda pid: rotulos_proc[pid],
+                    key=f"proc_encadeado_{i}"
+                )
+                layouts_config.append({
+                    "tipo": "Encadeamento",
+                    "processo": rotulos_proc[origem_id],
+                    "processo_id": origem_id
+                })
+            else:
+                st.info("Nenhum processo disponível para encadeamento.")
+                layouts_config.append({
+                    "tipo": "Encadeamento",
+                    "processo": None
+                })
+    return layouts_config
+
+def editar_layouts_em_grade(processo_id: int, default_layouts: list) -> Tuple[list, List[str]]:
+    """
+    Todos os layouts em um único st.data_editor, validados de uma vez (ver grade_layouts).
+    As colunas são de texto livre para que valores colados não sejam descartados.
+    Retorna (layouts, erros).
+    """
+    processos = {
+        encadeamento.rotulo_processo(proc.nome, proc.tipo): proc.id
+        for proc in load_processos(st.session_state.cliente_id) if proc.id != processo_id
+    }
+    linhas = st.data_editor(
+        grade_layouts.para_linhas(default_layouts) or [dict.fromkeys(grade_layouts.COLUNAS, "")],
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        column_order=grade_layouts.COLUNAS,
+        column_config={
+            "tipo": st.column_config.TextColumn("Tipo", help=" ou ".join(grade_layouts.TIPOS)),
+            "modo": st.column_config.TextColumn("Modo", help="novo ou existente (vazio em encadeamentos)"),
+            "arquivo_tipo": st.column_config.TextColumn("Tipo de Arquivo", help=", ".join(grade_layouts.TIPOS_ARQUIVO)),
+            "nome": st.column_config.TextColumn(
+                "Nome", help="Nome do layout novo, layout existente ou processo de origem do encadeamento"
+            ),
+            "detalhe": st.column_config.TextColumn("Detalhe", help="Descrição do tipo Outros ou variante do formato (ex.: CNAB 240 - retorno)"),
+        },
+        key=f"grade_layouts_{processo_id}"
+    )
+    layouts, erros = grade_layouts.para_layouts(linhas, load_all_layouts(), processos)
+    for erro in erros:
+        st.error(erro)
+    st.caption(f"{len(layouts)} layout(s) de entrada.")
+    return layouts, erros
+
+def descartar_edicao_config(processo_id: int):
+    """Descarta os valores em edição do config para a tela recarregar a versão gravada."""
+    prefixos = (
+        "num_layouts", "layout_tipo_", "modo_layout_", "tipo_layout_", "detalhe_layout_", "nome_layout_",
+        "layout_escolha_", "proc_encadeado_", "usar_retorno", "retorno_tipo", "retorno_proposito",
+        f"versao_config_{processo_id}", f"grade_layouts_{processo_id}", f"grade_base_{processo_id}"
+    )
+    for chave in list(st.session_state.keys()):
+        if chave.startswith(prefixos):
+            del st.session_state[chave]
+
 def tela_agrupamento():
     """Tela para agrupar CNPJs em diferentes processos."""
     st.title("Agrupamento de CNPJs")
     selected_cnpjs = st.session_state.get("selected_cnpjs", [])
     if not selected_cnpjs:
         st.info("Nenhum CNPJ selecionado para agrupamento.")
-        if st.button("Voltar"):
-            st.session_state.tela = "configurar_processo"
-            st.rerun()
+        st.button("Voltar", on_click=navegar, args=("configurar_processo",))
         return
     st.subheader("Defina os grupos para os CNPJs:")
     group_dict = {}
@@ -753,97 +1471,48 @@ def tela_agrupamento():
 
     if st.button("Confirmar Agrupamento"):
         original_processo_id = st.session_state.get("processo_id")
-        with get_db_connection() as conn:
-            processo = conn.execute(
-                "SELECT id, nome, tipo, frequencia, cliente_id FROM processos WHERE id = ?", 
-                (original_processo_id,)
-            ).fetchone()
+        cliente_id = st.session_state.cliente_id
+        processo = load_dados_cliente(cliente_id).processo(original_processo_id)
         if not processo:
             st.error("Processo original não encontrado.")
             return
         sorted_grupos = sorted(distinct_groups.keys())
-        first_grupo = sorted_grupos[0]
-        cnpjs_grupo = distinct_groups[first_grupo]
-        with get_db_connection() as conn:
-            conn.execute("UPDATE processos SET nome = ? WHERE id = ?", (f"{processo[1]} - Grupo {first_grupo}", original_processo_id))
-            conn.execute("""
-                INSERT OR REPLACE INTO processo_config (processo_id, cnpjs, layouts, encadeamento, retorno)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                original_processo_id,
-                json.dumps(cnpjs_grupo),
-                json.dumps([]),
-                "",
-                json.dumps({})
-            ))
-            conn.commit()
-        for grupo in sorted_grupos[1:]:
-            cnpjs_grupo = distinct_groups[grupo]
-            with get_db_connection() as conn:
-                conn.execute("""
+
+        def agrupar(conn):
+            first_grupo = sorted_grupos[0]
+            nome_grupo = f"{processo.nome} - Grupo {first_grupo}"
+            conn.execute("UPDATE processos SET nome = ? WHERE id = ?", (nome_grupo, original_processo_id))
+            encadeamento.atualizar_rotulos(conn, original_processo_id, encadeamento.rotulo_processo(nome_grupo, processo.tipo))
+            gravar_config(conn, original_processo_id, [], {}, distinct_groups[first_grupo])
+            for grupo in sorted_grupos[1:]:
+                new_proc_id = conn.execute("""
                     INSERT INTO processos (nome, tipo, frequencia, cliente_id, configurado)
                     VALUES (?, ?, ?, ?, ?)
-                """, (f"{processo[1]} - Grupo {grupo}", processo[2], processo[3], processo[4], 1))
-                new_proc_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-                conn.execute("""
-                    INSERT INTO processo_config (processo_id, cnpjs, layouts, encadeamento, retorno)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    new_proc_id,
-                    json.dumps(cnpjs_grupo),
-                    json.dumps([]),
-                    "",
-                    json.dumps({})
-                ))
-                conn.commit()
+                """, (f"{processo.nome} - Grupo {grupo}", processo.tipo, processo.frequencia, cliente_id, 1)).lastrowid
+                gravar_config(conn, new_proc_id, [], {}, distinct_groups[grupo])
+
+        escrever(agrupar)
+        st.cache_data.clear()
         print("DEBUG: Processos agrupados criados com sucesso!")
         st.success("Processos agrupados criados com sucesso!")
         st.session_state.pop("group_dict", None)
         st.session_state.pop("selected_cnpjs", None)
         st.session_state.grupar = False
-        st.session_state.tela = "processos"
-        st.rerun()
+        redirecionar("processos")
 
-    if st.button("Voltar"):
-        st.session_state.tela = "configurar_processo"
-        st.rerun()
+    st.button("Voltar", on_click=navegar, args=("configurar_processo",))
 
 def tela_layouts(): 
     def remove_accents(s: str) -> str:
         nfkd = unicodedata.normalize('NFKD', s)
         return "".join([c for c in nfkd if not unicodedata.combining(c)])
 
-    def count_layout_usage(db_conn, layout_dict):
-        usage_count = 0
-        rows = db_conn.execute("SELECT layouts FROM processo_config").fetchall()
-        for row in rows:
-            if row[0]:
-                try:
-                    conf_layouts = json.loads(row[0])
-                    for item in conf_layouts:
-                        if item == layout_dict:
-                            usage_count += 1
-                            break
-                except:
-                    pass
-        return usage_count
-
     processo_id = st.session_state.get("processo_id")
-    with get_db_connection() as conn:
-        proc_conf = conn.execute(
-            "SELECT id, layouts FROM processo_config WHERE processo_id = ?",
-            (processo_id,)
-        ).fetchone()
-
-    layouts_config = []
-    proc_conf_id = None
-    if proc_conf:
-        proc_conf_id, layouts_str = proc_conf
-        if layouts_str:
-            try:
-                layouts_config = json.loads(layouts_str)
-            except Exception as e:
-                st.error(f"Erro ao carregar layouts: {e}")
+    dados = load_dados_cliente(st.session_state.cliente_id)
+    config = dados.config(processo_id)
+    layouts_config = config.layouts
+    if config.erros:
+        st.error("Erro ao carregar layouts: " + "; ".join(config.erros))
 
     st.markdown("""
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.1/css/all.min.css">
@@ -906,16 +1575,17 @@ def tela_layouts():
             "DEFAULT": "fa-solid fa-file"
         }
 
-        conn = get_db_connection()
+        uso_layouts = load_uso_layouts()
 
-        for idx, layout in enumerate(layouts_config):
-            arquivo_tipo = layout.get("arquivo_tipo", "")
-            icon_class = icon_map.get(arquivo_tipo, icon_map["DEFAULT"]) if layout["tipo"]=="Arquivo" else "fa-solid fa-diagram-project"
-            titulo = layout.get("arquivo", "Layout Existente") if layout.get("modo")=="existente" else f"{layout.get('nome','SemNome')} - {arquivo_tipo}"
-            if layout["tipo"] != "Arquivo":
-                titulo = f"{layout.get('processo','Encadeado')} - Encadeamento"
+        for idx, modelo in enumerate(layouts_config):
+            layout = modelo.para_dict()
+            arquivo_tipo = modelo.arquivo_tipo or ""
+            icon_class = icon_map.get(arquivo_tipo, icon_map["DEFAULT"]) if modelo.tipo=="Arquivo" else "fa-solid fa-diagram-project"
+            titulo = (modelo.arquivo or "Layout Existente") if modelo.modo=="existente" else f"{modelo.nome or 'SemNome'} - {arquivo_tipo}"
+            if modelo.tipo != "Arquivo":
+                titulo = f"{modelo.processo or 'Encadeado'} - Encadeamento"
             titulo = remove_accents(titulo)
-            usage_count = count_layout_usage(conn,layout)
+            usage_count = uso_layouts[layout_chave(layout)]
 
             with st.container(border=True):
                 col_left,col_right=st.columns([0.85,0.15])
@@ -929,25 +1599,40 @@ def tela_layouts():
                         </div>""",unsafe_allow_html=True)
                 with col_right:
                     if st.button("Excluir",key=f"del_{idx}"):
-                        layouts_config.remove(layout)
-                        if proc_conf_id:
-                            conn.execute("UPDATE processo_config SET layouts=? WHERE id=?", (json.dumps(layouts_config),proc_conf_id))
-                            conn.commit()
-                        st.success("Layout excluído com sucesso!")
-                        st.rerun()
-        conn.close()
+                        # Lê e regrava dentro do escritor, pela posição na versão exibida: comparar
+                        # dicts falharia com layouts antigos gravados com chaves nulas
+                        def excluir_layout(db_conn, idx=idx, modelo=modelo):
+                            atuais = load_layouts_processo(db_conn, processo_id)
+                            # A tela lista só os layouts válidos; a posição é entre eles
+                            validos = []
+                            for posicao, bruto in enumerate(atuais):
+                                try:
+                                    validos.append((posicao, modelos.Layout.de_dict(bruto)))
+                                except ValueError:
+                                    pass
+                            if idx >= len(validos) or validos[idx][1] != modelo:
+                                return False
+                            del atuais[validos[idx][0]]
+                            gravar_config(db_conn, processo_id, atuais, versao_esperada=config.versao)
+                            return True
+                        try:
+                            excluido = processo_id in dados.configs and escrever(excluir_layout)
+                        except escritor.ConflitoVersao:
+                            excluido = False
+                        st.cache_data.clear()
+                        if excluido:
+                            st.success("Layout excluído com sucesso!")
+                            st.rerun()
+                        else:
+                            st.error("Layout não excluído: os layouts do processo foram alterados em outra sessão. Recarregue a tela.")
 
     container = st.container()
     with container:
         col1, col2 = st.columns([0.85,0.15])
         with col1:
-            if st.button("➕ Adicionar Layout"):
-                st.session_state.tela="adicionar_layout"
-                st.rerun()
+            st.button("➕ Adicionar Layout", on_click=navegar, args=("adicionar_layout",))
         with col2:
-            if st.button("⬅️ Voltar"):
-                st.session_state.tela="configurar_processo"
-                st.rerun()
+            st.button("⬅️ Voltar", on_click=navegar, args=("configurar_processo",))
 
 def tela_adicionar_layout():
     """Tela para adicionar um novo layout."""
@@ -960,6 +1645,8 @@ def tela_adicionar_layout():
             detalhe = ""
             if tipo_arquivo == "Outros":
                 detalhe = st.text_input("Detalhe o tipo de arquivo")
+            elif tipo_arquivo in grade_layouts.TIPOS_COM_DETALHE:
+                detalhe = st.text_input("Variante do formato (opcional, ex.: CNAB 240 - retorno)")
             nome_layout = st.text_input("Nome do Layout")
             novo_layout = {"tipo": "Arquivo", "modo": "novo", "arquivo_tipo": tipo_arquivo, "detalhe": detalhe, "nome": nome_layout}
         else:
@@ -972,36 +1659,31 @@ def tela_adicionar_layout():
             novo_layout = {"tipo": "Arquivo", "modo": "existente", "arquivo": escolha_layout}
     else:
         processos_existentes = load_processos(st.session_state.cliente_id)
-        processos_filtrados = [proc for proc in processos_existentes if proc[0] != st.session_state.processo_id]
+        processos_filtrados = [proc for proc in processos_existentes if proc.id != st.session_state.processo_id]
         if processos_filtrados:
-            processo_encadeado = st.selectbox("Selecione o processo de origem", [f"{proc[1]} - {proc[2]}" for proc in processos_filtrados])
+            rotulos_proc = {proc.id: encadeamento.rotulo_processo(proc.nome, proc.tipo) for proc in processos_filtrados}
+            origem_id = st.selectbox("Selecione o processo de origem", list(rotulos_proc), format_func=lambda pid: rotulos_proc[pid])
+            novo_layout = {"tipo": "Encadeamento", "processo": rotulos_proc[origem_id], "processo_id": origem_id}
         else:
-            processo_encadeado = None
-        novo_layout = {"tipo": "Encadeamento", "processo": processo_encadeado}
+            novo_layout = {"tipo": "Encadeamento", "processo": None}
 
     if st.button("Salvar Novo Layout"):
         processo_id = st.session_state.processo_id
-        with get_db_connection() as conn:
-            proc_conf = conn.execute("SELECT id, layouts FROM processo_config WHERE processo_id = ?", (processo_id,)).fetchone()
-            layouts_config = []
-            if proc_conf and proc_conf[1]:
-                try:
-                    layouts_config = json.loads(proc_conf[1])
-                except Exception as e:
-                    print("DEBUG: Erro ao carregar layouts para edição:", e)
+        # Lê e regrava dentro do escritor: inclusões simultâneas não se sobrescrevem
+        def adicionar(conn):
+            layouts_config = load_layouts_processo(conn, processo_id)
             layouts_config.append(novo_layout)
-            if proc_conf:
-                conn.execute("UPDATE processo_config SET layouts = ? WHERE id = ?", (json.dumps(layouts_config), proc_conf[0]))
-            else:
-                conn.execute("INSERT INTO processo_config (processo_id, layouts) VALUES (?, ?)", (processo_id, json.dumps(layouts_config)))
-            conn.commit()
-        print("DEBUG: Layout adicionado!")
-        st.success("Layout adicionado!")
-        st.session_state.tela = "layouts"
-        st.rerun()
-    if st.button("Voltar"):
-        st.session_state.tela = "layouts"
-        st.rerun()
+            gravar_config(conn, processo_id, layouts_config)
+        try:
+            escrever(adicionar)
+            st.cache_data.clear()
+        except encadeamento.CicloEncadeamento as e:
+            st.error(f"Layout não adicionado: {descreve_ciclo(e.ciclo)}")
+        else:
+            print("DEBUG: Layout adicionado!")
+            st.success("Layout adicionado!")
+            redirecionar("layouts")
+    st.button("Voltar", on_click=navegar, args=("layouts",))
 
 def tela_diagrama():
     """
@@ -1012,36 +1694,21 @@ def tela_diagrama():
     processo_id = st.session_state.get("processo_id")
     if not processo_id:
         st.error("Processo não selecionado.")
-        st.session_state.tela = "processos"
-        st.rerun()
+        redirecionar("processos")
+
+    dados = load_dados_cliente(st.session_state.cliente_id)
+    proc = dados.processo(processo_id)
 
-    with get_db_connection() as conn:
-        proc = conn.execute(
-            "SELECT nome FROM processos WHERE id = ?", 
-            (processo_id,)
-        ).fetchone()
-        proc_conf = conn.execute(
-            "SELECT layouts, retorno FROM processo_config WHERE processo_id = ?",
-            (processo_id,)
-        ).fetchone()
-
-    if not proc_conf:
+    if processo_id not in dados.configs:
         st.warning("Nenhuma configuração encontrada para este processo.")
-        if st.button("Voltar"):
-            st.session_state.tela = "configurar_processo"
-            st.rerun()
+        st.button("Voltar", on_click=navegar, args=("configurar_processo",))
         return
 
-    layouts_str, retorno_str = proc_conf
-    layouts_list = []
-    retorno_dict = {}
-
-    if layouts_str:
-        layouts_list = json.loads(layouts_str)
-    if retorno_str:
-        retorno_dict = json.loads(retorno_str)
+    config = dados.config(processo_id)
+    layouts_list = config.layouts_dicts()
+    retorno_dict = config.retorno_dict()
 
-    nome_processo = remove_accents(proc[0]) if proc else "Processo"
+    nome_processo = remove_accents(proc.nome) if proc else "Processo"
 
     mermaid_body = []
     mermaid_body.append("---")
@@ -1108,18 +1775,95 @@ def tela_diagrama():
 
     components.html(html_diagrama, height=600, scrolling=True)
 
-    if st.button("Voltar"):
-        st.session_state.tela = "configurar_processo"
-        st.rerun()
+    st.button("Voltar", on_click=navegar, args=("configurar_processo",))
 
 def tela_relatorio():
     """
     Tela que mostra:
-      1) Um resumo de quantidades (Entradas, Tipos de Análise, Retornos) usando os registros do banco.
+      1) Um resumo de quantidades (Entradas, Tipos de Análise, Retornos) dos processos do cliente.
       2) Ao final, exibe o diagrama Mermaid de cada processo cadastrado, tudo na mesma tela.
+    O relatório é montado em segundo plano e guardado por (cliente, versão dos dados),
+    então reabrir a tela sem alterações no cliente exibe o resultado imediatamente.
     """
     st.title("Relatório de Quantidades e Diagramas")
 
+    cliente_id = st.session_state.cliente_id
+    gerenciador = get_gerenciador_tarefas()
+    chave = ("relatorio", cliente_id, load_versao_cliente(cliente_id))
+    pre_carregado = get_cache_precarga().retirar(chave)
+    if pre_carregado is not None:
+        gerenciador.guardar_resultado(chave, pre_carregado)
+    tarefa = gerenciador.submeter(chave, relatorio.montar_relatorio, partial(get_db_connection, cliente_id), cliente_id)
+    gerenciador.descartar_anteriores(("relatorio", cliente_id), chave)
+
+    if tarefa.em_andamento:
+        acompanhar_relatorio(chave)
+    elif tarefa.concluida:
+        exibir_relatorio(tarefa.resultado)
+    else:
+        if tarefa.erro is not None:
+            st.error(f"Erro ao gerar o relatório: {tarefa.erro}")
+        else:
+            st.warning("Geração do relatório cancelada.")
+        if st.button("Gerar Novamente"):
+            gerenciador.descartar(chave)
+            st.rerun()
+
+    exibir_calendario(cliente_id)
+
+    st.write("---")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("Voltar", use_container_width=True, on_click=navegar, args=("processos",))
+    with col2:
+        st.button("Portfólio de Clientes", use_container_width=True, on_click=navegar, args=("portfolio",))
+
+@st.fragment(run_every=0.5)
+def acompanhar_relatorio(chave: tuple):
+    """Barra de progresso do relatório; reexecuta a tela inteira quando a tarefa termina."""
+    tarefa = get_gerenciador_tarefas().obter(chave)
+    if tarefa is None or not tarefa.em_andamento:
+        st.rerun()
+        return
+    st.progress(tarefa.progresso, text=f"{tarefa.mensagem} ({time.time() - tarefa.inicio:.1f}s)")
+    if st.button("Cancelar", key="cancelar_relatorio"):
+        tarefa.cancelar()
+        st.rerun()
+
+def exibir_calendario(cliente_id: int):
+    """Carga operacional projetada: execuções e chegadas de arquivos por dia útil, em mapa de calor."""
+    st.subheader("CALENDÁRIO DE EXECUÇÕES")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        horizonte = st.selectbox("Horizonte", [30, 90, 180, 365], index=1, format_func=lambda d: f"{d} dias", key="calendario_dias")
+    with col2:
+        tipo_calendario = st.selectbox("Calendário", list(calendario.CALENDARIOS), format_func=calendario.CALENDARIOS.get, key="calendario_tipo")
+    with col3:
+        medida = st.selectbox("Mostrar", ["Execuções", "Arquivos recebidos"], key="calendario_medida")
+
+    dados = load_dados_cliente(cliente_id)
+    projecao = calendario.projetar(
+        calendario.processos_do_cliente(cliente_id, dados), date.today(), horizonte,
+        bancario=tipo_calendario == "bancario"
+    )
+    execucoes, chegadas = projecao.do_cliente(cliente_id)
+    st.caption(
+        f"{int(execucoes.sum())} execução(ões) e {int(chegadas.sum())} arquivo(s) de entrada esperados "
+        f"nos próximos {horizonte} dias; até {int(execucoes.max(initial=0))} execução(ões) no dia mais carregado."
+    )
+    valores = execucoes if medida == "Execuções" else chegadas
+    st.markdown(
+        calendario.html_mapa_calor(projecao.dias, valores, medida.lower(), projecao.bancario),
+        unsafe_allow_html=True
+    )
+    sem_agenda = projecao.sem_agenda.get(cliente_id, 0)
+    if sem_agenda:
+        st.info(f"{sem_agenda} processo(s) de frequência Específica não entram na projeção.")
+    pico = calendario.dias_de_pico(projecao.dias, execucoes, chegadas)
+    if pico:
+        st.table(pico)
+
+def exibir_relatorio(resultado: dict):
     st.markdown("""
     <style>
     thead tr th {
@@ -1140,287 +1884,348 @@ def tela_relatorio():
     </style>
     """, unsafe_allow_html=True)
 
-    entrada_counts = {
-        "Excel": 0,
-        "Arquivos texto": 0,
-        "Arquivos padrões especiais": 0,
-        "API / Banco de Dados": 0,
-        "PDF": 0
-    }
-
-    def categoriza_layout_entrada(arquivo_tipo: str) -> str:
-        arquivo_tipo_lower = arquivo_tipo.lower()
-        if "excel" in arquivo_tipo_lower:
-            return "Excel"
-        if arquivo_tipo_lower in ["csv", "txt", "ofx"]:
-            return "Arquivos texto"
-        if arquivo_tipo_lower in ["cnab", "sped", "edi", "xml", "swift", "extrato adquirente"]:
-            return "Arquivos padrões especiais"
-        if arquivo_tipo_lower in ["api", "banco de dados"]:
-            return "API / Banco de Dados"
-        if arquivo_tipo_lower == "pdf":
-            return "PDF"
-        return "Arquivos texto"
-
-    with get_db_connection() as conn:
-        rows = conn.execute("SELECT layouts FROM processo_config").fetchall()
-        for row in rows:
-            if row[0]:
-                try:
-                    layouts_list = json.loads(row[0])
-                    for layout in layouts_list:
-                        if layout.get("tipo") == "Arquivo":
-                            tipo_arq = layout.get("arquivo_tipo", "")
-                            cat = categoriza_layout_entrada(tipo_arq)
-                            if cat in entrada_counts:
-                                entrada_counts[cat] += 1
-                            else:
-                                entrada_counts["Arquivos texto"] += 1
-                except:
-                    pass
-
-    data_entrada = [
-        {"TIPO ENTRADA": "Excel", "QUANTIDADE": entrada_counts["Excel"]},
-        {"TIPO ENTRADA": "Arquivos texto (CSV, TXT, OFX, etc.)", "QUANTIDADE": entrada_counts["Arquivos texto"]},
-        {"TIPO ENTRADA": "Arquivos com padrões especiais (CNAB, SPED, EDI, XML, SWIFT, etc.)", "QUANTIDADE": entrada_counts["Arquivos padrões especiais"]},
-        {"TIPO ENTRADA": "API / Banco de Dados", "QUANTIDADE": entrada_counts["API / Banco de Dados"]},
-        {"TIPO ENTRADA": "PDF", "QUANTIDADE": entrada_counts["PDF"]},
-    ]
-
     st.subheader("TIPO ENTRADA")
-    st.table(data_entrada)
-
-    analise_counts = {
-        "Análise Tabular (Resultados)": 0,
-        "Análise Comparativa (Conciliações)": 0,
-        "Análise Composição (Saldos)": 0,
-        "Análise Meios Pagamento": 0
-    }
-
-    def categoriza_processo(tipo: str) -> str:
-        tipo_lower = tipo.lower()
-        if tipo_lower == "análise tabular":
-            return "Análise Tabular (Resultados)"
-        if tipo_lower == "conciliação":
-            return "Análise Comparativa (Conciliações)"
-        if tipo_lower == "composição de saldos":
-            return "Análise Composição (Saldos)"
-        if tipo_lower == "pagamentos":
-            return "Análise Meios Pagamento"
-        return None
-
-    with get_db_connection() as conn:
-        rows = conn.execute("SELECT tipo FROM processos").fetchall()
-        for row in rows:
-            tipo_proc = row[0] if row[0] else ""
-            cat_analise = categoriza_processo(tipo_proc)
-            if cat_analise and cat_analise in analise_counts:
-                analise_counts[cat_analise] += 1
-
-    data_analise = [
-        {"TIPO ANÁLISE": "Análise Tabular (Resultados)", "QUANTIDADE": analise_counts["Análise Tabular (Resultados)"]},
-        {"TIPO ANÁLISE": "Análise Comparativa (Conciliações)", "QUANTIDADE": analise_counts["Análise Comparativa (Conciliações)"]},
-        {"TIPO ANÁLISE": "Análise Composição (Saldos)", "QUANTIDADE": analise_counts["Análise Composição (Saldos)"]},
-        {"TIPO ANÁLISE": "Análise Meios Pagamento", "QUANTIDADE": analise_counts["Análise Meios Pagamento"]},
-    ]
+    st.table(resultado["entrada"])
 
     st.subheader("TIPO ANÁLISE")
-    st.table(data_analise)
-
-    saida_counts = {
-        "Excel": 0,
-        "Texto (CSV, TXT simples, OFX, etc.)": 0,
-        "Texto Multi-estrutural (CNAB, SPED, EDI, XML, SWIFT, etc.)": 0,
-        "API / Banco de Dados": 0,
-        "PDF": 0,
-        "HTML (Dashboard)": 0
-    }
-
-    def categoriza_saida(retorno_tipo: str) -> str:
-        r_lower = retorno_tipo.lower()
-        if "excel" in r_lower:
-            return "Excel"
-        if r_lower in ["csv", "txt", "ofx"]:
-            return "Texto (CSV, TXT simples, OFX, etc.)"
-        if r_lower in ["cnab", "sped", "edi", "xml", "swift", "extrato adquirente"]:
-            return "Texto Multi-estrutural (CNAB, SPED, EDI, XML, SWIFT, etc.)"
-        if r_lower in ["api", "banco de dados"]:
-            return "API / Banco de Dados"
-        if r_lower == "pdf":
-            return "PDF"
-        if r_lower == "html":
-            return "HTML (Dashboard)"
-        return "Texto (CSV, TXT simples, OFX, etc.)"
-
-    with get_db_connection() as conn:
-        rows = conn.execute("SELECT retorno FROM processo_config").fetchall()
-        for row in rows:
-            if row[0]:
-                try:
-                    ret_dict = json.loads(row[0])
-                    ret_tipo = ret_dict.get("tipo", "")
-                    if ret_tipo:
-                        cat_saida = categoriza_saida(ret_tipo)
-                        if cat_saida in saida_counts:
-                            saida_counts[cat_saida] += 1
-                        else:
-                            saida_counts["Texto (CSV, TXT simples, OFX, etc.)"] += 1
-                except:
-                    pass
-
-    data_saida = [
-        {"TIPO SAÍDA": "Excel", "QUANTIDADE": saida_counts["Excel"]},
-        {"TIPO SAÍDA": "Texto (CSV, TXT simples, OFX, etc.)", "QUANTIDADE": saida_counts["Texto (CSV, TXT simples, OFX, etc.)"]},
-        {"TIPO SAÍDA": "Texto Multi-estrutural (CNAB, SPED, EDI, XML, SWIFT, etc.)", "QUANTIDADE": saida_counts["Texto Multi-estrutural (CNAB, SPED, EDI, XML, SWIFT, etc.)"]},
-        {"TIPO SAÍDA": "API / Banco de Dados", "QUANTIDADE": saida_counts["API / Banco de Dados"]},
-        {"TIPO SAÍDA": "PDF", "QUANTIDADE": saida_counts["PDF"]},
-        {"TIPO SAÍDA": "HTML (Dashboard)", "QUANTIDADE": saida_counts["HTML (Dashboard)"]},
-    ]
+    st.table(resultado["analise"])
 
     st.subheader("ARQUIVOS DE RETORNO > TIPO SAÍDA")
-    st.table(data_saida)
+    st.table(resultado["saida"])
 
     st.write("### Diagramas de Todos os Processos")
 
-    import streamlit.components.v1 as components
+    if not resultado["diagramas"]:
+        st.info("Não há processos cadastrados.")
+    for nome, mermaid_code_str in resultado["diagramas"]:
+        st.subheader(f"Processo: {nome}")
+        if mermaid_code_str is None:
+            st.info("Nenhuma configuração para este processo.")
+            continue
+        components.html(diagramas.html_mermaid(mermaid_code_str), height=400, scrolling=True)
+
+def tela_portfolio():
+    """
+    Quantidades consolidadas de todos os clientes. Os dados saem da exportação
+    colunar (analitico.py), que só regrava os clientes alterados desde a última vez;
+    a tarefa é guardada pelas versões de todos os clientes.
+    """
+    st.title("Portfólio de Clientes")
 
-    with get_db_connection() as conn:
-        procs = conn.execute("SELECT id, nome FROM processos").fetchall()
+    if analitico.pa is None:
+        st.error("A visão do portfólio requer o pacote pyarrow, que não está instalado.")
+    else:
+        versoes_clientes = tuple(sorted(
+            particoes.fan_out(caminhos_banco(), "SELECT cliente_id, versao FROM cliente_versao", conectar=conectar_leitura)
+        ))
+        gerenciador = get_gerenciador_tarefas()
+        chave = ("portfolio", versoes_clientes)
+        tarefa = gerenciador.submeter(chave, analitico.atualizar_portfolio, caminhos_banco(), ANALITICO_DIR, pesada=True)
+        gerenciador.descartar_anteriores(("portfolio",), chave)
+
+        if tarefa.em_andamento:
+            acompanhar_relatorio(chave)
+        elif tarefa.concluida:
+            exportacao = tarefa.resultado["exportacao"]
+            resultado = tarefa.resultado["portfolio"]
+            st.caption(
+                f"{len(exportacao['exportados'])} cliente(s) exportado(s) e {exportacao['inalterados']} "
+                f"reaproveitado(s) em {exportacao['segundos']:.2f}s; "
+                f"consulta ({resultado['motor']}) em {resultado['segundos'] * 1000:.0f} ms."
+            )
+            st.subheader("TIPO ENTRADA")
+            st.table(resultado["entrada"])
+            st.subheader("TIPO ANÁLISE")
+            st.table(resultado["analise"])
+            st.subheader("ARQUIVOS DE RETORNO > TIPO SAÍDA")
+            st.table(resultado["saida"])
+            st.subheader("FREQUÊNCIA DOS PROCESSOS")
+            st.table(resultado["frequencia"])
+            st.subheader("RESUMO POR CLIENTE")
+            st.dataframe(resultado["clientes"], use_container_width=True, hide_index=True)
+        else:
+            if tarefa.erro is not None:
+                st.error(f"Erro ao gerar o portfólio: {tarefa.erro}")
+            else:
+                st.warning("Geração do portfólio cancelada.")
+            if st.button("Gerar Novamente"):
+                gerenciador.descartar(chave)
+                st.rerun()
 
-    if not procs:
-        st.info("Não há processos cadastrados.")
+    st.write("---")
+    st.button("Voltar", on_click=navegar, args=("relatorio",))
+
+def tela_templates():
+    """
+    Biblioteca de templates: salva processos do cliente atual como template e
+    aplica um template a um ou vários clientes de uma vez.
+    """
+    st.title("Templates de Processos")
+    cliente_id = st.session_state.cliente_id
+    dados = load_dados_cliente(cliente_id)
+
+    st.subheader("Salvar processos deste cliente como template")
+    if not dados.processos:
+        st.info("Este cliente ainda não tem processos.")
     else:
-        for p in procs:
-            st.subheader(f"Processo: {p[1]}")
-            with get_db_connection() as conn:
-                proc_conf = conn.execute(
-                    "SELECT layouts, retorno FROM processo_config WHERE processo_id = ?",
-                    (p[0],)
-                ).fetchone()
-            if not proc_conf:
-                st.info("Nenhuma configuração para este processo.")
-                continue
-
-            layouts_str, retorno_str = proc_conf
-            layouts_list = []
-            retorno_dict = {}
-            if layouts_str:
-                try:
-                    layouts_list = json.loads(layouts_str)
-                except:
-                    pass
-            if retorno_str:
-                try:
-                    retorno_dict = json.loads(retorno_str)
-                except:
-                    pass
-
-            nome_processo = remove_accents(p[1])
-            mermaid_code = [
-                "---",
-                "config:",
-                "   theme: neutral",
-                "---",
-                "flowchart LR",
-                "  %% Estilos Modernos",
-                "  classDef arquivo fill:#E0F7FA,stroke:#00ACC1,stroke-width:1.5px,color:#006064,stroke-dasharray: 5 5",
-                "  classDef processo fill:#E8EAF6,stroke:#3949AB,stroke-width:2px,color:#1A237E",
-                "  classDef retorno fill:#FFF3E0,stroke:#FB8C00,stroke-width:1.5px,color:#E65100",
-                "  classDef encadeamento fill:#FCE4EC,stroke:#E91E63,stroke-width:1.5px,color:#880E4F,stroke-dasharray: 5 2",
-                "",
-                "  %% Fontes de Informação",
-                '  subgraph DataSources["🔍 Fontes"]',
-                "    direction TB"
-            ]
-
-            ds_counter = 1
-            connections = []
-
-            for layout in layouts_list:
-                ds_name = f"DS{ds_counter}"
-                ds_counter += 1
-
-                if layout["tipo"] == "Arquivo":
-                    if layout.get("modo") == "existente":
-                        label = layout.get("arquivo", "Layout Existente")
-                    else:
-                        label = f"{layout.get('arquivo_tipo','?')}: {layout.get('nome','?')}"
-                    label = remove_accents(label)
-                    mermaid_code.append(f'    {ds_name}(["📗 {label}"]):::arquivo')
-                    connections.append(f"{ds_name} --> PROC")
-                else:
-                    enc_label = remove_accents(layout.get("processo", "Encadeado"))
-                    mermaid_code.append(f'    {ds_name}(["🔁 {enc_label}"]):::encadeamento')
-                    connections.append(f"{ds_name} --> PROC")
-
-            mermaid_code.append("  end\n")
-            mermaid_code.append(f'  PROC(["🔄 {nome_processo}"]):::processo')
-
-            for c in connections:
-                mermaid_code.append(f"  {c}")
-
-            if retorno_dict:
-                ret_tipo = remove_accents(retorno_dict.get("tipo", "Retorno"))
-                mermaid_code.append(f'  RET(["📑 {ret_tipo}"]):::retorno')
-                mermaid_code.append("  PROC --> RET")
-
-            mermaid_code_str = "\n".join(mermaid_code)
-            mermaid_html = f"""
-            <div class="mermaid">
-            {mermaid_code_str}
-            </div>
-            <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
-            <script>
-                mermaid.initialize({{ startOnLoad: true }});
-            </script>
-            """
-            components.html(mermaid_html, height=400, scrolling=True)
+        opcoes = {encadeamento.rotulo_processo(p.nome, p.tipo): p.id for p in dados.processos}
+        selecionados = st.multiselect("Processos", list(opcoes), default=list(opcoes))
+        nome = st.text_input("Nome do template")
+        descricao = st.text_area("Descrição do template")
+        if st.button("Salvar Template"):
+            if not nome.strip() or not selecionados:
+                st.warning("Informe o nome e ao menos um processo.")
+            else:
+                processos = templates.processos_do_cliente(dados, [opcoes[r] for r in selecionados])
+                unidade_trabalho.escrever(caminho_templates(), templates.salvar_template, nome.strip(), descricao, processos)
+                st.cache_data.clear()
+                st.success(f"Template '{nome.strip()}' salvo com {len(processos)} processo(s).")
+
     st.write("---")
-    if st.button("Voltar"):
-        st.session_state.tela = "processos"
-        st.rerun()
+    st.subheader("Aplicar template")
+    lista = load_templates()
+    if not lista:
+        st.info("Nenhum template salvo.")
+    else:
+        rotulos = {f"{nome} ({quantidade} processo(s))": tid for tid, nome, _, quantidade in lista}
+        template = load_template(rotulos[st.selectbox("Template", list(rotulos))])
+        if template is not None:
+            if template.descricao:
+                st.caption(template.descricao)
+            st.table([
+                {"PROCESSO": p.nome, "TIPO": p.tipo, "FREQUÊNCIA": p.frequencia, "LAYOUTS": len(p.layouts)}
+                for p in template.processos
+            ])
+            clientes = dict((f"{nome} (#{cid})", cid) for cid, nome in load_clientes())
+            atual = next((r for r, cid in clientes.items() if cid == cliente_id), None)
+            destinos = st.multiselect("Clientes de destino", list(clientes), default=[atual] if atual else [])
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Aplicar Template", use_container_width=True, disabled=not destinos):
+                    barra = st.progress(0.0)
+                    resultados = aplicar_template(template, [clientes[d] for d in destinos], barra.progress)
+                    nomes = {cid: rotulo for rotulo, cid in clientes.items()}
+                    for cid, resultado in resultados.items():
+                        if isinstance(resultado, dict):
+                            st.success(
+                                f"{nomes[cid]}: {resultado['criados']} processo(s) criado(s), "
+                                f"{resultado['existentes']} já existente(s), {resultado['encadeamentos']} encadeamento(s)."
+                            )
+                        else:
+                            st.error(f"{nomes[cid]}: {resultado}")
+            with col2:
+                if st.button("Excluir Template", use_container_width=True):
+                    unidade_trabalho.escrever(caminho_templates(), templates.excluir_template, template.id)
+                    st.cache_data.clear()
+                    st.rerun()
+
+    st.write("---")
+    st.button("Voltar para Processos", on_click=navegar, args=("processos",))
+
+def tela_duplicados():
+    """
+    Prováveis duplicados em todos os clientes: processos com nome, descrição ou layouts
+    quase iguais (pelo índice de semelhança) e layouts com rótulos quase iguais.
+    """
+    st.title("Processos Duplicados")
+    st.write("Processos e layouts muito parecidos em todos os clientes, candidatos a unificação.")
+    limiar = st.slider("Semelhança mínima", min_value=0.3, max_value=1.0, value=similaridade.LIMIAR_PADRAO, step=0.05)
+
+    inicio = time.perf_counter()
+    grupos = similaridade.grupos_duplicados(caminhos_banco(), limiar)
+    rotulos = similaridade.rotulos_parecidos(load_all_layouts(), limiar)
+    st.caption(f"Calculado em {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+
+    st.subheader(f"Processos ({len(grupos)} grupo(s))")
+    if not grupos:
+        st.info("Nenhum processo parecido encontrado.")
+    for grupo in grupos:
+        with st.expander(f"{grupo[0].nome} — {len(grupo)} processo(s), até {max(s.semelhanca for s in grupo):.0%}"):
+            st.table([
+                {"CLIENTE": s.cliente, "PROCESSO": s.nome, "TIPO": s.tipo, "SEMELHANÇA": f"{s.semelhanca:.0%}"}
+                for s in grupo
+            ])
+
+    st.subheader(f"Layouts ({len(rotulos)} par(es))")
+    if rotulos:
+        st.table([{"LAYOUT": a, "PARECIDO COM": b, "SEMELHANÇA": f"{v:.0%}"} for a, b, v in rotulos])
+    else:
+        st.info("Nenhum layout com rótulo parecido.")
+
+    st.button("Voltar", on_click=navegar, args=("processos",))
 
 def tela_editar_processo():
     """Tela para editar as informações básicas do processo."""
     processo_id = st.session_state.get("processo_id")
     if not processo_id:
          st.error("Processo não selecionado.")
-         st.session_state.tela = "processos"
-         st.rerun()
+         redirecionar("processos")
     
-    with get_db_connection() as conn:
-         processo = conn.execute("SELECT nome, tipo, frequencia FROM processos WHERE id = ?", (processo_id,)).fetchone()
+    processo = load_dados_cliente(st.session_state.cliente_id).processo(processo_id)
     if not processo:
          st.error("Processo não encontrado.")
-         st.session_state.tela = "processos"
-         st.rerun()
+         redirecionar("processos")
     
     st.title("Editar Informações do Processo")
     
-    nome_processo = st.text_input("Nome do Processo", value=processo[0], placeholder="Ex: Conciliação de Saldos Bancários x Razão")
+    nome_processo = st.text_input("Nome do Processo", value=processo.nome, placeholder="Ex: Conciliação de Saldos Bancários x Razão")
     
     tipo_options = ["Conciliação", "Análise Tabular", "Composição de Saldos", "Pagamentos"]
-    default_index = tipo_options.index(processo[1]) if processo[1] in tipo_options else 0
+    default_index = tipo_options.index(processo.tipo) if processo.tipo in tipo_options else 0
     tipo_processo = st.selectbox("Tipo de Processo", options=tipo_options, index=default_index)
     
     freq_options = ["Mensal", "Diária", "Semanal", "Quinzenal", "Específica"]
-    default_index_freq = freq_options.index(processo[2]) if processo[2] in freq_options else 0
+    default_index_freq = freq_options.index(processo.frequencia) if processo.frequencia in freq_options else 0
     frequencia = st.selectbox("Frequência", options=freq_options, index=default_index_freq)
     
     if st.button("Salvar Alterações"):
-         with get_db_connection() as conn:
+         def atualizar(conn):
               conn.execute(
                   "UPDATE processos SET nome = ?, tipo = ?, frequencia = ? WHERE id = ?",
                   (nome_processo, tipo_processo, frequencia, processo_id)
               )
-              conn.commit()
+              encadeamento.atualizar_rotulos(conn, processo_id, encadeamento.rotulo_processo(nome_processo, tipo_processo))
+         escrever(atualizar)
+         st.cache_data.clear()
          st.success("Processo atualizado com sucesso!")
-         st.session_state.tela = "configurar_processo"
-         st.rerun()
+         redirecionar("configurar_processo")
     
-    if st.button("Cancelar"):
-         st.session_state.tela = "configurar_processo"
-         st.rerun()
+    st.button("Cancelar", on_click=navegar, args=("configurar_processo",))
+
+def tela_impacto():
+    """
+    Análise de impacto do processo: quem o alimenta, quem é afetado se ele mudar
+    e quem é afetado se cada um de seus layouts de arquivo mudar.
+    """
+    processo_id = st.session_state.get("processo_id")
+    if not processo_id:
+        st.error("Processo não selecionado.")
+        redirecionar("processos")
+
+    dados = load_dados_cliente(st.session_state.cliente_id)
+    processo = dados.processo(processo_id)
+    nomes = {proc.id: encadeamento.rotulo_processo(proc.nome, proc.tipo) for proc in dados.processos}
+    acima, abaixo, ordem = unidade_trabalho.ler(caminho_banco(), ("impacto", processo_id), lambda conn: (
+        encadeamento.upstream(conn, processo_id),
+        encadeamento.downstream(conn, processo_id),
+        encadeamento.ordem_topologica(conn, st.session_state.cliente_id),
+    ))
+
+    if not processo:
+        st.error("Processo não encontrado.")
+        redirecionar("processos")
+
+    # O catálogo de layouts é compartilhado entre clientes, então o impacto atravessa todos eles
+    impacto_layouts = {}
+    for layout in dados.config(processo_id).layouts:
+        rotulo = layout.rotulo
+        if rotulo and rotulo not in impacto_layouts:
+            impacto_layouts[rotulo] = impacto_layout_global(rotulo)
+
+    st.title(f"Análise de Impacto: {processo.nome}")
+
+    st.subheader("Processos que alimentam este processo")
+    if acima:
+        st.table([{"PROCESSO": nomes.get(pid, pid), "NÍVEL": nivel} for pid, nivel in acima])
+    else:
+        st.info("Nenhum processo alimenta este processo.")
+
+    st.subheader("Processos afetados se este processo mudar")
+    if abaixo:
+        st.table([{"PROCESSO": nomes.get(pid, pid), "NÍVEL": nivel} for pid, nivel in abaixo])
+    else:
+        st.info("Nenhum processo depende deste processo.")
+
+    st.subheader("Processos afetados por mudanças nos layouts")
+    if impacto_layouts:
+        for rotulo, afetados in impacto_layouts.items():
+            with st.expander(f"📗 {rotulo} — {len(afetados)} processo(s)"):
+                st.table(afetados)
+    else:
+        st.info("Este processo não possui layouts de arquivo.")
+
+    st.subheader("Ordem de execução dos processos do cliente")
+    st.table([{"ORDEM": i, "PROCESSO": nomes.get(pid, pid)} for i, pid in enumerate(ordem, start=1)])
+
+    st.button("Voltar", on_click=navegar, args=("configurar_processo",))
+
+def tela_linhagem():
+    """
+    Diagrama consolidado do cliente: layouts compartilhados aparecem uma única vez,
+    encadeamentos ligam processo a processo e os processos são agrupados por tipo.
+    """
+    cliente = load_cliente(st.session_state.cliente_id)
+    if not cliente:
+        st.error("Cliente não encontrado!")
+        redirecionar("login")
+        return
+
+    st.title(f"Diagrama do Cliente - {cliente.nome_empresa}")
+    processos, configs, arestas = load_linhagem(st.session_state.cliente_id)
+    if not processos:
+        st.info("Não há processos cadastrados.")
+    else:
+        tipos = sorted({proc.tipo or "Sem tipo" for proc in processos})
+        # Clientes grandes começam com os grupos recolhidos para o layout do diagrama ser rápido
+        expandir_padrao = tipos if len(processos) <= 30 else []
+        col1, col2 = st.columns([0.75, 0.25])
+        with col1:
+            expandidos = st.multiselect("Grupos expandidos", options=tipos, default=expandir_padrao, key="linhagem_expandidos")
+        with col2:
+            mostrar_retornos = st.checkbox("Exibir retornos", value=True, key="linhagem_retornos")
+        st.caption(
+            f"{len(processos)} processo(s) • "
+            f"{len({l.rotulo for config in configs.values() for l in config.layouts} - {None})} layout(s) distintos • "
+            f"{len(arestas)} encadeamento(s)"
+        )
+        mermaid_code = diagramas.diagrama_cliente(processos, configs, arestas, set(expandidos), mostrar_retornos)
+        components.html(diagramas.html_mermaid(mermaid_code), height=800, scrolling=True)
+
+    st.write("---")
+    st.button("Voltar", on_click=navegar, args=("processos",))
+
+def tela_historico():
+    """Histórico de versões do config do processo e comparação do escopo entre duas datas."""
+    processo_id = st.session_state.get("processo_id")
+    if not processo_id:
+        st.error("Processo não selecionado.")
+        redirecionar("processos")
+
+    processo = load_dados_cliente(st.session_state.cliente_id).processo(processo_id)
+    lista_versoes = unidade_trabalho.ler(
+        caminho_banco(), ("versoes", processo_id), lambda conn: historico.versoes(conn, processo_id)
+    )
+
+    st.title(f"Histórico de Versões: {processo.nome if processo else processo_id}")
+
+    if not lista_versoes:
+        st.info("Nenhuma versão registrada para este processo.")
+    else:
+        st.subheader("Versões Salvas")
+        st.table([
+            {"VERSÃO": versao, "SALVO EM": criado_em, "REGISTRO": "Completo" if snapshot else "Alterações"}
+            for versao, criado_em, snapshot in lista_versoes
+        ])
+
+        st.subheader("Comparar Escopo entre Datas")
+        primeira = datetime.strptime(lista_versoes[-1][1][:10], "%Y-%m-%d").date()
+        col1, col2 = st.columns(2)
+        with col1:
+            data_de = st.date_input("De", value=primeira, key="historico_de")
+        with col2:
+            data_ate = st.date_input("Até", value=date.today(), key="historico_ate")
+        antes, depois = unidade_trabalho.ler(caminho_banco(), None, lambda conn: (
+            historico.reconstruir(conn, processo_id, f"{data_de} 23:59:59"),
+            historico.reconstruir(conn, processo_id, f"{data_ate} 23:59:59"),
+        ))
+        mudancas = historico.diferencas(antes, depois)
+        if mudancas:
+            for mudanca in mudancas:
+                st.write(f"• {mudanca}")
+        else:
+            st.info("Nenhuma alteração no escopo entre as datas selecionadas.")
+
+    st.button("Voltar", on_click=navegar, args=("configurar_processo",))
 
 # ------------------------------------------------------------------
 # Dicionário de Telas
@@ -1436,16 +2241,32 @@ telas = {
     "adicionar_layout": tela_adicionar_layout,
     "diagrama": tela_diagrama,
     "relatorio": tela_relatorio,
-    "editar_processo": tela_editar_processo
+    "portfolio": tela_portfolio,
+    "templates": tela_templates,
+    "duplicados": tela_duplicados,
+    "editar_processo": tela_editar_processo,
+    "impacto": tela_impacto,
+    "linhagem": tela_linhagem,
+    "historico": tela_historico
 }
 
 # ------------------------------------------------------------------
 # Controle de Navegação das Telas
 # ------------------------------------------------------------------
+if "tela_exibida" not in st.session_state:
+    # Primeira execução da sessão: a URL pode trazer um link direto para uma tela
+    abrir_link()
 tela = st.session_state.tela
-if tela in telas:
-    telas[tela]()
-else:
-    st.error("Tela não encontrada!")
-    st.session_state.tela = "login"
-    st.rerun()
+# Indica às telas se esta execução é a primeira desde que o usuário chegou nelas
+st.session_state.nova_tela = st.session_state.get("tela_exibida") != tela
+st.session_state.tela_exibida = tela
+try:
+    if tela in telas:
+        atualizar_link(tela)
+        telas[tela]()
+    else:
+        st.error("Tela não encontrada!")
+        redirecionar("login")
+finally:
+    # Também quando a tela interrompe a execução com st.rerun() ou st.stop()
+    unidade_trabalho.concluir()
@@ -0,0 +1,193 @@
+import argparse
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Callable, List, Optional
+
+# ------------------------------------------------------------------
+# Backups online com snapshots rotativos
+# ------------------------------------------------------------------
+# A cópia usa a API de backup do SQLite em passos de poucas páginas, com uma
+# pausa entre eles: cada passo só segura uma leitura curta e, com o banco em
+# WAL, o escritor continua gravando durante o backup. A cópia é conferida
+# com PRAGMA integrity_check, comprimida (gzip) e entra na rotação que mantém
+# os N snapshots mais recentes de cada banco.
+#
+# Se outra conexão grava no banco durante a cópia, o SQLite recomeça o
+# backup do início; depois de MAX_REINICIOS recomeços o restante é copiado em
+# um passo só, para não ficar preso em um banco muito movimentado.
+#
+# Uso:
+#   python backup.py criar processos.db --destino backups/ --manter 7
+#   python backup.py verificar backups/processos_20250101_120000.db.gz
+
+DIRETORIO_PADRAO = "backups"
+PAGINAS_POR_PASSO = 64
+PAUSA_ENTRE_PASSOS = 0.005
+MAX_REINICIOS = 3
+
+class BackupInvalido(RuntimeError):
+    """A cópia não passou na verificação de integridade."""
+
+class _Reiniciado(Exception):
+    pass
+
+# ------------------------------------------------------------------
+# Cópia, verificação e rotação
+# ------------------------------------------------------------------
+def copiar_online(origem: str, destino: str, paginas: int = PAGINAS_POR_PASSO,
+                  pausa: float = PAUSA_ENTRE_PASSOS, progresso: Optional[Callable[[float], None]] = None) -> int:
+    """
+    Copia `origem` para `destino` pela API de backup, em passos de `paginas` páginas.
+    Retorna quantas vezes a cópia recomeçou por causa de escritas concorrentes.
+    """
+    reinicios = 0
+    restante_anterior = None
+
+    def acompanhar(status, restante, total):
+        nonlocal reinicios, restante_anterior
+        if restante_anterior is not None and restante > restante_anterior:
+            reinicios += 1
+            if reinicios >= MAX_REINICIOS:
+                raise _Reiniciado()
+        restante_anterior = restante
+        if progresso is not None and total:
+            progresso(1 - restante / total)
+
+    with closing(sqlite3.connect(origem, timeout=30)) as fonte, closing(sqlite3.connect(destino)) as copia:
+        try:
+            fonte.backup(copia, pages=paginas, progress=acompanhar, sleep=pausa)
+        except _Reiniciado:
+            print(f"DEBUG: Backup de {origem} reiniciado {reinicios} vez(es); copiando em um passo")
+            fonte.backup(copia)
+    return reinicios
+
+def verificar(caminho: str) -> str:
+    """Roda PRAGMA integrity_check na cópia; levanta BackupInvalido se não for "ok"."""
+    with closing(sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)) as conn:
+        resultado = "; ".join(row[0] for row in conn.execute("PRAGMA integrity_check").fetchall())
+    if resultado != "ok":
+        raise BackupInvalido(f"{caminho}: {resultado}")
+    return resultado
+
+def verificar_snapshot(caminho_gz: str) -> str:
+    """Descomprime um snapshot em um arquivo temporário e verifica sua integridade."""
+    with tempfile.TemporaryDirectory() as temporario:
+        copia = os.path.join(temporario, "snapshot.db")
+        with gzip.open(caminho_gz, "rb") as entrada, open(copia, "wb") as saida:
+            shutil.copyfileobj(entrada, saida)
+        return verificar(copia)
+
+def _prefixo(origem: str) -> str:
+    return os.path.splitext(os.path.basename(origem))[0]
+
+def snapshots(diretorio: str, origem: str) -> List[str]:
+    """Snapshots existentes do banco, do mais recente para o mais antigo."""
+    return sorted(glob.glob(os.path.join(diretorio, f"{_prefixo(origem)}_*.db.gz")), reverse=True)
+
+def rotacionar(diretorio: str, origem: str, manter: int) -> List[str]:
+    """Apaga os snapshots além dos `manter` mais recentes. Retorna os apagados."""
+    antigos = snapshots(diretorio, origem)[manter:]
+    for caminho in antigos:
+        os.remove(caminho)
+    return antigos
+
+def criar_snapshot(origem: str, diretorio: str = DIRETORIO_PADRAO, manter: int = 7,
+                   progresso: Optional[Callable[[float], None]] = None) -> dict:
+    """
+    Copia o banco online, verifica a cópia, grava `<banco>_<AAAAMMDD_HHMMSS>.db.gz`
+    e aplica a rotação. O snapshot só aparece no diretório depois de verificado.
+    """
+    inicio = time.perf_counter()
+    os.makedirs(diretorio, exist_ok=True)
+    marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+    destino = os.path.join(diretorio, f"{_prefixo(origem)}_{marca}.db.gz")
+    with tempfile.TemporaryDirectory(dir=diretorio) as temporario:
+        copia = os.path.join(temporario, "copia.db")
+        reinicios = copiar_online(origem, copia, progresso=progresso)
+        verificar(copia)
+        parcial = os.path.join(temporario, "copia.db.gz")
+        with open(copia, "rb") as entrada, gzip.open(parcial, "wb", compresslevel=6) as saida:
+            shutil.copyfileobj(entrada, saida)
+        tamanho = os.path.getsize(copia)
+        os.replace(parcial, destino)
+    removidos = rotacionar(diretorio, origem, manter)
+    return {
+        "origem": origem,
+        "arquivo": destino,
+        "tamanho": tamanho,
+        "comprimido": os.path.getsize(destino),
+        "reinicios": reinicios,
+        "removidos": removidos,
+        "segundos": time.perf_counter() - inicio,
+    }
+
+def fazer_backup(tarefa, caminhos: List[str], diretorio: str = DIRETORIO_PADRAO, manter: int = 7) -> List[dict]:
+    """Tarefa em segundo plano: um snapshot de cada banco (banco único, partições e catálogo)."""
+    resultados = []
+    for i, caminho in enumerate(caminhos):
+        if not os.path.exists(caminho):
+            continue
+        passo = lambda p, i=i: tarefa.atualizar((i + p) / len(caminhos), f"Copiando {os.path.basename(caminho)}...")
+        resultados.append(criar_snapshot(caminho, diretorio, manter, passo))
+    return resultados
+
+# ------------------------------------------------------------------
+# Agendamento no app
+# ------------------------------------------------------------------
+class Agendador(threading.Thread):
+    """Thread que chama `funcao` a cada `intervalo` segundos (a primeira vez após o intervalo)."""
+
+    def __init__(self, intervalo: float, funcao: Callable[[], None]):
+        super().__init__(name="agendador-backup", daemon=True)
+        self.intervalo = intervalo
+        self.funcao = funcao
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.funcao()
+            except Exception as e:
+                print(f"DEBUG: Erro ao agendar backup: {e}")
+
+    def parar(self) -> None:
+        self._parar.set()
+
+def main():
+    parser = argparse.ArgumentParser(description="Backups online do banco de processos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_criar = sub.add_parser("criar", help="Cria um snapshot comprimido e verificado de cada banco.")
+    p_criar.add_argument("bancos", nargs="+", help="processos.db ou os arquivos das partições (e o catálogo)")
+    p_criar.add_argument("--destino", default=DIRETORIO_PADRAO)
+    p_criar.add_argument("--manter", type=int, default=7, help="Snapshots mantidos por banco")
+    p_verificar = sub.add_parser("verificar", help="Verifica a integridade de snapshots existentes.")
+    p_verificar.add_argument("snapshots", nargs="+")
+    args = parser.parse_args()
+
+    if args.comando == "criar":
+        for caminho in args.bancos:
+            r = criar_snapshot(caminho, args.destino, args.manter)
+            print(
+                f"{r['arquivo']}: {r['tamanho'] / 1024:.0f} KB -> {r['comprimido'] / 1024:.0f} KB em {r['segundos']:.2f}s"
+                f" ({r['reinicios']} reinício(s), {len(r['removidos'])} snapshot(s) antigo(s) removido(s))"
+            )
+    elif args.comando == "verificar":
+        falhas = 0
+        for caminho in args.snapshots:
+            try:
+                print(f"{caminho}: {verificar_snapshot(caminho)}")
+            except (BackupInvalido, OSError, sqlite3.DatabaseError) as e:
+                falhas += 1
+                print(f"{caminho}: FALHOU - {e}")
+        return 1 if falhas else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+import re
+import sqlite3
+from typing import Dict, Iterable, List
+
+import encadeamento
+import historico
+import mudancas
+import recomendacao
+import similaridade
+import versoes
+
+# ------------------------------------------------------------------
+# Schema do banco
+# ------------------------------------------------------------------
+# Usado pelo app e pelos scripts de linha de comando, que não podem importar
+# app.py (ele executa a interface do Streamlit ao ser importado).
+
+def colunas(conn: sqlite3.Connection, tabela: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({tabela})").fetchall()]
+
+def conectar(caminho: str, **kwargs) -> sqlite3.Connection:
+    """Conexão com as chaves estrangeiras ativas (o SQLite as deixa desligadas por padrão)."""
+    conn = sqlite3.connect(caminho, **kwargs)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def criar_schema(conn: sqlite3.Connection) -> None:
+    """Cria as tabelas que faltarem e aplica as migrações de colunas. Não faz commit."""
+    c = conn.cursor()
+    if not c.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        # Arquivo novo: o auto_vacuum só pode mudar sem VACUUM antes da primeira tabela
+        c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cliente (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_empresa TEXT,
+            logo BLOB,
+            nome_pessoa TEXT,
+            cargo TEXT,
+            email TEXT,
+            celular TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cnpjs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero TEXT UNIQUE,
+            cliente_id INTEGER,
+            FOREIGN KEY(cliente_id) REFERENCES cliente(id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS processos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT,
+            tipo TEXT,
+            frequencia TEXT,
+            cliente_id INTEGER,
+            configurado INTEGER DEFAULT 0,
+            FOREIGN KEY(cliente_id) REFERENCES cliente(id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS processo_config (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            processo_id INTEGER,
+            cnpjs TEXT,
+            layouts TEXT,
+            encadeamento TEXT,
+            retorno TEXT,
+            FOREIGN KEY(processo_id) REFERENCES processos(id) ON DELETE CASCADE
+        )
+    ''')
+    # Colunas acrescentadas depois da criação original das tabelas
+    if "descricao" not in colunas(conn, "processos"):
+        c.execute("ALTER TABLE processos ADD COLUMN descricao TEXT")
+    if "versao" not in colunas(conn, "processo_config"):
+        c.execute("ALTER TABLE processo_config ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+    # Bancos criados antes das exclusões em cascata: limpa os órfãos e reconstrói as tabelas
+    pendentes = [tabela for tabela in _TABELAS_CASCATA if not _tem_cascata(conn, tabela)]
+    if pendentes:
+        # As triggers de versão e do registro de mudanças citam as tabelas reconstruídas; são recriadas abaixo
+        versoes.remover_triggers(conn)
+        mudancas.remover_triggers(conn)
+        removidos = remover_orfaos(conn)
+        for tabela in pendentes:
+            _reconstruir_com_cascata(conn, tabela)
+        print(f"DEBUG: Exclusão em cascata aplicada a {', '.join(pendentes)} ({removidos} registro(s) órfão(s) removido(s))")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cnpjs_cliente ON cnpjs(cliente_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_processos_cliente ON processos(cliente_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_config_processo ON processo_config(processo_id)")
+    encadeamento.criar_tabela(conn)
+    versoes.criar_tabela(conn)
+    historico.criar_tabela(conn)
+    mudancas.criar_tabela(conn)
+    similaridade.criar_tabelas(conn)
+    recomendacao.criar_tabelas(conn)
+
+# ------------------------------------------------------------------
+# Exclusão em cascata
+# ------------------------------------------------------------------
+# O schema original declarava as chaves estrangeiras sem ON DELETE e o app
+# nunca ligava PRAGMA foreign_keys, então excluir um processo deixava para
+# trás configs, histórico e arestas. Como o SQLite não altera uma FK
+# existente, as tabelas antigas são reconstruídas uma única vez.
+
+# Tabelas com FK para cliente/processos que precisam de ON DELETE CASCADE (pais antes dos filhos)
+_TABELAS_CASCATA = ["cnpjs", "processos", "processo_config"]
+
+def _tem_cascata(conn: sqlite3.Connection, tabela: str) -> bool:
+    return all(fk[6] == "CASCADE" for fk in conn.execute(f"PRAGMA foreign_key_list({tabela})").fetchall())
+
+def _reconstruir_com_cascata(conn: sqlite3.Connection, tabela: str) -> None:
+    """
+    Recria a tabela com ON DELETE CASCADE em todas as FKs, preservando colunas, dados
+    e o contador do AUTOINCREMENT. Exige foreign_keys desligado: com ele ligado, o
+    DROP TABLE apagaria em cascata as linhas dependentes.
+    """
+    if conn.execute("PRAGMA foreign_keys").fetchone()[0]:
+        raise RuntimeError(f"Reconstrução de {tabela} exige PRAGMA foreign_keys = OFF")
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)).fetchone()[0]
+    nova = re.sub(rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?{tabela}\"?", f"CREATE TABLE {tabela}_nova", sql)
+    nova = re.sub(r"REFERENCES\s+(\w+)\s*\((\w+)\)(?!\s+ON DELETE)", r"REFERENCES \1(\2) ON DELETE CASCADE", nova)
+    sequencia = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabela,)).fetchone()
+    cols = ", ".join(colunas(conn, tabela))
+    conn.execute(nova)
+    conn.execute(f"INSERT INTO {tabela}_nova ({cols}) SELECT {cols} FROM {tabela}")
+    conn.execute(f"DROP TABLE {tabela}")
+    conn.execute(f"ALTER TABLE {tabela}_nova RENAME TO {tabela}")
+    if sequencia:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequencia[0], tabela))
+
+def remover_orfaos(conn: sqlite3.Connection) -> int:
+    """Remove linhas cujo cliente ou processo não existe mais. Retorna quantas foram removidas."""
+    antes = conn.total_changes
+    conn.execute("DELETE FROM cnpjs WHERE cliente_id IS NOT NULL AND cliente_id NOT IN (SELECT id FROM cliente)")
+    conn.execute("DELETE FROM processos WHERE cliente_id IS NOT NULL AND cliente_id NOT IN (SELECT id FROM cliente)")
+    conn.execute("DELETE FROM processo_config WHERE processo_id NOT IN (SELECT id FROM processos)")
+    for tabela, coluna in (
+        ("processo_encadeamento", "origem_id"),
+        ("processo_encadeamento", "destino_id"),
+        ("processo_layout", "processo_id"),
+        ("processo_config_historico", "processo_id"),
+    ):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)).fetchone():
+            conn.execute(f"DELETE FROM {tabela} WHERE {coluna} NOT IN (SELECT id FROM processos)")
+    return conn.total_changes - antes
+
+def expurgar_clientes(conn: sqlite3.Connection, clientes: Iterable[int]) -> Dict[str, int]:
+    """
+    Mutação que exclui os clientes e, em cascata, seus CNPJs, processos, configs,
+    histórico e encadeamentos, tudo na transação de quem chama.
+    Retorna as quantidades excluídas por tabela.
+    """
+    if not conn.execute("PRAGMA foreign_keys").fetchone()[0]:
+        raise RuntimeError("Expurgo exige PRAGMA foreign_keys = ON (use banco.conectar)")
+    clientes = list(clientes)
+    if not clientes:
+        return {"clientes": 0, "processos": 0, "cnpjs": 0}
+    marcadores = ",".join("?" * len(clientes))
+    quantidades = {
+        "processos": conn.execute(f"SELECT COUNT(*) FROM processos WHERE cliente_id IN ({marcadores})", clientes).fetchone()[0],
+        "cnpjs": conn.execute(f"SELECT COUNT(*) FROM cnpjs WHERE cliente_id IN ({marcadores})", clientes).fetchone()[0],
+    }
+    quantidades["clientes"] = conn.execute(f"DELETE FROM cliente WHERE id IN ({marcadores})", clientes).rowcount
+    return quantidades
+
+# ------------------------------------------------------------------
+# Recuperação de espaço (auto_vacuum incremental)
+# ------------------------------------------------------------------
+# Arquivos novos já nascem com auto_vacuum = INCREMENTAL (criar_schema). Bancos
+# antigos precisam de um VACUUM completo, feito uma única vez e fora do app
+# (python manutencao.py converter), porque ele trava todas as escritas enquanto dura.
+def vacuum_incremental_ativo(conn: sqlite3.Connection) -> bool:
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def recuperar_espaco(conn: sqlite3.Connection, max_paginas: int = 256) -> int:
+    """
+    Devolve ao sistema de arquivos até `max_paginas` páginas livres. Passos pequenos
+    seguram o lock de escrita por pouco tempo. Retorna as páginas liberadas.
+    """
+    livres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not livres:
+        return 0
+    # O módulo sqlite3 avança o pragma um único passo (uma página) por execute
+    for _ in range(min(livres, max_paginas)):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+    return livres - conn.execute("PRAGMA freelist_count").fetchone()[0]
@@ -0,0 +1,266 @@
+import argparse
+import sqlite3
+import time
+import unicodedata
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import modelos
+
+# ------------------------------------------------------------------
+# Calendário de execuções projetado a partir da frequência dos processos
+# ------------------------------------------------------------------
+# Cada processo tem uma frequência (Diária, Semanal, Quinzenal, Mensal ou
+# Específica). A projeção transforma isso em carga operacional: quantas
+# execuções e quantas chegadas de arquivos de entrada cada cliente terá por
+# dia no horizonte escolhido, considerando só dias úteis:
+#   - Diária: todo dia útil;
+#   - Semanal: primeiro dia útil de cada semana (segunda ou o seguinte);
+#   - Quinzenal: dias 1 e 16 de cada mês, adiados para o dia útil seguinte;
+#   - Mensal: primeiro dia útil do mês;
+#   - Específica (ou desconhecida): sem agenda, não entra na projeção.
+# Os dias úteis usam os feriados nacionais calculados aqui (fixos e móveis,
+# a partir da Páscoa), com ou sem Carnaval e Corpus Christi (calendário
+# bancário), e a aritmética de datas é vetorizada com numpy (busday_offset).
+# As datas de cada frequência são calculadas uma vez; a carga por cliente é
+# o produto da matriz (cliente x frequência) de processos pela matriz
+# (frequência x dia) de execuções, então milhares de processos em um ano de
+# horizonte não custam mais que algumas frequências.
+#
+# Uso:
+#   python calendario.py processos.db --dias 365
+
+CALENDARIOS = {"bancario": "Bancário (com Carnaval e Corpus Christi)", "nacional": "Feriados nacionais"}
+FREQUENCIAS = ("Diária", "Semanal", "Quinzenal", "Mensal")
+DIAS_SEMANA = ("Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom")
+MESES = ("Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez")
+
+# ------------------------------------------------------------------
+# Feriados e dias úteis
+# ------------------------------------------------------------------
+def pascoa(ano: int) -> date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher, calendário gregoriano)."""
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(ano, mes, dia + 1)
+
+def feriados(ano_inicial: int, ano_final: int, bancario: bool = True) -> List[date]:
+    """Feriados nacionais dos anos (inclusive); `bancario` inclui Carnaval e Corpus Christi."""
+    datas = []
+    for ano in range(ano_inicial, ano_final + 1):
+        fixos = [(1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25)]
+        if ano >= 2024:
+            fixos.append((11, 20))  # Dia da Consciência Negra (Lei 14.759/2023)
+        datas.extend(date(ano, mes, dia) for mes, dia in fixos)
+        domingo = pascoa(ano)
+        datas.append(domingo - timedelta(days=2))  # Sexta-feira Santa
+        if bancario:
+            datas.extend([domingo - timedelta(days=48), domingo - timedelta(days=47), domingo + timedelta(days=60)])
+    return sorted(datas)
+
+def dias_uteis(inicio: date, fim: date, bancario: bool = True) -> np.busdaycalendar:
+    return np.busdaycalendar(holidays=feriados(inicio.year, fim.year + 1, bancario))
+
+def _chave_frequencia(frequencia: Optional[str]) -> str:
+    texto = unicodedata.normalize("NFKD", frequencia or "").strip().lower()
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+_REGRAS = {_chave_frequencia(f): f for f in FREQUENCIAS}
+
+def datas_execucao(frequencia: str, inicio: date, fim: date, calendario: np.busdaycalendar) -> np.ndarray:
+    """Datas (datetime64[D]) das execuções da frequência no intervalo [inicio, fim)."""
+    frequencia = _REGRAS.get(_chave_frequencia(frequencia))
+    primeiro, ultimo = np.datetime64(inicio, "D"), np.datetime64(fim, "D")
+    if frequencia == "Diária":
+        dias = np.arange(primeiro, ultimo)
+        return dias[np.is_busday(dias, busdaycal=calendario)]
+    if frequencia == "Semanal":
+        # 1970-01-05 foi uma segunda-feira
+        segunda = primeiro - (primeiro - np.datetime64("1970-01-05")).astype(int) % 7
+        bases = np.arange(segunda, ultimo, 7)
+    elif frequencia in ("Quinzenal", "Mensal"):
+        meses = np.arange(primeiro.astype("datetime64[M]"), ultimo.astype("datetime64[M]") + 1).astype("datetime64[D]")
+        bases = meses if frequencia == "Mensal" else np.sort(np.concatenate([meses, meses + 15]))
+    else:
+        return np.array([], dtype="datetime64[D]")
+    datas = np.busday_offset(bases, 0, roll="forward", busdaycal=calendario)
+    return np.unique(datas[(datas >= primeiro) & (datas < ultimo)])
+
+# ------------------------------------------------------------------
+# Projeção
+# ------------------------------------------------------------------
+@dataclass
+class Projecao:
+    """Carga por cliente (linhas) e por dia (colunas) no horizonte."""
+    dias: np.ndarray            # datetime64[D], todos os dias corridos do horizonte
+    clientes: List[int]
+    execucoes: np.ndarray       # int (clientes x dias)
+    chegadas: np.ndarray        # int (clientes x dias): arquivos de entrada esperados
+    sem_agenda: Dict[int, int]  # processos de frequência Específica (ou desconhecida) por cliente
+    bancario: bool
+
+    def do_cliente(self, cliente_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        if cliente_id not in self.clientes:
+            zeros = np.zeros(len(self.dias), dtype=int)
+            return zeros, zeros
+        linha = self.clientes.index(cliente_id)
+        return self.execucoes[linha], self.chegadas[linha]
+
+def projetar(processos: Iterable[Tuple[int, str, int]], inicio: date, dias: int, bancario: bool = True) -> Projecao:
+    """
+    Projeta as execuções de (cliente_id, frequencia, arquivos_de_entrada) de cada processo
+    nos `dias` dias corridos a partir de `inicio`.
+    """
+    fim = inicio + timedelta(days=dias)
+    calendario = dias_uteis(inicio, fim, bancario)
+    primeiro = np.datetime64(inicio, "D")
+
+    # Matriz frequência x dia (1 nos dias de execução), uma linha por frequência
+    agenda = np.zeros((len(FREQUENCIAS), dias), dtype=np.int64)
+    for linha, frequencia in enumerate(FREQUENCIAS):
+        agenda[linha, (datas_execucao(frequencia, inicio, fim, calendario) - primeiro).astype(int)] = 1
+
+    # Matrizes cliente x frequência com a quantidade de processos e de arquivos
+    indice_cliente: Dict[int, int] = {}
+    sem_agenda: Dict[int, int] = {}
+    celulas: List[Tuple[int, int, int]] = []
+    for cliente_id, frequencia, arquivos in processos:
+        linha = indice_cliente.setdefault(cliente_id, len(indice_cliente))
+        regra = _REGRAS.get(_chave_frequencia(frequencia))
+        if regra is None:
+            sem_agenda[cliente_id] = sem_agenda.get(cliente_id, 0) + 1
+            continue
+        celulas.append((linha, FREQUENCIAS.index(regra), arquivos))
+    processos_freq = np.zeros((len(indice_cliente), len(FREQUENCIAS)), dtype=np.int64)
+    arquivos_freq = np.zeros_like(processos_freq)
+    if celulas:
+        linhas, colunas, arquivos = (np.array(v) for v in zip(*celulas))
+        np.add.at(processos_freq, (linhas, colunas), 1)
+        np.add.at(arquivos_freq, (linhas, colunas), arquivos)
+
+    return Projecao(
+        dias=np.arange(primeiro, primeiro + dias),
+        clientes=list(indice_cliente),
+        execucoes=processos_freq @ agenda,
+        chegadas=arquivos_freq @ agenda,
+        sem_agenda=sem_agenda,
+        bancario=bancario,
+    )
+
+def processos_do_cliente(cliente_id: int, dados: modelos.DadosCliente) -> List[Tuple[int, str, int]]:
+    """(cliente_id, frequencia, arquivos de entrada) de cada processo; encadeamentos não são arquivos."""
+    return [
+        (
+            cliente_id,
+            proc.frequencia,
+            sum(1 for layout in dados.config(proc.id).layouts if layout.tipo == "Arquivo"),
+        )
+        for proc in dados.processos
+    ]
+
+def processos_do_banco(conn: sqlite3.Connection) -> List[Tuple[int, str, int]]:
+    """Os mesmos dados de processos_do_cliente, para todos os clientes do arquivo em uma consulta."""
+    return [
+        (cliente_id, frequencia, arquivos or 0)
+        for cliente_id, frequencia, arquivos in conn.execute("""
+            SELECT p.cliente_id, p.frequencia, (
+                SELECT COUNT(*) FROM json_each(CASE WHEN json_valid(c.layouts) THEN c.layouts ELSE '[]' END)
+                WHERE json_extract(json_each.value, '$.tipo') = 'Arquivo'
+            )
+            FROM processos p
+            LEFT JOIN processo_config c ON c.processo_id = p.id
+        """)
+    ]
+
+# ------------------------------------------------------------------
+# Mapa de calor
+# ------------------------------------------------------------------
+def html_mapa_calor(dias: np.ndarray, valores: np.ndarray, rotulo: str, bancario: bool = True) -> str:
+    """
+    Mapa de calor no formato de calendário: uma coluna por semana, uma linha por dia da
+    semana, a cor proporcional ao valor do dia. Feriados aparecem hachurados.
+    """
+    if len(dias) == 0:
+        return ""
+    calendario = dias_uteis(dias[0].astype(date), dias[-1].astype(date), bancario)
+    uteis = np.is_busday(dias, busdaycal=calendario)
+    maximo = max(int(valores.max()), 1)
+    segunda = dias[0] - (dias[0] - np.datetime64("1970-01-05")).astype(int) % 7
+    semanas = int((dias[-1] - segunda).astype(int) // 7) + 1
+    grade = [["" for _ in range(semanas)] for _ in range(7)]
+    meses = [""] * semanas
+    for dia, valor, util in zip(dias, valores, uteis):
+        deslocamento = int((dia - segunda).astype(int))
+        semana, dia_semana = divmod(deslocamento, 7)
+        data = dia.astype(date)
+        if data.day <= 7 and not meses[semana]:
+            meses[semana] = MESES[data.month - 1]
+        if valor:
+            intensidade = 0.15 + 0.85 * int(valor) / maximo
+            fundo = f"rgba(21, 101, 192, {intensidade:.2f})"
+        elif util or dia_semana >= 5:
+            fundo = "#eef1f4"
+        else:
+            fundo = "repeating-linear-gradient(45deg, #eef1f4, #eef1f4 2px, #d5dae0 2px, #d5dae0 4px)"
+        titulo = f"{data:%d/%m/%Y}: {int(valor)} {rotulo}" + ("" if util or dia_semana >= 5 else " (feriado)")
+        grade[dia_semana][semana] = f"<td title='{titulo}' style='background:{fundo}'></td>"
+    celula = "<td></td>"
+    linhas = ["<tr><th></th>" + "".join(f"<th>{mes}</th>" for mes in meses) + "</tr>"]
+    for dia_semana, nome in enumerate(DIAS_SEMANA):
+        linhas.append(f"<tr><th>{nome}</th>" + "".join(c or celula for c in grade[dia_semana]) + "</tr>")
+    return (
+        "<style>"
+        ".mapa-calor{border-collapse:separate;border-spacing:2px;font-size:0.7rem;color:#666}"
+        ".mapa-calor td{width:13px;height:13px;border-radius:2px;padding:0}"
+        ".mapa-calor th{font-weight:normal;text-align:left;padding:0 4px 0 0}"
+        "</style>"
+        f"<div style='overflow-x:auto'><table class='mapa-calor'>{''.join(linhas)}</table></div>"
+    )
+
+def dias_de_pico(dias: np.ndarray, execucoes: np.ndarray, chegadas: np.ndarray, quantidade: int = 5) -> List[dict]:
+    ordem = np.lexsort((dias, -chegadas, -execucoes))[:quantidade]
+    return [
+        {
+            "DIA": f"{dias[i].astype(date):%d/%m/%Y} ({DIAS_SEMANA[dias[i].astype(date).weekday()]})",
+            "EXECUÇÕES": int(execucoes[i]),
+            "ARQUIVOS": int(chegadas[i]),
+        }
+        for i in ordem if execucoes[i]
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Projeção das execuções dos processos por dia e cliente.")
+    parser.add_argument("bancos", nargs="+")
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--nacional", action="store_true", help="Sem Carnaval e Corpus Christi.")
+    args = parser.parse_args()
+
+    processos = []
+    for caminho in args.bancos:
+        with closing(sqlite3.connect(caminho, timeout=30)) as conn:
+            processos.extend(processos_do_banco(conn))
+    inicio = time.perf_counter()
+    projecao = projetar(processos, date.today(), args.dias, bancario=not args.nacional)
+    segundos = time.perf_counter() - inicio
+    totais = projecao.execucoes.sum(axis=0)
+    pico = int(totais.argmax()) if len(totais) else 0
+    print(
+        f"{len(processos)} processo(s) de {len(projecao.clientes)} cliente(s) projetados em {args.dias} dia(s) "
+        f"em {segundos * 1000:.1f} ms: {int(totais.sum())} execução(ões), "
+        f"{int(projecao.chegadas.sum())} arquivo(s); pico em {projecao.dias[pico]} com {int(totais[pico])} execução(ões); "
+        f"{sum(projecao.sem_agenda.values())} processo(s) sem agenda"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import banco
+import encadeamento
+import escritor
+
+# ------------------------------------------------------------------
+# Teste de carga com sessões simultâneas
+# ------------------------------------------------------------------
+# Cada usuário virtual é uma sessão headless do Streamlit (AppTest) que
+# percorre o fluxo de um consultor: login -> visão do cliente -> processos ->
+# salvar a configuração de um processo -> relatório. O AppTest usa um Runtime
+# global por processo, então cada sessão roda em um processo próprio; todas
+# gravam no mesmo arquivo, e a disputa pelo lock do SQLite aparece nas
+# estatísticas dos escritores. O banco é sintético e criado em um diretório
+# temporário; o processos.db do projeto nunca é tocado.
+#
+# Uso:
+#   python carga.py executar --sessoes 8 --fluxos 5 --saida carga_v1.json
+#   python carga.py comparar carga_v1.json carga_v2.json
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+TIPOS = ["Conciliação", "Análise Tabular", "Composição de Saldos", "Pagamentos"]
+FREQUENCIAS = ["Mensal", "Diária", "Semanal", "Quinzenal", "Específica"]
+ARQUIVOS = ["Excel", "CSV", "TXT", "OFX", "CNAB", "SPED", "XML", "API", "PDF"]
+PASSOS = ["login", "visao_cliente", "processos", "configurar_processo", "salvar", "relatorio"]
+
+# ------------------------------------------------------------------
+# Banco sintético
+# ------------------------------------------------------------------
+def gerar_banco(caminho: str, clientes: int = 20, processos_por_cliente: int = 15, semente: int = 42) -> None:
+    """Cria um banco com clientes, CNPJs, processos e configs (com encadeamentos) aleatórios."""
+    aleatorio = random.Random(semente)
+    with closing(sqlite3.connect(caminho)) as conn:
+        banco.criar_schema(conn)
+        for c in range(1, clientes + 1):
+            cliente_id = conn.execute(
+                "INSERT INTO cliente (nome_empresa, nome_pessoa, cargo, email, celular) VALUES (?, ?, ?, ?, ?)",
+                (f"Empresa {c}", f"Consultor {c}", "Gerente", f"contato{c}@empresa.com", "11999999999")
+            ).lastrowid
+            for n in range(aleatorio.randint(1, 4)):
+                conn.execute(
+                    "INSERT INTO cnpjs (numero, cliente_id) VALUES (?, ?)",
+                    (f"{c:02d}.{n:03d}.000/0001-{aleatorio.randint(10, 99)}", cliente_id)
+                )
+            anteriores = []
+            for p in range(1, processos_por_cliente + 1):
+                tipo = aleatorio.choice(TIPOS)
+                processo_id = conn.execute(
+                    "INSERT INTO processos (nome, tipo, frequencia, cliente_id, configurado) VALUES (?, ?, ?, ?, 1)",
+                    (f"Processo {p}", tipo, aleatorio.choice(FREQUENCIAS), cliente_id)
+                ).lastrowid
+                # O primeiro layout é sempre um arquivo novo: o fluxo de carga edita o seu nome
+                layouts = [
+                    {"tipo": "Arquivo", "modo": "novo", "arquivo_tipo": aleatorio.choice(ARQUIVOS),
+                     "detalhe": "", "nome": f"Layout {p}.{i}"}
+                    for i in range(1, aleatorio.randint(2, 5))
+                ]
+                if anteriores and aleatorio.random() < 0.3:
+                    origem_id, origem_rotulo = aleatorio.choice(anteriores)
+                    layouts.append({"tipo": "Encadeamento", "processo": origem_rotulo, "processo_id": origem_id})
+                retorno = {"tipo": aleatorio.choice(["CSV", "XML", "TXT", "JSON"]), "proposito": "Retorno ao ERP"}
+                conn.execute(
+                    "INSERT INTO processo_config (processo_id, cnpjs, layouts, encadeamento, retorno, versao) "
+                    "VALUES (?, '[]', ?, '', ?, 1)",
+                    (processo_id, json.dumps(layouts), json.dumps(retorno))
+                )
+                anteriores.append((processo_id, f"Processo {p} - {tipo}"))
+        conn.commit()
+    with closing(sqlite3.connect(caminho)) as conn:
+        # Recria o índice de encadeamentos a partir dos configs inseridos acima
+        encadeamento.reconstruir_indice(conn)
+        conn.commit()
+
+# ------------------------------------------------------------------
+# Sessão virtual
+# ------------------------------------------------------------------
+class Medicoes:
+    """Amostras de latência por passo e contadores de uma sessão (ou a soma de várias)."""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = {passo: [] for passo in PASSOS}
+        self.erros: Dict[str, int] = {}
+        self.conflitos = 0
+        self.fluxos = 0
+        self.reexecucoes = 0
+        self.escrita = {"mutacoes": 0, "lotes": 0, "espera_fila_s": 0.0, "espera_lock_s": 0.0, "tentativas_lock": 0, "erros": 0}
+
+    def registrar(self, passo: str, segundos: float) -> None:
+        self.latencias[passo].append(segundos)
+        self.reexecucoes += 1
+
+    def erro(self, tipo: str) -> None:
+        self.erros[tipo] = self.erros.get(tipo, 0) + 1
+
+    def somar(self, outra: "Medicoes") -> None:
+        for passo, amostras in outra.latencias.items():
+            self.latencias[passo].extend(amostras)
+        for tipo, total in outra.erros.items():
+            self.erros[tipo] = self.erros.get(tipo, 0) + total
+        self.conflitos += outra.conflitos
+        self.fluxos += outra.fluxos
+        self.reexecucoes += outra.reexecucoes
+        for chave in self.escrita:
+            self.escrita[chave] += outra.escrita.get(chave, 0)
+
+def _executar(at, passo: str, medicoes: Medicoes, acao=None):
+    """Executa uma reexecução do script (opcionalmente após uma ação) medindo a latência."""
+    inicio = time.perf_counter()
+    (acao() if acao else at).run()
+    medicoes.registrar(passo, time.perf_counter() - inicio)
+    if at.exception:
+        raise RuntimeError(f"{passo}: {at.exception[0].value}")
+
+def _botao(at, rotulo: str = None, chave: str = None):
+    for botao in at.button:
+        if (rotulo is not None and rotulo in botao.label) or (chave is not None and botao.key == chave):
+            return botao
+    raise LookupError(f"botão {rotulo or chave} não encontrado na tela {at.session_state.tela}")
+
+def fluxo(app: str, cliente_id: int, medicoes: Medicoes, aleatorio: random.Random, espera_relatorio: float) -> None:
+    """Um consultor percorrendo as telas do início ao relatório."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(app, default_timeout=120)
+    _executar(at, "login", medicoes)
+    at.text_input[0].input(str(cliente_id))
+    _executar(at, "visao_cliente", medicoes, lambda: _botao(at, "Entrar").click())
+    _executar(at, "processos", medicoes, lambda: _botao(at, "Continuar para Processos").click())
+
+    editar = [botao for botao in at.button if (botao.key or "").startswith("config_")]
+    if not editar:
+        raise LookupError("cliente sem processos")
+    _executar(at, "configurar_processo", medicoes, lambda: aleatorio.choice(editar).click())
+
+    nome = next((campo for campo in at.text_input if campo.key == "nome_layout_1"), None)
+    if nome is not None:
+        nome.input(f"Layout editado {aleatorio.randint(1, 10 ** 6)}")
+    _executar(at, "salvar", medicoes, lambda: _botao(at, "Salvar Processo").click())
+    if any("alterado em outra sessão" in erro.value for erro in at.error):
+        medicoes.conflitos += 1
+
+    _botao(at, "Voltar para Processos").click().run()
+    # O relatório roda em segundo plano: o passo vai do clique até as tabelas aparecerem
+    inicio = time.perf_counter()
+    _botao(at, "Gerar Relatório").click().run()
+    limite = inicio + espera_relatorio
+    while not at.table and not at.exception and time.perf_counter() < limite:
+        medicoes.reexecucoes += 1
+        time.sleep(0.2)
+        at.run()
+    medicoes.registrar("relatorio", time.perf_counter() - inicio)
+    if not at.table:
+        raise TimeoutError("relatório não concluído")
+    medicoes.fluxos += 1
+
+def usuario(diretorio: str, app: str, clientes: int, fluxos: int, semente: int, espera_relatorio: float) -> Medicoes:
+    """Sessão virtual, executada em um processo próprio; devolve as medições e as estatísticas dos escritores."""
+    # O app usa caminhos relativos (processos.db, logo): roda de dentro do diretório temporário
+    os.chdir(diretorio)
+    medicoes = Medicoes()
+    aleatorio = random.Random(semente)
+    for _ in range(fluxos):
+        try:
+            fluxo(app, aleatorio.randint(1, clientes), medicoes, aleatorio, espera_relatorio)
+        except Exception as e:
+            print(f"DEBUG: Erro na sessão de carga: {e}")
+            medicoes.erro(type(e).__name__)
+    medicoes.escrita = {chave: valor for chave, valor in escritor.estatisticas_totais().items() if chave in medicoes.escrita}
+    return medicoes
+
+# ------------------------------------------------------------------
+# Execução e relatório
+# ------------------------------------------------------------------
+def percentil(amostras: List[float], p: float) -> Optional[float]:
+    if not amostras:
+        return None
+    ordenadas = sorted(amostras)
+    posicao = (len(ordenadas) - 1) * p / 100
+    base = int(posicao)
+    resto = posicao - base
+    proxima = ordenadas[min(base + 1, len(ordenadas) - 1)]
+    return ordenadas[base] + (proxima - ordenadas[base]) * resto
+
+def _resumo(amostras: List[float]) -> dict:
+    return {
+        "n": len(amostras),
+        "p50_ms": _ms(percentil(amostras, 50)),
+        "p95_ms": _ms(percentil(amostras, 95)),
+        "p99_ms": _ms(percentil(amostras, 99)),
+        "max_ms": _ms(max(amostras) if amostras else None),
+    }
+
+def _ms(segundos: Optional[float]) -> Optional[float]:
+    return None if segundos is None else round(segundos * 1000, 2)
+
+def _versao_codigo() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "desconhecida"
+
+def executar(sessoes: int = 4, fluxos: int = 3, clientes: int = 20, processos_por_cliente: int = 15,
+             semente: int = 42, espera_relatorio: float = 60.0) -> dict:
+    """Roda o teste de carga em um diretório temporário e devolve as métricas."""
+    diretorio = tempfile.mkdtemp(prefix="carga_")
+    try:
+        gerar_banco(os.path.join(diretorio, "processos.db"), clientes, processos_por_cliente, semente)
+        shutil.copy(os.path.join(RAIZ, "logo_dattos.png"), diretorio)
+        medicoes = Medicoes()
+        app = os.path.join(RAIZ, "app.py")
+        contexto = multiprocessing.get_context("spawn")
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=sessoes, mp_context=contexto) as pool:
+            futuros = [
+                pool.submit(usuario, diretorio, app, clientes, fluxos, semente + i, espera_relatorio)
+                for i in range(sessoes)
+            ]
+            for futuro in futuros:
+                try:
+                    medicoes.somar(futuro.result())
+                except Exception as e:
+                    print(f"DEBUG: Sessão de carga abortada: {e}")
+                    medicoes.erro(type(e).__name__)
+        duracao = time.perf_counter() - inicio
+        estatisticas = medicoes.escrita
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    todas = [s for amostras in medicoes.latencias.values() for s in amostras]
+    return {
+        "executado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "codigo": _versao_codigo(),
+        "ambiente": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "plataforma": platform.platform()},
+        "parametros": {
+            "sessoes": sessoes, "fluxos": fluxos, "clientes": clientes,
+            "processos_por_cliente": processos_por_cliente, "semente": semente,
+        },
+        "duracao_s": round(duracao, 2),
+        "fluxos_concluidos": medicoes.fluxos,
+        "vazao": {
+            "fluxos_por_s": round(medicoes.fluxos / duracao, 3) if duracao else None,
+            "reexecucoes_por_s": round(medicoes.reexecucoes / duracao, 2) if duracao else None,
+        },
+        "latencia": {"geral": _resumo(todas), **{passo: _resumo(amostras) for passo, amostras in medicoes.latencias.items()}},
+        "escrita": {
+            "mutacoes": estatisticas["mutacoes"],
+            "lotes": estatisticas["lotes"],
+            "espera_fila_ms": _ms(estatisticas["espera_fila_s"]),
+            "espera_lock_ms": _ms(estatisticas["espera_lock_s"]),
+            "espera_media_por_mutacao_ms": _ms(
+                (estatisticas["espera_fila_s"] + estatisticas["espera_lock_s"]) / estatisticas["mutacoes"]
+            ) if estatisticas["mutacoes"] else None,
+            "tentativas_lock": estatisticas["tentativas_lock"],
+            "erros": estatisticas["erros"],
+        },
+        "erros": {"total": sum(medicoes.erros.values()), **medicoes.erros},
+        "conflitos_de_versao": medicoes.conflitos,
+    }
+
+def imprimir(resultado: dict) -> None:
+    p = resultado["parametros"]
+    print(f"\n{p['sessoes']} sessão(ões) x {p['fluxos']} fluxo(s) em {resultado['duracao_s']}s (código {resultado['codigo']})")
+    print(f"Fluxos concluídos: {resultado['fluxos_concluidos']}  |  "
+          f"{resultado['vazao']['fluxos_por_s']} fluxos/s  |  {resultado['vazao']['reexecucoes_por_s']} reexecuções/s")
+    print(f"\n{'PASSO':<22}{'N':>6}{'P50 ms':>10}{'P95 ms':>10}{'P99 ms':>10}{'MÁX ms':>10}")
+    for passo, r in resultado["latencia"].items():
+        valores = [r[k] if r[k] is not None else "-" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{passo:<22}{r['n']:>6}" + "".join(f"{v:>10}" for v in valores))
+    e = resultado["escrita"]
+    print(f"\nEscritas: {e['mutacoes']} mutação(ões) em {e['lotes']} lote(s); espera na fila {e['espera_fila_ms']} ms, "
+          f"no lock {e['espera_lock_ms']} ms ({e['tentativas_lock']} tentativa(s)); média {e['espera_media_por_mutacao_ms']} ms/mutação")
+    print(f"Erros: {resultado['erros']}  |  Conflitos de versão: {resultado['conflitos_de_versao']}")
+
+def comparar(base: dict, nova: dict) -> None:
+    """Mostra lado a lado as métricas principais de duas execuções exportadas."""
+    def linha(nome, a, b):
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)) and a:
+            variacao = f"{(b - a) / a * 100:+.1f}%"
+        else:
+            variacao = ""
+        print(f"{nome:<34}{str(a):>12}{str(b):>12}{variacao:>10}")
+
+    print(f"{'MÉTRICA':<34}{base['codigo']:>12}{nova['codigo']:>12}{'VAR':>10}")
+    linha("fluxos/s", base["vazao"]["fluxos_por_s"], nova["vazao"]["fluxos_por_s"])
+    linha("reexecuções/s", base["vazao"]["reexecucoes_por_s"], nova["vazao"]["reexecucoes_por_s"])
+    for passo in base["latencia"]:
+        for chave in ("p50_ms", "p95_ms", "p99_ms"):
+            linha(f"{passo} {chave}", base["latencia"][passo][chave], nova["latencia"].get(passo, {}).get(chave))
+    linha("espera média por mutação (ms)", base["escrita"]["espera_media_por_mutacao_ms"], nova["escrita"]["espera_media_por_mutacao_ms"])
+    linha("erros", base["erros"]["total"], nova["erros"]["total"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do app com sessões simultâneas.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_exec = sub.add_parser("executar", help="Roda o teste de carga em um banco sintético.")
+    p_exec.add_argument("--sessoes", type=int, default=4, help="Sessões simultâneas")
+    p_exec.add_argument("--fluxos", type=int, default=3, help="Fluxos completos por sessão")
+    p_exec.add_argument("--clientes", type=int, default=20, help="Clientes no banco sintético")
+    p_exec.add_argument("--processos", type=int, default=15, help="Processos por cliente")
+    p_exec.add_argument("--semente", type=int, default=42)
+    p_exec.add_argument("--saida", default="", help="Arquivo JSON para exportar o resultado")
+    p_comp = sub.add_parser("comparar", help="Compara dois resultados exportados.")
+    p_comp.add_argument("base")
+    p_comp.add_argument("nova")
+    args = parser.parse_args()
+
+    if args.comando == "executar":
+        resultado = executar(args.sessoes, args.fluxos, args.clientes, args.processos, args.semente)
+        imprimir(resultado)
+        if args.saida:
+            with open(args.saida, "w", encoding="utf-8") as f:
+                json.dump(resultado, f, ensure_ascii=False, indent=2)
+            print(f"\nResultado exportado para {args.saida}")
+    elif args.comando == "comparar":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.nova, encoding="utf-8") as f:
+            nova = json.load(f)
+        comparar(base, nova)
+
+if __name__ == "__main__":
+    sys.exit(main())
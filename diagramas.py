@@ -0,0 +1,179 @@
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from modelos import ConfigProcesso, Layout, Processo, Retorno
+
+# ------------------------------------------------------------------
+# Diagrama consolidado do cliente (linhagem)
+# ------------------------------------------------------------------
+# Layouts de arquivo idênticos viram um único nó compartilhado, os
+# encadeamentos são desenhados como arestas processo -> processo e os
+# processos são agrupados em subgrafos por tipo. Grupos recolhidos viram
+# um único nó, o que mantém o diagrama pequeno para clientes grandes.
+
+CLASSES_MERMAID = [
+    "  classDef arquivo fill:#E0F7FA,stroke:#00ACC1,stroke-width:1.5px,color:#006064,stroke-dasharray: 5 5",
+    "  classDef processo fill:#E8EAF6,stroke:#3949AB,stroke-width:2px,color:#1A237E",
+    "  classDef retorno fill:#FFF3E0,stroke:#FB8C00,stroke-width:1.5px,color:#E65100",
+    "  classDef encadeamento fill:#FCE4EC,stroke:#E91E63,stroke-width:1.5px,color:#880E4F,stroke-dasharray: 5 2",
+    "  classDef grupo fill:#EDE7F6,stroke:#5E35B1,stroke-width:2px,color:#311B92",
+]
+
+def _texto(s: str) -> str:
+    """Remove acentos e aspas que quebram os rótulos do Mermaid.js."""
+    nfkd = unicodedata.normalize('NFKD', str(s))
+    return "".join([c for c in nfkd if not unicodedata.combining(c)]).replace('"', "'")
+
+def diagrama_cliente(
+    processos: Iterable[Processo],
+    configs: Dict[int, ConfigProcesso],
+    arestas: Iterable[Tuple[int, int]],
+    expandidos: Optional[Set[str]] = None,
+    mostrar_retornos: bool = True
+) -> str:
+    """
+    Gera o código Mermaid do diagrama consolidado do cliente.
+
+    processos: processos do cliente, como em load_processos.
+    configs: {processo_id: ConfigProcesso} já decodificados.
+    arestas: pares (origem_id, destino_id) do índice de encadeamentos.
+    expandidos: tipos de processo exibidos em detalhe; None expande todos.
+    """
+    processos = list(processos)
+    tipos: Dict[str, List[Processo]] = {}
+    for proc in processos:
+        tipos.setdefault(proc.tipo or "Sem tipo", []).append(proc)
+
+    grupo_ids = {tipo: f"T{i}" for i, tipo in enumerate(sorted(tipos), start=1)}
+    no_processo: Dict[int, str] = {}
+    for tipo, procs in tipos.items():
+        recolhido = expandidos is not None and tipo not in expandidos
+        for proc in procs:
+            no_processo[proc.id] = grupo_ids[tipo] if recolhido else f"P{proc.id}"
+
+    linhas = [
+        "---",
+        "config:",
+        "   theme: neutral",
+        "---",
+        "flowchart LR",
+        "  %% Estilos Modernos",
+        *CLASSES_MERMAID,
+        "",
+        "  %% Layouts compartilhados",
+    ]
+
+    nos_layout: Dict[str, str] = {}
+    conexoes: List[str] = []
+    vistas: Set[Tuple[str, str]] = set()
+
+    def conecta(origem: str, destino: str, seta: str = "-->") -> None:
+        if origem == destino or (origem, destino) in vistas:
+            return
+        vistas.add((origem, destino))
+        conexoes.append(f"  {origem} {seta} {destino}")
+
+    for proc in processos:
+        config = configs.get(proc.id)
+        for layout in config.layouts if config else ():
+            rotulo = layout.rotulo
+            if rotulo is None:
+                continue
+            if rotulo not in nos_layout:
+                nos_layout[rotulo] = f"L{len(nos_layout) + 1}"
+                linhas.append(f'  {nos_layout[rotulo]}(["📗 {_texto(rotulo)}"]):::arquivo')
+            conecta(nos_layout[rotulo], no_processo[proc.id])
+
+    linhas.append("")
+    linhas.append("  %% Processos por tipo")
+    for tipo in sorted(tipos):
+        procs = tipos[tipo]
+        if expandidos is not None and tipo not in expandidos:
+            linhas.append(f'  {grupo_ids[tipo]}[["📦 {_texto(tipo)} ({len(procs)} processos)"]]:::grupo')
+            continue
+        linhas.append(f'  subgraph {grupo_ids[tipo]}["{_texto(tipo)}"]')
+        linhas.append("    direction TB")
+        for proc in procs:
+            linhas.append(f'    P{proc.id}(["🔄 {_texto(proc.nome)}"]):::processo')
+        linhas.append("  end")
+
+    for origem, destino in arestas:
+        if origem in no_processo and destino in no_processo:
+            conecta(no_processo[origem], no_processo[destino], "-. 🔁 .->")
+
+    if mostrar_retornos:
+        linhas.append("")
+        linhas.append("  %% Retornos")
+        for proc in processos:
+            if expandidos is not None and (proc.tipo or "Sem tipo") not in expandidos:
+                continue
+            config = configs.get(proc.id)
+            if config and config.retorno:
+                linhas.append(f'  R{proc.id}(["📑 {_texto(config.retorno.tipo)}"]):::retorno')
+                conecta(f"P{proc.id}", f"R{proc.id}")
+
+    linhas.append("")
+    linhas.extend(conexoes)
+    return "\n".join(linhas)
+
+def html_mermaid(codigo: str) -> str:
+    """HTML com o script do Mermaid.js para renderizar o código via components.html."""
+    return f"""
+    <div class="mermaid">
+    {codigo}
+    </div>
+    <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
+    <script>
+        mermaid.initialize({{ startOnLoad: true, maxTextSize: 500000 }});
+    </script>
+    """
+
+# ------------------------------------------------------------------
+# Diagrama de um processo
+# ------------------------------------------------------------------
+def diagrama_processo(nome_processo: str, layouts_list: Iterable[Layout], retorno: Optional[Retorno]) -> str:
+    """Código Mermaid do diagrama de um processo: fontes, processo e retorno."""
+    mermaid_code = [
+        "---",
+        "config:",
+        "   theme: neutral",
+        "---",
+        "flowchart LR",
+        "  %% Estilos Modernos",
+        *CLASSES_MERMAID[:4],
+        "",
+        "  %% Fontes de Informação",
+        '  subgraph DataSources["🔍 Fontes"]',
+        "    direction TB"
+    ]
+
+    ds_counter = 1
+    connections = []
+
+    for layout in layouts_list:
+        ds_name = f"DS{ds_counter}"
+        ds_counter += 1
+
+        if layout.tipo == "Arquivo":
+            if layout.modo == "existente":
+                label = layout.arquivo or "Layout Existente"
+            else:
+                label = f"{layout.arquivo_tipo or '?'}: {layout.nome or '?'}"
+            mermaid_code.append(f'    {ds_name}(["📗 {_texto(label)}"]):::arquivo')
+        else:
+            enc_label = _texto(layout.processo or "Encadeado")
+            mermaid_code.append(f'    {ds_name}(["🔁 {enc_label}"]):::encadeamento')
+        connections.append(f"{ds_name} --> PROC")
+
+    mermaid_code.append("  end\n")
+    mermaid_code.append(f'  PROC(["🔄 {_texto(nome_processo)}"]):::processo')
+
+    for c in connections:
+        mermaid_code.append(f"  {c}")
+
+    if retorno:
+        ret_tipo = _texto(retorno.tipo)
+        mermaid_code.append(f'  RET(["📑 {ret_tipo}"]):::retorno')
+        mermaid_code.append("  PROC --> RET")
+
+    return "\n".join(mermaid_code)
@@ -0,0 +1,321 @@
+import json
+import sqlite3
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# ------------------------------------------------------------------
+# Índice de encadeamentos entre processos
+# ------------------------------------------------------------------
+# Cada aresta (origem_id -> destino_id) indica que o processo de origem
+# alimenta o processo de destino. A tabela é mantida a partir dos layouts
+# do tipo "Encadeamento" gravados em processo_config.
+
+class CicloEncadeamento(ValueError):
+    """Erro levantado quando um encadeamento fecharia um ciclo entre processos."""
+
+    def __init__(self, ciclo: List[int]):
+        self.ciclo = ciclo
+        super().__init__(f"Encadeamento criaria um ciclo: {' -> '.join(str(p) for p in ciclo)}")
+
+def rotulo_processo(nome: str, tipo: str) -> str:
+    """Rótulo de exibição de um processo usado nos layouts de encadeamento."""
+    return f"{nome} - {tipo}"
+
+def criar_tabela(conn: sqlite3.Connection) -> None:
+    """
+    Cria as tabelas de arestas (encadeamentos e uso de layouts) e, na primeira
+    execução, indexa os configs já salvos.
+    """
+    existentes = {r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('processo_encadeamento', 'processo_layout')"
+    ).fetchall()}
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processo_encadeamento (
+            origem_id INTEGER NOT NULL,
+            destino_id INTEGER NOT NULL,
+            PRIMARY KEY (origem_id, destino_id),
+            FOREIGN KEY(origem_id) REFERENCES processos(id) ON DELETE CASCADE,
+            FOREIGN KEY(destino_id) REFERENCES processos(id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_encadeamento_destino ON processo_encadeamento(destino_id)"
+    )
+    # Rótulo do layout de arquivo -> processos que o utilizam (a análise de impacto consulta pelo rótulo)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processo_layout (
+            rotulo TEXT NOT NULL,
+            processo_id INTEGER NOT NULL,
+            PRIMARY KEY (rotulo, processo_id),
+            FOREIGN KEY(processo_id) REFERENCES processos(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processo_layout_processo ON processo_layout(processo_id)")
+    if "processo_encadeamento" not in existentes:
+        reconstruir_indice(conn)
+    elif "processo_layout" not in existentes:
+        reconstruir_layouts(conn)
+
+def reconstruir_indice(conn: sqlite3.Connection) -> int:
+    """
+    Reconstrói todas as arestas (encadeamentos e uso de layouts) a partir dos configs salvos. Encadeamentos antigos,
+    gravados apenas com o rótulo "nome - tipo", são resolvidos para o id do processo
+    dentro do mesmo cliente e passam a guardar "processo_id".
+    Retorna o número de arestas indexadas.
+    """
+    conn.execute("DELETE FROM processo_encadeamento")
+    reconstruir_layouts(conn)
+    rows = conn.execute("""
+        SELECT pc.id, pc.processo_id, pc.layouts
+        FROM processo_config pc
+        JOIN processos p ON p.id = pc.processo_id
+    """).fetchall()
+    total = 0
+    for conf_id, processo_id, layouts_str in rows:
+        if not layouts_str:
+            continue
+        try:
+            layouts = json.loads(layouts_str)
+        except Exception as e:
+            print("DEBUG: Erro ao indexar encadeamentos:", e)
+            continue
+        origens = resolver_origens(conn, processo_id, layouts)
+        if any(l.get("tipo") == "Encadeamento" for l in layouts):
+            conn.execute("UPDATE processo_config SET layouts = ? WHERE id = ?", (json.dumps(layouts), conf_id))
+        conn.executemany(
+            "INSERT OR IGNORE INTO processo_encadeamento (origem_id, destino_id) VALUES (?, ?)",
+            [(origem, processo_id) for origem in origens]
+        )
+        total += len(origens)
+    return total
+
+def reconstruir_layouts(conn: sqlite3.Connection) -> int:
+    """Reconstrói o índice de uso dos layouts de arquivo. Retorna o número de pares indexados."""
+    conn.execute("DELETE FROM processo_layout")
+    pares = []
+    for processo_id, layouts_str in conn.execute("""
+        SELECT pc.processo_id, pc.layouts
+        FROM processo_config pc
+        JOIN processos p ON p.id = pc.processo_id
+    """).fetchall():
+        try:
+            layouts = json.loads(layouts_str) if layouts_str else []
+        except Exception as e:
+            print("DEBUG: Erro ao indexar layouts:", e)
+            continue
+        pares.extend((rotulo, processo_id) for rotulo in rotulos_layouts(layouts))
+    conn.executemany("INSERT OR IGNORE INTO processo_layout (rotulo, processo_id) VALUES (?, ?)", pares)
+    return len(pares)
+
+def salvar_layouts(conn: sqlite3.Connection, processo_id: int, layouts: List[dict]) -> None:
+    """Substitui os layouts de arquivo indexados do processo. Não faz commit."""
+    conn.execute("DELETE FROM processo_layout WHERE processo_id = ?", (processo_id,))
+    conn.executemany(
+        "INSERT INTO processo_layout (rotulo, processo_id) VALUES (?, ?)",
+        [(rotulo, processo_id) for rotulo in rotulos_layouts(layouts)]
+    )
+
+def resolver_origens(conn: sqlite3.Connection, processo_id: int, layouts: List[dict]) -> List[int]:
+    """
+    Retorna os ids dos processos de origem referenciados pelos layouts de encadeamento.
+    Layouts sem "processo_id" são resolvidos pelo rótulo e atualizados no próprio dicionário.
+    """
+    rotulos = None
+    origens = []
+    for layout in layouts:
+        if layout.get("tipo") != "Encadeamento":
+            continue
+        origem = layout.get("processo_id")
+        if origem is None and layout.get("processo"):
+            if rotulos is None:
+                rotulos = {
+                    rotulo_processo(nome, tipo): pid
+                    for pid, nome, tipo in conn.execute("""
+                        SELECT id, nome, tipo FROM processos
+                        WHERE cliente_id = (SELECT cliente_id FROM processos WHERE id = ?)
+                    """, (processo_id,)).fetchall()
+                }
+            origem = rotulos.get(layout["processo"])
+            if origem is not None:
+                layout["processo_id"] = origem
+        if origem is not None and origem != processo_id and origem not in origens:
+            origens.append(origem)
+    if origens:
+        # Encadeamentos que apontam para processos já excluídos não viram arestas (violariam a FK)
+        existentes = {r[0] for r in conn.execute(
+            f"SELECT id FROM processos WHERE id IN ({','.join('?' * len(origens))})", origens
+        ).fetchall()}
+        origens = [origem for origem in origens if origem in existentes]
+    return origens
+
+def encontrar_ciclo(conn: sqlite3.Connection, processo_id: int, origens: List[int]) -> Optional[List[int]]:
+    """
+    Verifica se ligar as origens ao processo fecharia um ciclo, isto é, se alguma origem
+    já é alimentada (direta ou indiretamente) pelo próprio processo.
+    Retorna o caminho do ciclo ou None.
+    """
+    if not origens:
+        return None
+    alvos = set(origens)
+    if processo_id in alvos:
+        return [processo_id, processo_id]
+    anterior: Dict[int, int] = {processo_id: processo_id}
+    fila = deque([processo_id])
+    while fila:
+        atual = fila.popleft()
+        for (prox,) in conn.execute(
+            "SELECT destino_id FROM processo_encadeamento WHERE origem_id = ?", (atual,)
+        ):
+            if prox in anterior:
+                continue
+            anterior[prox] = atual
+            if prox in alvos:
+                caminho = [prox]
+                while caminho[-1] != processo_id:
+                    caminho.append(anterior[caminho[-1]])
+                caminho.reverse()
+                return caminho + [processo_id]
+            fila.append(prox)
+    return None
+
+def salvar_encadeamentos(conn: sqlite3.Connection, processo_id: int, layouts: List[dict]) -> List[int]:
+    """
+    Substitui as arestas de entrada do processo pelas definidas nos layouts (e o
+    índice dos layouts de arquivo que ele utiliza).
+    Levanta CicloEncadeamento sem alterar nada caso alguma origem nova feche um ciclo;
+    arestas que já existiam são mantidas, para não bloquear configs antigos.
+    Não faz commit: deve rodar na mesma transação que grava o processo_config.
+    """
+    origens = resolver_origens(conn, processo_id, layouts)
+    existentes = {r[0] for r in conn.execute(
+        "SELECT origem_id FROM processo_encadeamento WHERE destino_id = ?", (processo_id,)
+    ).fetchall()}
+    ciclo = encontrar_ciclo(conn, processo_id, [o for o in origens if o not in existentes])
+    if ciclo:
+        raise CicloEncadeamento(ciclo)
+    conn.execute("DELETE FROM processo_encadeamento WHERE destino_id = ?", (processo_id,))
+    conn.executemany(
+        "INSERT INTO processo_encadeamento (origem_id, destino_id) VALUES (?, ?)",
+        [(origem, processo_id) for origem in origens]
+    )
+    salvar_layouts(conn, processo_id, layouts)
+    return origens
+
+def atualizar_rotulos(conn: sqlite3.Connection, processo_id: int, rotulo: str) -> int:
+    """
+    Atualiza o rótulo exibido nos layouts de encadeamento dos processos alimentados
+    por este, após renomear o processo. Retorna quantos configs foram alterados.
+    """
+    alterados = 0
+    rows = conn.execute("""
+        SELECT pc.id, pc.layouts FROM processo_config pc
+        JOIN processo_encadeamento e ON e.destino_id = pc.processo_id
+        WHERE e.origem_id = ?
+    """, (processo_id,)).fetchall()
+    for conf_id, layouts_str in rows:
+        try:
+            layouts = json.loads(layouts_str) if layouts_str else []
+        except Exception as e:
+            print("DEBUG: Erro ao atualizar rótulos de encadeamento:", e)
+            continue
+        mudou = False
+        for layout in layouts:
+            if layout.get("tipo") == "Encadeamento" and layout.get("processo_id") == processo_id:
+                if layout.get("processo") != rotulo:
+                    layout["processo"] = rotulo
+                    mudou = True
+        if mudou:
+            conn.execute("UPDATE processo_config SET layouts = ? WHERE id = ?", (json.dumps(layouts), conf_id))
+            alterados += 1
+    return alterados
+
+# ------------------------------------------------------------------
+# Consultas sobre o grafo
+# ------------------------------------------------------------------
+def _percorrer(conn: sqlite3.Connection, processo_id: int, de: str, para: str) -> List[Tuple[int, int]]:
+    rows = conn.execute(f"""
+        WITH RECURSIVE alcance(id, nivel) AS (
+            SELECT {para}, 1 FROM processo_encadeamento WHERE {de} = ?
+            UNION
+            SELECT e.{para}, a.nivel + 1
+            FROM processo_encadeamento e JOIN alcance a ON e.{de} = a.id
+            WHERE a.nivel < 1000
+        )
+        SELECT id, MIN(nivel) FROM alcance WHERE id != ? GROUP BY id ORDER BY MIN(nivel), id
+    """, (processo_id, processo_id)).fetchall()
+    return [(r[0], r[1]) for r in rows]
+
+def upstream(conn: sqlite3.Connection, processo_id: int) -> List[Tuple[int, int]]:
+    """Processos que alimentam este, direta ou indiretamente, como pares (id, distância)."""
+    return _percorrer(conn, processo_id, "destino_id", "origem_id")
+
+def downstream(conn: sqlite3.Connection, processo_id: int) -> List[Tuple[int, int]]:
+    """Processos alimentados por este, direta ou indiretamente, como pares (id, distância)."""
+    return _percorrer(conn, processo_id, "origem_id", "destino_id")
+
+def ordem_topologica(conn: sqlite3.Connection, cliente_id: int) -> List[int]:
+    """
+    Ordena os processos do cliente de forma que cada processo apareça depois de
+    todos os que o alimentam. Processos presos em ciclos antigos vão para o final.
+    """
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM processos WHERE cliente_id = ? ORDER BY id", (cliente_id,)
+    ).fetchall()]
+    grau = {pid: 0 for pid in ids}
+    saidas: Dict[int, List[int]] = {pid: [] for pid in ids}
+    for origem, destino in conn.execute("""
+        SELECT e.origem_id, e.destino_id FROM processo_encadeamento e
+        JOIN processos p ON p.id = e.destino_id
+        WHERE p.cliente_id = ?
+    """, (cliente_id,)).fetchall():
+        if origem in grau and destino in grau:
+            saidas[origem].append(destino)
+            grau[destino] += 1
+    fila = deque(pid for pid in ids if grau[pid] == 0)
+    ordem = []
+    while fila:
+        atual = fila.popleft()
+        ordem.append(atual)
+        for prox in saidas[atual]:
+            grau[prox] -= 1
+            if grau[prox] == 0:
+                fila.append(prox)
+    ordem.extend(pid for pid in ids if grau[pid] > 0)
+    return ordem
+
+def rotulo_layout(layout: dict) -> Optional[str]:
+    """Rótulo compartilhado de um layout de arquivo, o mesmo usado em load_all_layouts."""
+    if layout.get("tipo") != "Arquivo":
+        return None
+    if layout.get("modo") == "novo":
+        return f"{layout.get('arquivo_tipo', 'Desconhecido')} - {layout.get('nome', 'SemNome')}"
+    return layout.get("arquivo", "Layout Existente")
+
+def rotulos_layouts(layouts: List[dict]) -> List[str]:
+    """Rótulos distintos dos layouts de arquivo, na ordem em que aparecem."""
+    rotulos = []
+    for layout in layouts:
+        rotulo = rotulo_layout(layout) if isinstance(layout, dict) else None
+        if rotulo is not None and str(rotulo) not in rotulos:
+            rotulos.append(str(rotulo))
+    return rotulos
+
+def processos_com_layout(conn: sqlite3.Connection, rotulo: str) -> List[int]:
+    """Processos (de qualquer cliente) que utilizam o layout de arquivo informado."""
+    return [r[0] for r in conn.execute(
+        "SELECT processo_id FROM processo_layout WHERE rotulo = ? ORDER BY processo_id", (rotulo,)
+    ).fetchall()]
+
+def impacto_layout(conn: sqlite3.Connection, rotulo: str) -> Dict[int, int]:
+    """
+    Processos afetados por uma mudança no layout: os que o utilizam (distância 0)
+    e todos os alimentados por eles. Retorna {processo_id: distância}.
+    """
+    afetados: Dict[int, int] = {}
+    for processo_id in processos_com_layout(conn, rotulo):
+        afetados[processo_id] = 0
+    for processo_id in list(afetados):
+        for pid, nivel in downstream(conn, processo_id):
+            if pid not in afetados or afetados[pid] > nivel:
+                afetados[pid] = nivel
+    return afetados
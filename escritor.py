@@ -0,0 +1,213 @@
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+# ------------------------------------------------------------------
+# Escritor único do banco
+# ------------------------------------------------------------------
+# Todas as escritas do app passam por uma única thread com conexão própria.
+# Mutações que chegam juntas são agrupadas em um lote: uma transação
+# (BEGIN IMMEDIATE) por lote e um SAVEPOINT por mutação, de modo que uma
+# mutação com erro (por exemplo, um conflito de versão) é desfeita sozinha
+# sem derrubar as demais. Como só há um escritor, as sessões não disputam
+# o lock de escrita do SQLite entre si.
+
+class ConflitoVersao(Exception):
+    """O config foi alterado por outra sessão depois da versão que o usuário editou."""
+
+    def __init__(self, processo_id: int, esperada: int, atual: int):
+        self.processo_id = processo_id
+        self.esperada = esperada
+        self.atual = atual
+        super().__init__(
+            f"Config do processo {processo_id} está na versão {atual}, mas a edição partiu da versão {esperada}"
+        )
+
+# Escritores vivos no processo, para ferramentas de diagnóstico (ex.: carga.py)
+_instancias: "weakref.WeakSet[Escritor]" = weakref.WeakSet()
+
+def estatisticas_totais() -> dict:
+    """Soma das estatísticas de todos os escritores do processo."""
+    total = {"lotes": 0, "mutacoes": 0, "erros": 0, "espera_fila_s": 0.0, "espera_lock_s": 0.0, "tentativas_lock": 0}
+    for instancia in list(_instancias):
+        for chave, valor in instancia.estatisticas.items():
+            total[chave] += valor
+    return total
+
+class Escritor:
+    """
+    Fila de mutações executadas por uma thread dedicada. Uma mutação é uma função
+    `funcao(conn, *args, **kwargs)` que não faz commit; seu retorno (ou exceção)
+    é devolvido a quem chamou `executar`.
+    """
+
+    def __init__(self, caminho: str, lote_max: int = 50, timeout: float = 30.0,
+                 apos_commit: Optional[Callable[[], None]] = None):
+        self.caminho = caminho
+        # Chamado na thread do escritor após cada COMMIT, antes de liberar quem aguarda (ex.: espelho em memória)
+        self.apos_commit = apos_commit
+        self.lote_max = lote_max
+        self.timeout = timeout
+        # espera_fila_s: tempo das mutações na fila até o lote começar (disputa entre sessões);
+        # espera_lock_s: tempo aguardando o lock do arquivo (outros processos)
+        self.estatisticas = {
+            "lotes": 0, "mutacoes": 0, "erros": 0, "espera_fila_s": 0.0, "espera_lock_s": 0.0, "tentativas_lock": 0
+        }
+        self._fila: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        # Protege a troca da thread: se ela morrer (ex.: o arquivo ficou travado além do
+        # timeout ao conectar), a fila é esvaziada com erro e o próximo envio sobe outra
+        self._trava = threading.Lock()
+        self._ativa = False
+        self._encerrado = False
+        with self._trava:
+            self._iniciar_thread()
+        _instancias.add(self)
+
+    def executar(self, funcao: Callable[..., Any], *args, **kwargs) -> Any:
+        """Enfileira a mutação e aguarda sua conclusão."""
+        return self.enviar(funcao, *args, **kwargs).result(timeout=self.timeout)
+
+    def enviar(self, funcao: Callable[..., Any], *args, **kwargs) -> Future:
+        """Enfileira a mutação sem aguardar; o resultado fica no Future."""
+        futuro: Future = Future()
+        with self._trava:
+            if self._encerrado:
+                futuro.set_exception(RuntimeError(f"Escritor de {self.caminho} encerrado"))
+                return futuro
+            if not self._ativa:
+                self._iniciar_thread()
+            self._fila.put((funcao, args, kwargs, futuro, time.perf_counter()))
+        return futuro
+
+    def encerrar(self) -> None:
+        with self._trava:
+            self._encerrado = True
+        self._fila.put(None)
+        self._thread.join(timeout=self.timeout)
+
+    def _iniciar_thread(self) -> None:
+        # Chamado com self._trava
+        self._ativa = True
+        self._thread = threading.Thread(target=self._loop, name="escritor", daemon=True)
+        self._thread.start()
+
+    def _com_tentativas(self, acao: Callable[[], Any]) -> Any:
+        """Executa `acao` com novas tentativas (espera crescente) enquanto outro processo segura o lock."""
+        inicio = time.perf_counter()
+        espera = 0.01
+        try:
+            while True:
+                try:
+                    return acao()
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) and "busy" not in str(e):
+                        raise
+                    if time.perf_counter() - inicio > self.timeout:
+                        raise
+                    self.estatisticas["tentativas_lock"] += 1
+                    time.sleep(espera)
+                    espera = min(espera * 2, 0.5)
+        finally:
+            self.estatisticas["espera_lock_s"] += time.perf_counter() - inicio
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.caminho, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        try:
+            # WAL permite que as leituras das sessões continuem enquanto o escritor grava; a conversão
+            # (só na primeira vez) precisa do lock exclusivo e não passa pelo busy handler
+            self._com_tentativas(lambda: conn.execute("PRAGMA journal_mode=WAL"))
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Exclusões em cascata (processo -> config, histórico, encadeamentos) dependem das FKs
+            conn.execute("PRAGMA foreign_keys=ON")
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _loop(self) -> None:
+        lote: list = []
+        conn = None
+        try:
+            conn = self._conectar()
+            while True:
+                item = self._fila.get()
+                if item is None:
+                    break
+                lote = [item]
+                while len(lote) < self.lote_max:
+                    try:
+                        proximo = self._fila.get_nowait()
+                    except queue.Empty:
+                        break
+                    if proximo is None:
+                        self._fila.put(None)
+                        break
+                    lote.append(proximo)
+                self._processar(conn, lote)
+                lote = []
+        except Exception as e:
+            # Sem a thread ninguém resolveria os pendentes: quem aguarda recebe o erro já,
+            # e o próximo envio sobe uma thread nova (com uma conexão nova)
+            print(f"DEBUG: Escritor de {self.caminho} interrompido: {e}")
+            with self._trava:
+                self._ativa = False
+                pendentes = [item for item in lote if not item[3].done()]
+                while True:
+                    try:
+                        item = self._fila.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        pendentes.append(item)
+            for item in pendentes:
+                self.estatisticas["erros"] += 1
+                item[3].set_exception(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _iniciar_transacao(self, conn: sqlite3.Connection) -> None:
+        """BEGIN IMMEDIATE com novas tentativas enquanto outro processo segura o lock."""
+        self._com_tentativas(lambda: conn.execute("BEGIN IMMEDIATE"))
+
+    def _processar(self, conn: sqlite3.Connection, lote: list) -> None:
+        resultados = []
+        agora = time.perf_counter()
+        self.estatisticas["espera_fila_s"] += sum(agora - item[4] for item in lote)
+        try:
+            self._iniciar_transacao(conn)
+            for funcao, args, kwargs, futuro, _ in lote:
+                conn.execute("SAVEPOINT mutacao")
+                try:
+                    resultado = funcao(conn, *args, **kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO mutacao")
+                    conn.execute("RELEASE mutacao")
+                    resultados.append((futuro, None, e))
+                else:
+                    conn.execute("RELEASE mutacao")
+                    resultados.append((futuro, resultado, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            print("DEBUG: Erro ao gravar lote:", e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            resultados = [(item[3], None, e) for item in lote]
+        else:
+            if self.apos_commit is not None:
+                try:
+                    self.apos_commit()
+                except Exception as e:
+                    print("DEBUG: Erro após gravar lote:", e)
+        self.estatisticas["lotes"] += 1
+        self.estatisticas["mutacoes"] += len(lote)
+        for futuro, resultado, erro in resultados:
+            if erro is not None:
+                self.estatisticas["erros"] += 1
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(resultado)
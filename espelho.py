@@ -0,0 +1,175 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# ------------------------------------------------------------------
+# Espelho em memória do banco, para leitura
+# ------------------------------------------------------------------
+# Modo opcional (DETALHAMENTO_ESPELHO=1) em que as leituras do app são
+# servidas de uma cópia do arquivo em memória, sem abrir o arquivo em disco:
+#   - na subida do servidor, o arquivo é copiado para um banco em memória pela
+#     API de backup do SQLite e a cópia é conferida contra o disco (quick_check
+#     e contagem de linhas de cada tabela); se não bater, o espelho não é usado;
+#   - o espelho guarda a imagem serializada do último estado gravado. Cada
+#     conexão de leitura tem a sua própria cópia dessa imagem (deserialize),
+#     somente leitura: é o retrato da execução, sem disputar locks com ninguém.
+#     Fechar a conexão a devolve a um pool da mesma imagem: a próxima execução
+#     a reaproveita já com o schema lido, que é o custo dominante de uma
+#     conexão nova (mais que a própria consulta, em um banco pequeno);
+#   - o escritor do arquivo atualiza a imagem logo após cada COMMIT, antes de
+#     devolver o resultado às sessões; quem grava já lê a própria escrita e
+#     ninguém vê um estado que não foi gravado no disco;
+#   - escritas feitas fora do escritor (outro processo, ferramentas de linha de
+#     comando) são percebidas pelo PRAGMA data_version da conexão sentinela e
+#     recarregadas na próxima leitura.
+# Cada atualização copia o arquivo inteiro (alguns ms para bancos pequenos),
+# por isso há um limite de tamanho para o modo.
+
+LIMITE_MB = 256
+# Conexões ociosas guardadas por espelho (as demais são fechadas ao devolver)
+MAX_OCIOSAS = 8
+
+class EspelhoIndisponivel(Exception):
+    """O arquivo não pode ser espelhado (grande demais ou cópia inconsistente com o disco)."""
+
+def conferir(disco: sqlite3.Connection, memoria: sqlite3.Connection) -> List[str]:
+    """Diferenças entre o arquivo e a cópia em memória; lista vazia se a cópia está íntegra."""
+    problemas = []
+    verificacao = memoria.execute("PRAGMA quick_check").fetchone()[0]
+    if verificacao != "ok":
+        problemas.append(f"quick_check: {verificacao}")
+    tabelas = [
+        nome for (nome,) in disco.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    for tabela in tabelas:
+        sql = f'SELECT COUNT(*) FROM "{tabela}"'
+        em_disco = disco.execute(sql).fetchone()[0]
+        try:
+            em_memoria = memoria.execute(sql).fetchone()[0]
+        except sqlite3.Error as e:
+            problemas.append(f"{tabela}: {e}")
+            continue
+        if em_disco != em_memoria:
+            problemas.append(f"{tabela}: {em_disco} linha(s) no disco, {em_memoria} no espelho")
+    return problemas
+
+def _imagem(conn: sqlite3.Connection) -> bytes:
+    """Banco da conexão serializado, marcado como journal tradicional (uma imagem em memória não tem WAL)."""
+    imagem = bytearray(conn.serialize())
+    # Bytes 18 e 19 do cabeçalho: versão de escrita e leitura do formato (2 = WAL)
+    if imagem[18:20] == b"\x02\x02":
+        imagem[18:20] = b"\x01\x01"
+    return bytes(imagem)
+
+class _ConexaoEspelho(sqlite3.Connection):
+    """Conexão com uma cópia da imagem; close() a devolve ao pool do espelho se a imagem ainda é a atual."""
+    espelho: Optional["Espelho"] = None
+    geracao = 0
+
+    def close(self):
+        if self.espelho is None or not self.espelho._devolver(self):
+            super().close()
+
+class Espelho:
+    """Imagem em memória de um arquivo SQLite, atualizada pelo escritor do arquivo."""
+
+    def __init__(self, caminho: str, limite_mb: float = LIMITE_MB):
+        self.caminho = caminho
+        self.estatisticas: Dict[str, float] = {
+            "leituras": 0, "reaproveitadas": 0, "atualizacoes": 0, "externas": 0, "atualizacao_s": 0.0
+        }
+        self._trava = threading.Lock()
+        self._geracao = 0
+        self._ociosas: List[_ConexaoEspelho] = []
+        # Conexão que lê o disco: cópia inicial, atualizações e detecção de escritas externas
+        self._sentinela = sqlite3.connect(caminho, check_same_thread=False)
+        paginas = self._sentinela.execute("PRAGMA page_count").fetchone()[0]
+        tamanho = paginas * self._sentinela.execute("PRAGMA page_size").fetchone()[0]
+        if tamanho > limite_mb * 1024 * 1024:
+            self._sentinela.close()
+            raise EspelhoIndisponivel(f"{caminho} tem {tamanho / 1024 / 1024:.0f} MB (limite {limite_mb:.0f} MB)")
+        self._carregar()
+
+    def _carregar(self) -> None:
+        """Cópia inicial pela API de backup, conferida no mesmo retrato do disco."""
+        inicio = time.perf_counter()
+        memoria = sqlite3.connect(":memory:")
+        try:
+            with self._trava:
+                self._versao = self._versao_disco()
+                self._sentinela.execute("BEGIN")
+                try:
+                    self._sentinela.backup(memoria)
+                    problemas = conferir(self._sentinela, memoria)
+                finally:
+                    self._sentinela.rollback()
+            if problemas:
+                raise EspelhoIndisponivel(f"{self.caminho}: " + "; ".join(problemas))
+            self._imagem = _imagem(memoria)
+        finally:
+            memoria.close()
+        print(
+            f"DEBUG: Espelho de {self.caminho} carregado em {(time.perf_counter() - inicio) * 1000:.0f} ms "
+            f"({len(self._imagem) / 1024:.0f} KB, conferido com o disco)"
+        )
+
+    def _versao_disco(self) -> int:
+        # Muda a cada COMMIT feito por outra conexão (o escritor, outro processo)
+        return self._sentinela.execute("PRAGMA data_version").fetchone()[0]
+
+    def atualizar(self) -> None:
+        """Publica o estado gravado no disco (chamado pelo escritor após cada COMMIT)."""
+        inicio = time.perf_counter()
+        with self._trava:
+            # A versão é lida antes: a imagem é sempre pelo menos tão nova quanto ela
+            self._versao = self._versao_disco()
+            self._imagem = _imagem(self._sentinela)
+            self._geracao += 1
+            antigas, self._ociosas = self._ociosas, []
+        for conn in antigas:
+            sqlite3.Connection.close(conn)
+        self.estatisticas["atualizacoes"] += 1
+        self.estatisticas["atualizacao_s"] += time.perf_counter() - inicio
+
+    def conectar(self) -> sqlite3.Connection:
+        """Conexão somente leitura com uma cópia própria do último estado gravado."""
+        with self._trava:
+            externa = self._versao_disco() != self._versao
+        if externa:
+            self.estatisticas["externas"] += 1
+            print(f"DEBUG: {self.caminho} alterado fora do escritor; espelho recarregado")
+            self.atualizar()
+        self.estatisticas["leituras"] += 1
+        with self._trava:
+            if self._ociosas:
+                self.estatisticas["reaproveitadas"] += 1
+                return self._ociosas.pop()
+            imagem, geracao = self._imagem, self._geracao
+        conn = sqlite3.connect(":memory:", check_same_thread=False, factory=_ConexaoEspelho)
+        conn.deserialize(imagem)
+        conn.execute("PRAGMA query_only = ON")
+        conn.espelho, conn.geracao = self, geracao
+        return conn
+
+    def _devolver(self, conn: _ConexaoEspelho) -> bool:
+        """Guarda a conexão para reaproveitar; False se ela deve ser fechada de fato."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._trava:
+            if any(ociosa is conn for ociosa in self._ociosas):
+                return True  # fechada duas vezes
+            if conn.geracao != self._geracao or len(self._ociosas) >= MAX_OCIOSAS:
+                return False
+            self._ociosas.append(conn)
+            return True
+
+    def fechar(self) -> None:
+        with self._trava:
+            ociosas, self._ociosas = self._ociosas, []
+            self._geracao += 1
+        for conn in ociosas:
+            sqlite3.Connection.close(conn)
+        self._sentinela.close()
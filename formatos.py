@@ -0,0 +1,263 @@
+import argparse
+import json
+import mmap
+import os
+import re
+from collections import Counter
+from typing import Dict, Optional
+
+from tarefas import Tarefa
+
+# ------------------------------------------------------------------
+# Detecção do formato de arquivos bancários e fiscais
+# ------------------------------------------------------------------
+# Identifica pelo conteúdo o tipo de arquivo de uma amostra, em vez de
+# confiar no tipo escolhido à mão no layout:
+#   - OFX 1.x (SGML) e 2.x (XML), pelo cabeçalho OFXHEADER/<OFX>;
+#   - SWIFT MT, pelos blocos {1:...}{2:...} ou pelo campo :20: inicial;
+#   - EDI EDIFACT (UNA/UNB) e ANSI X12 (ISA);
+#   - SPED (ECD, ECF, EFD ICMS/IPI, EFD Contribuições), pelo registro |0000|;
+#   - XML ISO 20022 (camt, pain...), pelo namespace;
+#   - CNAB 240 e 400, pelo comprimento fixo dos registros e pelo header.
+# O arquivo é mapeado em memória (mmap): o cabeçalho decide o formato e a
+# contagem dos tipos de registro percorre o mapa em blocos (expressões
+# regulares, ou fatias com passo fixo no CNAB), sem carregar o arquivo.
+# O resultado traz arquivo_tipo e detalhe prontos para o layout.
+#
+# Uso:
+#   python formatos.py retorno.ret
+
+CABECALHO = 64 * 1024
+BLOCO = 8 * 1024 * 1024
+MAX_TIPOS_REGISTRO = 200
+
+_REGISTROS_CNAB240 = {
+    "0": "header de arquivo", "1": "header de lote", "3": "detalhe",
+    "5": "trailer de lote", "9": "trailer de arquivo",
+}
+_REGISTROS_CNAB400 = {"0": "header", "1": "detalhe", "9": "trailer"}
+# Tipos de serviço do header de lote do CNAB 240 (FEBRABAN)
+_SERVICOS_CNAB240 = {
+    "01": "cobrança", "03": "boleto de pagamento eletrônico", "04": "conciliação bancária",
+    "05": "débitos", "20": "pagamento a fornecedores", "22": "pagamento de contas e tributos",
+    "30": "pagamento de salários", "98": "pagamentos diversos",
+}
+
+# ------------------------------------------------------------------
+# Contagem em blocos
+# ------------------------------------------------------------------
+def _contar(tarefa: Optional[Tarefa], mm: mmap.mmap, padrao: "re.Pattern[bytes]",
+            separador: bytes = b"\n") -> Counter:
+    """
+    Ocorrências do grupo do padrão no arquivo inteiro, em blocos de BLOCO bytes.
+    Cada bloco termina antes de um separador, então o registro que atravessaria o
+    limite começa inteiro (com o separador) no bloco seguinte.
+    """
+    contagem: Counter = Counter()
+    tamanho, posicao = len(mm), 0
+    while posicao < tamanho:
+        fim = min(posicao + BLOCO, tamanho)
+        if fim < tamanho:
+            corte = mm.rfind(separador, posicao + 1, fim)
+            if corte > posicao:
+                fim = corte
+        contagem.update(padrao.findall(mm, posicao, fim))
+        posicao = fim
+        if tarefa is not None:
+            tarefa.atualizar(0.95 * posicao / tamanho, f"Contando registros ({posicao / tamanho:.0%})...")
+    return contagem
+
+def _texto(valor: bytes) -> str:
+    return valor.decode("latin-1").strip()
+
+def _resultado(arquivo_tipo: str, detalhe: str, registros: Dict[str, int], **extras) -> dict:
+    registros = dict(sorted(registros.items())[:MAX_TIPOS_REGISTRO])
+    return {
+        "formato": arquivo_tipo,
+        "arquivo_tipo": arquivo_tipo,
+        "detalhe": detalhe,
+        "registros": registros,
+        "linhas": sum(registros.values()),
+        "linhas_exatas": True,
+        "colunas": [],
+        **extras,
+    }
+
+# ------------------------------------------------------------------
+# Detectores (recebem o mapa e o início do arquivo; None se não reconhecem)
+# ------------------------------------------------------------------
+def _ofx(tarefa, mm, inicio: bytes) -> Optional[dict]:
+    cabeca = inicio[:4096].upper()
+    if not (cabeca.startswith(b"OFXHEADER") or b"<?OFX" in cabeca or b"<OFX>" in cabeca):
+        return None
+    versao = "2.x (XML)" if b"<?OFX" in cabeca or cabeca.startswith(b"<?XML") else "1.x (SGML)"
+    contagem = _contar(tarefa, mm, re.compile(rb"<(STMTTRN|STMTRS|CCSTMTRS|INVSTMTRS)>", re.I), b"<")
+    registros = {
+        {"STMTTRN": "STMTTRN - transação", "STMTRS": "STMTRS - extrato de conta",
+         "CCSTMTRS": "CCSTMTRS - extrato de cartão", "INVSTMTRS": "INVSTMTRS - extrato de investimentos"}[
+            tag.decode().upper()]: quantidade
+        for tag, quantidade in contagem.items()
+    }
+    detalhe = f"OFX {versao}"
+    banco = re.search(rb"<BANKID>\s*([^<\r\n]+)", mm[:1024 * 1024], re.I)
+    if banco:
+        detalhe += f" - banco {_texto(banco.group(1))}"
+    return _resultado("OFX", detalhe, registros)
+
+def _swift(tarefa, mm, inicio: bytes) -> Optional[dict]:
+    if not inicio.startswith((b"{1:", b":20:")):
+        return None
+    campos = _contar(tarefa, mm, re.compile(rb"\n:(\d{2}[A-Z]?):"))
+    registros = {f":{campo.decode()}:": quantidade for campo, quantidade in campos.items()}
+    if inicio.startswith(b"{1:"):
+        mensagens = _contar(tarefa, mm, re.compile(rb"\{2:[IO](\d{3})"), b"{1:")
+        tipos = [f"MT{tipo.decode()}" for tipo, _ in mensagens.most_common()]
+        quantidade = sum(mensagens.values())
+    else:
+        # Extrato MT exportado sem os blocos de cabeçalho: o primeiro :20: abre o arquivo
+        registros[":20:"] = registros.get(":20:", 0) + 1
+        quantidade = registros[":20:"]
+        tipos = ["MT940" if b":62F:" in inicio else "MT942" if b":61:" in inicio else "MT"]
+    # Mensagens são contadas à parte: não são um tipo de registro e não entram nas linhas
+    return _resultado("SWIFT", f"SWIFT {', '.join(tipos) or 'MT'}", registros, mensagens=quantidade)
+
+def _edi(tarefa, mm, inicio: bytes) -> Optional[dict]:
+    if inicio.startswith((b"UNA", b"UNB")):
+        # UNA:+.? ' define os separadores; sem ele valem os padrões
+        dados, terminador = (inicio[4:5], inicio[8:9]) if inicio.startswith(b"UNA") else (b"+", b"'")
+        t, d = re.escape(terminador), re.escape(dados)
+        segmentos = _contar(tarefa, mm, re.compile(t + rb"\s*([A-Z][A-Z0-9]{2})" + d), terminador)
+        mensagens = _contar(tarefa, mm, re.compile(t + rb"\s*UNH" + d + rb"[^" + t + d + rb"]*" + d + rb"([A-Z0-9]{6})"), terminador)
+        padrao = "EDIFACT"
+    elif inicio.startswith(b"ISA") and len(inicio) > 105:
+        # No X12 o cabeçalho ISA tem tamanho fixo e define os separadores
+        dados, terminador = inicio[3:4], inicio[105:106]
+        t, d = re.escape(terminador), re.escape(dados)
+        segmentos = _contar(tarefa, mm, re.compile(t + rb"\s*([A-Z][A-Z0-9]{1,2})" + d), terminador)
+        mensagens = _contar(tarefa, mm, re.compile(t + rb"\s*ST" + d + rb"(\d{3})"), terminador)
+        padrao = "X12"
+    else:
+        return None
+    registros = {segmento.decode(): quantidade for segmento, quantidade in segmentos.items()}
+    # O primeiro segmento não é precedido de terminador
+    registros[inicio[:3].decode()] = registros.get(inicio[:3].decode(), 0) + 1
+    tipos = ", ".join(tipo.decode() for tipo, _ in mensagens.most_common(3))
+    return _resultado("EDI", f"EDI {padrao}{' ' + tipos if tipos else ''}", registros)
+
+def _sped(tarefa, mm, inicio: bytes) -> Optional[dict]:
+    if not inicio.startswith(b"|0000|"):
+        return None
+    campos = _texto(inicio.split(b"\n", 1)[0]).split("|")
+    contagem = _contar(tarefa, mm, re.compile(rb"\n\|(\w{4})\|"))
+    registros = {registro.decode(): quantidade for registro, quantidade in contagem.items()}
+    registros["0000"] = registros.get("0000", 0) + 1
+    blocos = {registro[0] for registro in registros}
+    if campos[2:3] == ["LECD"]:
+        variante = "ECD"
+    elif campos[2:3] == ["LECF"]:
+        variante = "ECF"
+    elif blocos & {"A", "F", "M", "P"}:
+        variante = "EFD Contribuições"
+    elif blocos & {"E", "G", "H", "K"}:
+        variante = "EFD ICMS/IPI"
+    else:
+        variante = "SPED"
+    detalhe = variante if variante.startswith("SPED") else f"SPED {variante}"
+    # DT_INI e DT_FIN são as duas primeiras datas (ddmmaaaa) do registro 0000
+    datas = [campo for campo in campos if re.fullmatch(r"\d{8}", campo)][:2]
+    if len(datas) == 2:
+        detalhe += " - " + " a ".join(f"{d[:2]}/{d[2:4]}/{d[4:]}" for d in datas)
+    return _resultado("SPED", detalhe, registros)
+
+def _iso20022(tarefa, mm, inicio: bytes) -> Optional[dict]:
+    mensagem = re.search(rb"urn:iso:std:iso:20022:tech:xsd:([a-z]{4}\.\d{3}\.\d{3}\.\d{2})", inicio)
+    if not mensagem:
+        return None
+    contagem = _contar(
+        tarefa, mm, re.compile(rb"<(?:\w+:)?(Stmt|Rpt|Ntfctn|Ntry|PmtInf|CdtTrfTxInf|DrctDbtTxInf)>"), b"<"
+    )
+    registros = {f"<{tag.decode()}>": quantidade for tag, quantidade in contagem.items()}
+    return _resultado("XML", f"ISO 20022 {mensagem.group(1).decode()}", registros)
+
+def _cnab(tarefa, mm, inicio: bytes) -> Optional[dict]:
+    linhas = inicio.split(b"\n")
+    # A última linha do início pode ter sido cortada
+    completas = [linha.rstrip(b"\r") for linha in (linhas[:-1] if len(mm) > CABECALHO else linhas) if linha.strip()]
+    larguras = {len(linha) for linha in completas[:50]}
+    if not completas or len(larguras) != 1 or not larguras & {240, 400}:
+        return None
+    largura = larguras.pop()
+    header = completas[0]
+    if (largura == 240 and header[7:8] != b"0") or (largura == 400 and header[:1] != b"0"):
+        return None
+    quebra = b"\r\n" if linhas[0].endswith(b"\r") else b"\n" if len(linhas) > 1 else b""
+    passo = largura + len(quebra)
+
+    # Registros em posições fixas: fatias com passo leem só o tipo (e o segmento, no 240)
+    contagem: Counter = Counter()
+    tamanho = len(mm)
+    bloco = max(BLOCO // passo, 1) * passo
+    for posicao in range(0, tamanho, bloco):
+        fim = min(posicao + bloco, tamanho)
+        if largura == 240:
+            tipos = mm[posicao + 7:fim:passo]
+            segmentos = mm[posicao + 13:fim:passo]
+            contagem.update(
+                f"{chr(tipo)}{chr(segmento)}" if tipo == 0x33 else chr(tipo)
+                for tipo, segmento in zip(tipos, segmentos)
+            )
+        else:
+            contagem.update(chr(tipo) for tipo in mm[posicao:fim:passo])
+        if tarefa is not None:
+            tarefa.atualizar(0.95 * fim / tamanho, f"Contando registros ({fim / tamanho:.0%})...")
+
+    nomes = _REGISTROS_CNAB240 if largura == 240 else _REGISTROS_CNAB400
+    registros = {}
+    for tipo, quantidade in contagem.items():
+        nome = nomes.get(tipo[0], f"tipo {tipo[0]!r}")
+        if len(tipo) > 1:
+            nome = f"{nome}, segmento {tipo[1]}"
+        registros[f"{tipo} - {nome}"] = quantidade
+    # Registros fora do tamanho fixo deslocam os seguintes: a contagem deixa de ser confiável
+    util = tamanho
+    while util and mm[util - 1] in b"\r\n\x1a":
+        util -= 1
+    exata = (util + len(quebra)) % passo == 0 and mm[util - largura + (7 if largura == 240 else 0)] == ord("9")
+
+    if largura == 240:
+        banco, nome_banco = _texto(header[0:3]), _texto(header[102:132])
+        sentido = {b"1": "remessa", b"2": "retorno"}.get(header[142:143], "")
+        lote = next((linha for linha in completas[1:] if linha[7:8] == b"1"), b"")
+        servico = _SERVICOS_CNAB240.get(_texto(lote[9:11]), "")
+    else:
+        banco, nome_banco = _texto(header[76:79]), _texto(header[79:94])
+        sentido = {b"1": "remessa", b"2": "retorno"}.get(header[1:2], "")
+        servico = _texto(header[11:26]).lower()
+    partes = [f"CNAB {largura}", sentido, f"banco {banco} {nome_banco}".strip(), servico]
+    return _resultado("CNAB", " - ".join(p for p in partes if p), registros, linhas_exatas=exata)
+
+_DETECTORES = (_ofx, _swift, _edi, _sped, _iso20022, _cnab)
+
+def detectar(tarefa: Optional[Tarefa], caminho: str) -> Optional[dict]:
+    """
+    Formato do arquivo pelo conteúdo, com a contagem dos tipos de registro, ou None se
+    ele não for um dos formatos estruturados reconhecidos (planilhas, CSV, texto livre).
+    """
+    if os.path.getsize(caminho) == 0:
+        return None
+    with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        inicio = mm[:CABECALHO].lstrip(b"\xef\xbb\xbf \t\r\n")
+        for detector in _DETECTORES:
+            resultado = detector(tarefa, mm, inicio)
+            if resultado is not None:
+                return resultado
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Detecta o formato (CNAB, OFX, SPED, EDI, SWIFT) de um arquivo.")
+    parser.add_argument("arquivo")
+    args = parser.parse_args()
+    print(json.dumps(detectar(None, args.arquivo), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
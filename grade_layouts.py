@@ -0,0 +1,114 @@
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ------------------------------------------------------------------
+# Edição dos layouts de entrada em grade
+# ------------------------------------------------------------------
+# Alternativa ao formulário de um bloco de widgets por layout: uma linha por
+# layout, com as colunas tipo, modo, arquivo_tipo, nome e detalhe, editada
+# em um único st.data_editor (que aceita colar linhas copiadas do Excel).
+# A grade inteira é validada de uma vez e vira a lista de layouts gravada
+# pelo salvamento normal do config, em uma única escrita.
+#
+# Na coluna nome vai o nome do layout novo, o layout existente escolhido
+# (como aparece na lista de layouts existentes) ou o processo de origem de
+# um encadeamento ("nome - tipo", ou só o nome se ele for único no cliente).
+# Valores colados são aceitos sem diferença de maiúsculas e acentos.
+
+TIPOS = ["Arquivo", "Encadeamento"]
+MODOS = ["novo", "existente"]
+TIPOS_ARQUIVO = [
+    "Excel", "CSV", "TXT", "OFX", "CNAB", "SPED", "EDI", "XML", "SWIFT",
+    "Extrato Adquirente", "API", "Banco de Dados", "PDF", "Outros",
+]
+# Tipos em que o detalhe é gravado: a descrição do tipo Outros ou a variante
+# do formato (ex.: "CNAB 240 - retorno"), preenchida pela detecção da amostra
+TIPOS_COM_DETALHE = {"Outros", "CNAB", "OFX", "SPED", "EDI", "SWIFT", "XML"}
+COLUNAS = ["tipo", "modo", "arquivo_tipo", "nome", "detalhe"]
+# A partir de quantos layouts a tela abre direto na grade
+LIMITE_FORMULARIO = 10
+
+def _chave(valor) -> str:
+    texto = unicodedata.normalize("NFKD", str(valor or "")).strip().lower()
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def _opcao(valor, opcoes: Iterable[str]) -> Optional[str]:
+    """A opção equivalente ao valor (sem diferença de maiúsculas e acentos), ou None."""
+    chave = _chave(valor)
+    return next((opcao for opcao in opcoes if _chave(opcao) == chave), None)
+
+def para_linhas(layouts: List[dict]) -> List[dict]:
+    """Linhas da grade para os layouts gravados no config."""
+    linhas = []
+    for layout in layouts:
+        linha = dict.fromkeys(COLUNAS, "")
+        linha["tipo"] = layout.get("tipo", "Arquivo")
+        if linha["tipo"] == "Arquivo":
+            linha["modo"] = layout.get("modo", "novo")
+            if linha["modo"] == "existente":
+                linha["nome"] = layout.get("arquivo", "")
+            else:
+                linha["arquivo_tipo"] = layout.get("arquivo_tipo", "")
+                linha["nome"] = layout.get("nome", "")
+                linha["detalhe"] = layout.get("detalhe", "")
+        else:
+            linha["nome"] = layout.get("processo") or ""
+        linhas.append(linha)
+    return linhas
+
+def para_layouts(linhas: List[dict], layouts_existentes: Iterable[str],
+                 processos: Dict[str, int]) -> Tuple[List[dict], List[str]]:
+    """
+    Valida a grade inteira e a converte em layouts. `processos` mapeia o rótulo
+    "nome - tipo" de cada processo que pode ser origem de encadeamento para o seu id.
+    Linhas totalmente vazias (sobras de uma colagem) são ignoradas.
+    Retorna (layouts, erros); com erros, os layouts não devem ser gravados.
+    """
+    existentes = list(layouts_existentes)
+    por_nome: Dict[str, List[str]] = {}
+    for rotulo in processos:
+        por_nome.setdefault(_chave(rotulo.rsplit(" - ", 1)[0]), []).append(rotulo)
+
+    layouts, erros = [], []
+    for numero, linha in enumerate(linhas, start=1):
+        valores = {coluna: str(linha.get(coluna) or "").strip() for coluna in COLUNAS}
+        if not any(valores.values()):
+            continue
+        tipo = _opcao(valores["tipo"] or "Arquivo", TIPOS)
+        if tipo is None:
+            erros.append(f"Linha {numero}: tipo '{valores['tipo']}' inválido (use {' ou '.join(TIPOS)}).")
+            continue
+
+        if tipo == "Encadeamento":
+            rotulo = _opcao(valores["nome"], processos)
+            if rotulo is None:
+                candidatos = por_nome.get(_chave(valores["nome"]), [])
+                rotulo = candidatos[0] if len(candidatos) == 1 else None
+            if rotulo is None:
+                erros.append(f"Linha {numero}: processo de origem '{valores['nome']}' não encontrado neste cliente.")
+                continue
+            layouts.append({"tipo": "Encadeamento", "processo": rotulo, "processo_id": processos[rotulo]})
+            continue
+
+        modo = _opcao(valores["modo"] or "novo", MODOS)
+        if modo is None:
+            erros.append(f"Linha {numero}: modo '{valores['modo']}' inválido (use {' ou '.join(MODOS)}).")
+        elif modo == "existente":
+            arquivo = _opcao(valores["nome"], existentes)
+            if arquivo is None:
+                erros.append(f"Linha {numero}: layout existente '{valores['nome']}' não encontrado.")
+            else:
+                layouts.append({"tipo": "Arquivo", "modo": "existente", "arquivo": arquivo})
+        else:
+            arquivo_tipo = _opcao(valores["arquivo_tipo"], TIPOS_ARQUIVO)
+            if arquivo_tipo is None:
+                erros.append(f"Linha {numero}: tipo de arquivo '{valores['arquivo_tipo']}' inválido.")
+            else:
+                layouts.append({
+                    "tipo": "Arquivo",
+                    "modo": "novo",
+                    "arquivo_tipo": arquivo_tipo,
+                    "detalhe": valores["detalhe"] if arquivo_tipo in TIPOS_COM_DETALHE else "",
+                    "nome": valores["nome"],
+                })
+    return layouts, erros
@@ -0,0 +1,193 @@
+import json
+import sqlite3
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+import encadeamento
+
+# ------------------------------------------------------------------
+# Histórico de versões do processo_config
+# ------------------------------------------------------------------
+# Cada gravação do config de um processo gera uma linha append-only em
+# processo_config_historico. A maioria das linhas guarda apenas o delta em
+# relação à versão anterior; a cada SNAPSHOT_A_CADA versões é gravado o
+# estado completo, o que limita a reconstrução a poucos deltas.
+#
+# Estado: {"layouts": [...], "retorno": {...}, "cnpjs": [...]}
+# Delta:  {"l": [[i1, i2, [layouts novos]], ...], "r": retorno, "c": cnpjs}
+#         "l" traz as substituições na lista de layouts (aplicadas de trás
+#         para frente); "r" e "c" só aparecem quando mudaram.
+
+SNAPSHOT_A_CADA = 20
+
+def criar_tabela(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processo_config_historico (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            processo_id INTEGER NOT NULL,
+            versao INTEGER NOT NULL,
+            criado_em TEXT NOT NULL,
+            snapshot INTEGER NOT NULL DEFAULT 0,
+            dados TEXT NOT NULL,
+            FOREIGN KEY(processo_id) REFERENCES processos(id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_historico_processo_versao
+        ON processo_config_historico(processo_id, versao)
+    ''')
+
+def estado(layouts: Optional[list], retorno: Optional[dict], cnpjs: Optional[list] = None) -> dict:
+    return {"layouts": layouts or [], "retorno": retorno or {}, "cnpjs": cnpjs or []}
+
+def estado_atual(conn: sqlite3.Connection, processo_id: int) -> Optional[dict]:
+    """
+    Estado gravado hoje em processo_config (None se o processo não tem config). Com linhas
+    duplicadas vale a de menor id, a mesma que gravar_config atualiza e o app carrega.
+    """
+    row = conn.execute(
+        "SELECT layouts, retorno, cnpjs FROM processo_config WHERE processo_id = ? ORDER BY id LIMIT 1", (processo_id,)
+    ).fetchone()
+    if not row:
+        return None
+    try:
+        return estado(
+            json.loads(row[0]) if row[0] else [],
+            json.loads(row[1]) if row[1] else {},
+            json.loads(row[2]) if row[2] else [],
+        )
+    except Exception as e:
+        print("DEBUG: Erro ao carregar config (histórico):", e)
+        return None
+
+def calcular_delta(anterior: dict, novo: dict) -> dict:
+    delta = {}
+    antigos = [json.dumps(l, sort_keys=True) for l in anterior["layouts"]]
+    novos = [json.dumps(l, sort_keys=True) for l in novo["layouts"]]
+    operacoes = [
+        [i1, i2, novo["layouts"][j1:j2]]
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, antigos, novos, autojunk=False).get_opcodes()
+        if tag != "equal"
+    ]
+    if operacoes:
+        delta["l"] = operacoes
+    if anterior["retorno"] != novo["retorno"]:
+        delta["r"] = novo["retorno"]
+    if anterior["cnpjs"] != novo["cnpjs"]:
+        delta["c"] = novo["cnpjs"]
+    return delta
+
+def aplicar_delta(base: dict, delta: dict) -> dict:
+    layouts = list(base["layouts"])
+    for i1, i2, itens in reversed(delta.get("l", [])):
+        layouts[i1:i2] = itens
+    return {
+        "layouts": layouts,
+        "retorno": delta.get("r", base["retorno"]),
+        "cnpjs": delta.get("c", base["cnpjs"]),
+    }
+
+def registrar(conn: sqlite3.Connection, processo_id: int, anterior: Optional[dict], novo: dict) -> None:
+    """
+    Acrescenta a nova versão do config ao histórico. `anterior` é o estado gravado
+    antes desta escrita (estado_atual lido na mesma transação).
+    Não faz commit: deve rodar na mesma transação que grava o processo_config.
+    """
+    ultima = conn.execute(
+        "SELECT MAX(versao), MAX(CASE WHEN snapshot = 1 THEN versao END) "
+        "FROM processo_config_historico WHERE processo_id = ?",
+        (processo_id,)
+    ).fetchone()
+    versao = (ultima[0] or 0) + 1
+    if ultima[0] is None or anterior is None or versao - (ultima[1] or 0) >= SNAPSHOT_A_CADA:
+        snapshot, dados = 1, novo
+    else:
+        dados = calcular_delta(anterior, novo)
+        if not dados:
+            return
+        snapshot = 0
+    conn.execute(
+        "INSERT INTO processo_config_historico (processo_id, versao, criado_em, snapshot, dados) VALUES (?, ?, ?, ?, ?)",
+        (processo_id, versao, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), snapshot, json.dumps(dados))
+    )
+
+def registrar_iniciais(conn: sqlite3.Connection, estados: List[Tuple[int, dict]]) -> None:
+    """
+    Grava de uma vez a primeira versão (snapshot) de processos recém-criados, como
+    na cópia de templates. Não faz commit.
+    """
+    criado_em = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany(
+        "INSERT INTO processo_config_historico (processo_id, versao, criado_em, snapshot, dados) VALUES (?, 1, ?, 1, ?)",
+        [(processo_id, criado_em, json.dumps(dados)) for processo_id, dados in estados]
+    )
+
+def versoes(conn: sqlite3.Connection, processo_id: int) -> List[Tuple[int, str, int]]:
+    """Lista (versao, criado_em, snapshot) das versões do processo, da mais recente para a mais antiga."""
+    return conn.execute(
+        "SELECT versao, criado_em, snapshot FROM processo_config_historico WHERE processo_id = ? ORDER BY versao DESC",
+        (processo_id,)
+    ).fetchall()
+
+def reconstruir(conn: sqlite3.Connection, processo_id: int, ate: str) -> Optional[dict]:
+    """
+    Estado do config do processo no instante `ate` ("AAAA-MM-DD HH:MM:SS").
+    Lê apenas o último snapshot anterior ao instante e os deltas seguintes.
+    Retorna None se o processo ainda não tinha config nesse instante.
+    """
+    alvo = conn.execute(
+        "SELECT MAX(versao) FROM processo_config_historico WHERE processo_id = ? AND criado_em <= ?",
+        (processo_id, ate)
+    ).fetchone()[0]
+    if alvo is None:
+        return None
+    base = conn.execute(
+        "SELECT MAX(versao) FROM processo_config_historico WHERE processo_id = ? AND snapshot = 1 AND versao <= ?",
+        (processo_id, alvo)
+    ).fetchone()[0]
+    atual = None
+    for snapshot, dados in conn.execute(
+        "SELECT snapshot, dados FROM processo_config_historico "
+        "WHERE processo_id = ? AND versao BETWEEN ? AND ? ORDER BY versao",
+        (processo_id, base, alvo)
+    ):
+        conteudo = json.loads(dados)
+        atual = conteudo if snapshot else aplicar_delta(atual, conteudo)
+    return atual
+
+def descrever_layout(layout: dict) -> str:
+    if layout.get("tipo") == "Encadeamento":
+        return f"🔁 {layout.get('processo') or 'Encadeamento'}"
+    return f"📗 {encadeamento.rotulo_layout(layout)}"
+
+def diferencas(antes: Optional[dict], depois: Optional[dict]) -> List[str]:
+    """Descrição legível do que mudou no escopo do processo entre dois estados."""
+    antes = antes or estado(None, None)
+    depois = depois or estado(None, None)
+    mudancas = []
+    layouts_antes = [descrever_layout(l) for l in antes["layouts"]]
+    layouts_depois = [descrever_layout(l) for l in depois["layouts"]]
+    for layout in layouts_depois:
+        if layout not in layouts_antes:
+            mudancas.append(f"Layout adicionado: {layout}")
+    for layout in layouts_antes:
+        if layout not in layouts_depois:
+            mudancas.append(f"Layout removido: {layout}")
+    if not mudancas and layouts_antes != layouts_depois:
+        mudancas.append("Ordem dos layouts alterada")
+    if antes["retorno"] != depois["retorno"]:
+        if not depois["retorno"]:
+            mudancas.append("Arquivo de retorno removido")
+        else:
+            mudancas.append(
+                f"Retorno: {antes['retorno'].get('tipo', '-')} ({antes['retorno'].get('proposito', '') or '-'}) → "
+                f"{depois['retorno'].get('tipo', '-')} ({depois['retorno'].get('proposito', '') or '-'})"
+            )
+    for cnpj in depois["cnpjs"]:
+        if cnpj not in antes["cnpjs"]:
+            mudancas.append(f"CNPJ incluído: {cnpj}")
+    for cnpj in antes["cnpjs"]:
+        if cnpj not in depois["cnpjs"]:
+            mudancas.append(f"CNPJ retirado: {cnpj}")
+    return mudancas
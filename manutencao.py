@@ -0,0 +1,100 @@
+import argparse
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import banco
+import particoes
+
+# ------------------------------------------------------------------
+# Manutenção do banco pela linha de comando
+# ------------------------------------------------------------------
+# Uso (com o app parado ou não; as escritas aguardam o lock do SQLite):
+#   python manutencao.py expurgar processos.db 3 7 12 --arquivar arquivados/
+#   python manutencao.py recuperar processos.db
+#   python manutencao.py converter processos.db   (uma vez, de preferência com o app parado)
+
+def expurgar(caminho: str, clientes: list, arquivar: str = "") -> dict:
+    """
+    Exclui os clientes (e tudo o que depende deles) em uma única transação.
+    Com `arquivar`, copia antes cada cliente para um arquivo próprio nesse diretório.
+    """
+    # Garante as FKs com cascata em bancos ainda não migrados pelo app
+    with closing(sqlite3.connect(caminho)) as conn:
+        banco.criar_schema(conn)
+        conn.commit()
+    if arquivar:
+        os.makedirs(arquivar, exist_ok=True)
+        marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for cliente_id in clientes:
+            particoes.copiar_cliente(caminho, os.path.join(arquivar, f"cliente_{cliente_id}_{marca}.db"), cliente_id)
+    with closing(banco.conectar(caminho, timeout=30, isolation_level=None)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            quantidades = banco.expurgar_clientes(conn, clientes)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    return quantidades
+
+def converter(caminho: str, timeout: float = 30.0) -> bool:
+    """
+    Passa um banco antigo para auto_vacuum = INCREMENTAL, com o VACUUM completo que
+    isso exige (trava as escritas enquanto dura). Aguarda o lock até `timeout`
+    segundos. Retorna False se o banco já estava convertido.
+    """
+    with closing(sqlite3.connect(caminho, timeout=timeout, isolation_level=None)) as conn:
+        if banco.vacuum_incremental_ativo(conn):
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+
+def recuperar(caminho: str, passo: int = 256) -> int:
+    """
+    Devolve todas as páginas livres ao sistema de arquivos, em transações curtas de
+    `passo` páginas. Bancos ainda não convertidos são convertidos antes (ver converter).
+    """
+    converter(caminho)
+    with closing(sqlite3.connect(caminho, timeout=30, isolation_level=None)) as conn:
+        total = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            liberadas = banco.recuperar_espaco(conn, passo)
+            conn.execute("COMMIT")
+            total += liberadas
+            if not liberadas:
+                return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco de processos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_expurgar = sub.add_parser("expurgar", help="Exclui clientes e todos os seus dados.")
+    p_expurgar.add_argument("banco", help="Arquivo SQLite, ex.: processos.db")
+    p_expurgar.add_argument("clientes", nargs="+", type=int, help="Códigos dos clientes")
+    p_expurgar.add_argument("--arquivar", default="", help="Diretório para guardar uma cópia de cada cliente antes")
+    p_recuperar = sub.add_parser("recuperar", help="Libera o espaço de registros excluídos sem um VACUUM bloqueante.")
+    p_recuperar.add_argument("banco", help="Arquivo SQLite, ex.: processos.db")
+    p_converter = sub.add_parser(
+        "converter", help="Ativa o auto_vacuum incremental em bancos antigos (VACUUM completo, uma única vez)."
+    )
+    p_converter.add_argument("bancos", nargs="+", help="Arquivos SQLite (o banco único ou as partições)")
+    args = parser.parse_args()
+
+    if args.comando == "expurgar":
+        quantidades = expurgar(args.banco, args.clientes, args.arquivar)
+        print(
+            f"{quantidades['clientes']} cliente(s), {quantidades['processos']} processo(s) e "
+            f"{quantidades['cnpjs']} CNPJ(s) excluídos."
+        )
+        print(f"{recuperar(args.banco)} página(s) liberada(s).")
+    elif args.comando == "recuperar":
+        print(f"{recuperar(args.banco)} página(s) liberada(s).")
+    elif args.comando == "converter":
+        for caminho in args.bancos:
+            print(f"{caminho}: {'convertido' if converter(caminho) else 'já usava auto_vacuum incremental'}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import versoes
+
+# ------------------------------------------------------------------
+# Modelos do domínio
+# ------------------------------------------------------------------
+# Objetos imutáveis (dataclasses com __slots__) no lugar das tuplas
+# posicionais e dos dicts soltos. O JSON de processo_config é validado e
+# decodificado uma única vez em carregar_cliente; o app guarda o resultado
+# por (cliente_id, versão dos dados) e todas as telas compartilham os mesmos
+# objetos enquanto o cliente não for alterado.
+
+TIPOS_LAYOUT = ("Arquivo", "Encadeamento")
+
+@dataclass(frozen=True, slots=True)
+class Cliente:
+    id: int
+    nome_empresa: str
+    logo: Optional[bytes]
+    nome_pessoa: str
+    cargo: str
+    email: str
+    celular: str
+
+@dataclass(frozen=True, slots=True)
+class Cnpj:
+    id: int
+    numero: str
+
+@dataclass(frozen=True, slots=True)
+class Processo:
+    id: int
+    nome: str
+    tipo: str
+    frequencia: str
+    configurado: bool = False
+    descricao: str = ""
+
+@dataclass(frozen=True, slots=True)
+class Layout:
+    """
+    Uma entrada do processo. Campos ausentes no JSON ficam None;
+    chaves desconhecidas são preservadas em `extras` para não se perderem ao regravar.
+    """
+    tipo: str
+    modo: Optional[str] = None
+    arquivo: Optional[str] = None
+    arquivo_tipo: Optional[str] = None
+    nome: Optional[str] = None
+    detalhe: Optional[str] = None
+    processo: Optional[str] = None
+    processo_id: Optional[int] = None
+    extras: Tuple[Tuple[str, Any], ...] = ()
+
+    @classmethod
+    def de_dict(cls, dados: Any) -> "Layout":
+        """Valida e converte um layout do JSON; levanta ValueError se ele não for reconhecível."""
+        if not isinstance(dados, dict) or dados.get("tipo") not in TIPOS_LAYOUT:
+            raise ValueError(f"layout inválido: {dados!r}")
+        conhecidos = {nome: dados.get(nome) for nome in _CAMPOS_LAYOUT}
+        extras = tuple(sorted((k, v) for k, v in dados.items() if k not in _CAMPOS_LAYOUT))
+        return cls(**conhecidos, extras=extras)
+
+    def para_dict(self) -> dict:
+        """Dict no formato gravado em processo_config.layouts."""
+        dados = {nome: getattr(self, nome) for nome in _CAMPOS_LAYOUT if getattr(self, nome) is not None}
+        if self.tipo == "Encadeamento":
+            dados.setdefault("processo", None)
+        dados.update(self.extras)
+        return dados
+
+    @property
+    def rotulo(self) -> Optional[str]:
+        """Rótulo compartilhado do layout de arquivo (o mesmo de encadeamento.rotulo_layout)."""
+        if self.tipo != "Arquivo":
+            return None
+        if self.modo == "novo":
+            return f"{self.arquivo_tipo or 'Desconhecido'} - {self.nome or 'SemNome'}"
+        return self.arquivo or "Layout Existente"
+
+_CAMPOS_LAYOUT = ("tipo", "modo", "arquivo", "arquivo_tipo", "nome", "detalhe", "processo", "processo_id")
+
+@dataclass(frozen=True, slots=True)
+class Retorno:
+    tipo: str
+    proposito: str = ""
+
+    def para_dict(self) -> dict:
+        return {"tipo": self.tipo, "proposito": self.proposito}
+
+@dataclass(frozen=True, slots=True)
+class ConfigProcesso:
+    processo_id: int
+    versao: int = 0
+    layouts: Tuple[Layout, ...] = ()
+    retorno: Optional[Retorno] = None
+    cnpjs: Tuple[str, ...] = ()
+    erros: Tuple[str, ...] = ()
+
+    def layouts_dicts(self) -> list:
+        return [layout.para_dict() for layout in self.layouts]
+
+    def retorno_dict(self) -> dict:
+        return self.retorno.para_dict() if self.retorno else {}
+
+@dataclass(frozen=True, slots=True)
+class DadosCliente:
+    """Tudo que as telas leem de um cliente, decodificado em uma versão dos dados."""
+    versao: int
+    cliente: Optional[Cliente]
+    cnpjs: Tuple[Cnpj, ...] = ()
+    processos: Tuple[Processo, ...] = ()
+    configs: Dict[int, ConfigProcesso] = field(default_factory=dict)
+
+    def processo(self, processo_id: int) -> Optional[Processo]:
+        return next((proc for proc in self.processos if proc.id == processo_id), None)
+
+    def config(self, processo_id: int) -> ConfigProcesso:
+        """Config do processo; um config vazio se ele ainda não foi configurado."""
+        return self.configs.get(processo_id) or ConfigProcesso(processo_id)
+
+# ------------------------------------------------------------------
+# Decodificação e carga
+# ------------------------------------------------------------------
+def _json(texto: Optional[str], padrao: Any, descricao: str, erros: list) -> Any:
+    if not texto:
+        return padrao
+    try:
+        return json.loads(texto)
+    except ValueError as e:
+        erros.append(f"{descricao}: JSON inválido ({e})")
+        return padrao
+
+def decodificar_config(processo_id: int, versao: int, layouts_str: Optional[str],
+                       retorno_str: Optional[str], cnpjs_str: Optional[str]) -> ConfigProcesso:
+    """
+    Converte as colunas de processo_config em um ConfigProcesso. Dados inválidos
+    não interrompem a carga: são descartados e descritos em `erros`.
+    """
+    erros = []
+    layouts = []
+    brutos = _json(layouts_str, [], "layouts", erros)
+    if not isinstance(brutos, list):
+        erros.append("layouts: esperada uma lista")
+        brutos = []
+    for posicao, dados in enumerate(brutos, start=1):
+        try:
+            layouts.append(Layout.de_dict(dados))
+        except ValueError as e:
+            erros.append(f"layout #{posicao}: {e}")
+
+    retorno = None
+    dados_retorno = _json(retorno_str, {}, "retorno", erros)
+    if isinstance(dados_retorno, dict) and dados_retorno.get("tipo"):
+        retorno = Retorno(dados_retorno["tipo"], dados_retorno.get("proposito") or "")
+    elif dados_retorno and not isinstance(dados_retorno, dict):
+        erros.append("retorno: esperado um objeto")
+
+    cnpjs = _json(cnpjs_str, [], "cnpjs", erros)
+    if not isinstance(cnpjs, list):
+        erros.append("cnpjs: esperada uma lista")
+        cnpjs = []
+
+    for erro in erros:
+        print(f"DEBUG: Config do processo {processo_id} com dados inválidos - {erro}")
+    return ConfigProcesso(processo_id, versao or 0, tuple(layouts), retorno, tuple(str(c) for c in cnpjs), tuple(erros))
+
+def carregar_cliente(conn: sqlite3.Connection, cliente_id: int) -> DadosCliente:
+    """Lê e decodifica o cliente, seus CNPJs, processos e configs em uma única transação de leitura."""
+    em_transacao = conn.in_transaction
+    if not em_transacao:
+        conn.execute("BEGIN")
+    try:
+        versao = versoes.versao_cliente(conn, cliente_id)
+        row = conn.execute(
+            "SELECT id, nome_empresa, logo, nome_pessoa, cargo, email, celular FROM cliente WHERE id = ?",
+            (cliente_id,)
+        ).fetchone()
+        cnpjs = conn.execute("SELECT id, numero FROM cnpjs WHERE cliente_id = ? ORDER BY id", (cliente_id,)).fetchall()
+        processos = conn.execute(
+            "SELECT id, nome, tipo, frequencia, configurado, descricao FROM processos WHERE cliente_id = ? ORDER BY id",
+            (cliente_id,)
+        ).fetchall()
+        # Bancos antigos podem ter mais de uma linha por processo; vale a primeira, como em gravar_config
+        configs_rows = conn.execute("""
+            SELECT pc.processo_id, pc.versao, pc.layouts, pc.retorno, pc.cnpjs
+            FROM processo_config pc
+            JOIN processos p ON p.id = pc.processo_id
+            WHERE p.cliente_id = ?
+            ORDER BY pc.id DESC
+        """, (cliente_id,)).fetchall()
+    finally:
+        if not em_transacao:
+            conn.rollback()
+
+    return DadosCliente(
+        versao=versao,
+        cliente=Cliente(*row) if row else None,
+        cnpjs=tuple(Cnpj(*c) for c in cnpjs),
+        processos=tuple(
+            Processo(pid, nome, tipo, frequencia, bool(configurado), descricao or "")
+            for pid, nome, tipo, frequencia, configurado, descricao in processos
+        ),
+        configs={pid: decodificar_config(pid, versao_config, *colunas) for pid, versao_config, *colunas in configs_rows},
+    )
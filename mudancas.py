@@ -0,0 +1,239 @@
+import argparse
+import json
+import sqlite3
+import sys
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# ------------------------------------------------------------------
+# Registro de mudanças (change data capture)
+# ------------------------------------------------------------------
+# Triggers acrescentam uma linha em `mudanca` a cada INSERT, UPDATE ou DELETE
+# em cliente, cnpjs, processos e processo_config, com o retrato da linha
+# gravada (em JSON) e um número de sequência crescente (seq, AUTOINCREMENT:
+# nunca reaproveitado, nem depois da poda). Quem mantém uma cópia dos dados
+# (backup, exportação, marts de relatório) guarda o último seq lido e pede só
+# o que veio depois; o custo acompanha o volume de mudanças, não o do banco.
+#
+# Com partições, cada arquivo tem o seu registro e a sua sequência.
+#
+# Uso:
+#   python mudancas.py ler processos.db --desde 120 --limite 500
+#   python mudancas.py podar processos.db --ate 120
+
+# tabela -> expressão que encontra o cliente dono da linha (REG = NEW/OLD)
+_CLIENTE_DA_LINHA = {
+    "cliente": "REG.id",
+    "cnpjs": "REG.cliente_id",
+    "processos": "REG.cliente_id",
+    "processo_config": "(SELECT cliente_id FROM processos WHERE id = REG.processo_id)",
+}
+# Colunas que não entram no retrato (binárias e grandes)
+_COLUNAS_IGNORADAS = {"cliente": {"logo"}}
+OPERACOES = {"INSERT": "I", "UPDATE": "U", "DELETE": "D"}
+# Índices derivados que guardam o cursor no próprio banco (uma linha, id = 1): podar não passa deles
+CURSORES_INTERNOS = ("similaridade_cursor", "recomendacao_cursor")
+
+@dataclass(frozen=True, slots=True)
+class Mudanca:
+    seq: int
+    tabela: str
+    operacao: str  # "I", "U" ou "D"
+    registro_id: int
+    cliente_id: Optional[int]
+    dados: Optional[dict]  # linha após a mudança; None em exclusões
+    criado_em: str
+
+def criar_tabela(conn: sqlite3.Connection) -> None:
+    """
+    Cria o registro de mudanças e as triggers. Uma trigger só é recriada se a sua
+    definição mudou (por exemplo, após uma migração acrescentar colunas), para que
+    processos do servidor iniciando juntos não disputem a recriação.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mudanca (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabela TEXT NOT NULL,
+            operacao TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            cliente_id INTEGER,
+            dados TEXT,
+            criado_em TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'))
+        )
+    ''')
+    esperadas = _triggers(conn)
+    atuais = dict(conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_mudanca_%'"
+    ).fetchall())
+    for nome in set(atuais) - set(esperadas):
+        conn.execute(f"DROP TRIGGER IF EXISTS {nome}")
+    for nome, sql in esperadas.items():
+        if nome in atuais and " ".join(atuais[nome].split()) == " ".join(sql.split()):
+            continue
+        conn.execute(f"DROP TRIGGER IF EXISTS {nome}")
+        conn.execute(sql.replace("CREATE TRIGGER", "CREATE TRIGGER IF NOT EXISTS", 1))
+
+def _triggers(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Nome -> CREATE TRIGGER de cada trigger do registro, para as colunas atuais das tabelas."""
+    triggers = {}
+    for tabela, cliente in _CLIENTE_DA_LINHA.items():
+        colunas = [
+            row[1] for row in conn.execute(f"PRAGMA table_info({tabela})").fetchall()
+            if row[1] not in _COLUNAS_IGNORADAS.get(tabela, set())
+        ]
+        for evento, operacao in OPERACOES.items():
+            reg = "OLD" if evento == "DELETE" else "NEW"
+            dados = "NULL" if evento == "DELETE" else (
+                "json_object(" + ", ".join(f"'{c}', NEW.{c}" for c in colunas) + ")"
+            )
+            nome = f"trg_mudanca_{tabela}_{evento.lower()}"
+            triggers[nome] = (
+                f"CREATE TRIGGER {nome} AFTER {evento} ON {tabela} BEGIN "
+                f"INSERT INTO mudanca (tabela, operacao, registro_id, cliente_id, dados) "
+                f"VALUES ('{tabela}', '{operacao}', {reg}.id, {cliente.replace('REG.', f'{reg}.')}, {dados}); END"
+            )
+    # Na cascata, o processo já não existe quando o config é excluído e o cliente do
+    # config ficaria desconhecido; exclui os configs antes, com o processo ainda visível.
+    triggers["trg_mudanca_processos_antes_delete"] = (
+        "CREATE TRIGGER trg_mudanca_processos_antes_delete BEFORE DELETE ON processos BEGIN "
+        "DELETE FROM processo_config WHERE processo_id = OLD.id; END"
+    )
+    return triggers
+
+def remover_triggers(conn: sqlite3.Connection) -> None:
+    """Remove as triggers do registro (antes de reconstruir tabelas; criar_tabela as recria)."""
+    for (nome,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_mudanca_%'"
+    ).fetchall():
+        conn.execute(f"DROP TRIGGER {nome}")
+
+# ------------------------------------------------------------------
+# Consumo
+# ------------------------------------------------------------------
+def ultimo_seq(conn: sqlite3.Connection) -> int:
+    """
+    Seq da mudança mais recente, mesmo que já podada (0 se nada foi registrado);
+    um cursor para começar do estado atual.
+    """
+    return max(conn.execute("SELECT COALESCE(MAX(seq), 0) FROM mudanca").fetchone()[0], podado_ate(conn))
+
+def mudancas_desde(conn: sqlite3.Connection, cursor: int = 0, limite: int = 1000,
+                   cliente_id: Optional[int] = None) -> Tuple[List[Mudanca], int]:
+    """
+    Mudanças com seq maior que `cursor`, em ordem, até `limite`. Retorna a lista
+    e o novo cursor (o seq da última devolvida, ou o próprio cursor se não houve nada).
+    Quem consome deve gravar o cursor só depois de aplicar as mudanças.
+    """
+    sql = "SELECT seq, tabela, operacao, registro_id, cliente_id, dados, criado_em FROM mudanca WHERE seq > ?"
+    params: list = [cursor]
+    if cliente_id is not None:
+        sql += " AND cliente_id = ?"
+        params.append(cliente_id)
+    sql += " ORDER BY seq LIMIT ?"
+    params.append(limite)
+    mudancas = [
+        Mudanca(seq, tabela, operacao, registro_id, cid, json.loads(dados) if dados else None, criado_em)
+        for seq, tabela, operacao, registro_id, cid, dados, criado_em in conn.execute(sql, params)
+    ]
+    return mudancas, (mudancas[-1].seq if mudancas else cursor)
+
+def processos_tocados(conn: sqlite3.Connection, cursor: Optional[int],
+                      limite: int = 5000) -> Tuple[Optional[Set[int]], int]:
+    """
+    Processos com mudanças em processos ou processo_config depois do cursor, e o novo
+    cursor; para os índices derivados que se reindexam por processo. Devolve None
+    (reconstruir tudo) se o consumidor ainda não tem cursor ou se mudanças não lidas
+    já foram podadas.
+    """
+    if cursor is None or podado_ate(conn) > cursor:
+        return None, cursor or 0
+    tocados: Set[int] = set()
+    config_excluido = False
+    while True:
+        lote, cursor = mudancas_desde(conn, cursor, limite)
+        for mudanca in lote:
+            if mudanca.tabela == "processos":
+                tocados.add(mudanca.registro_id)
+            elif mudanca.tabela == "processo_config":
+                if mudanca.dados:
+                    tocados.add(mudanca.dados.get("processo_id"))
+                else:
+                    config_excluido = True
+        if len(lote) < limite:
+            break
+    if config_excluido:
+        # Exclusões não guardam a linha, então o processo do config excluído não é
+        # conhecido; entram os processos que ficaram sem config (na cascata, o
+        # próprio processo excluído já veio pela mudança em processos)
+        tocados.update(pid for (pid,) in conn.execute(
+            "SELECT id FROM processos WHERE id NOT IN (SELECT processo_id FROM processo_config WHERE processo_id IS NOT NULL)"
+        ))
+    tocados.discard(None)
+    return tocados, cursor
+
+def compactar(mudancas: Iterable[Mudanca]) -> List[Mudanca]:
+    """
+    Mantém só a última mudança de cada registro (tabela, id), na ordem do seq.
+    Basta para quem sincroniza o estado final; quem precisa do histórico usa a lista completa.
+    """
+    ultimas: Dict[Tuple[str, int], Mudanca] = {}
+    for mudanca in mudancas:
+        ultimas.pop((mudanca.tabela, mudanca.registro_id), None)
+        ultimas[(mudanca.tabela, mudanca.registro_id)] = mudanca
+    return list(ultimas.values())
+
+def podado_ate(conn: sqlite3.Connection) -> int:
+    """Maior seq já descartado por podar (0 se nada foi podado)."""
+    menor = conn.execute("SELECT MIN(seq) FROM mudanca").fetchone()[0]
+    if menor is not None:
+        return menor - 1
+    # Registro vazio: tudo o que já foi numerado (sqlite_sequence guarda o maior seq) foi podado
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'mudanca'").fetchone()
+    return row[0] if row else 0
+
+def podar(conn: sqlite3.Connection, ate: int) -> int:
+    """
+    Mutação que descarta as mudanças com seq <= ate, sem passar do cursor dos índices
+    derivados gravados no próprio banco (CURSORES_INTERNOS). Consumidores de fora
+    (backup, exportação) ficam a cargo de quem escolhe `ate`. Retorna quantas foram descartadas.
+    """
+    for tabela in CURSORES_INTERNOS:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)).fetchone():
+            continue
+        row = conn.execute(f"SELECT seq FROM {tabela} WHERE id = 1").fetchone()
+        if row is not None:
+            ate = min(ate, row[0])
+    return conn.execute("DELETE FROM mudanca WHERE seq <= ?", (ate,)).rowcount
+
+def main():
+    parser = argparse.ArgumentParser(description="Registro de mudanças do banco de processos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_ler = sub.add_parser("ler", help="Lista as mudanças depois de um cursor, uma por linha (JSON).")
+    p_ler.add_argument("banco")
+    p_ler.add_argument("--desde", type=int, default=0, help="Último seq já lido")
+    p_ler.add_argument("--limite", type=int, default=1000)
+    p_ler.add_argument("--compactar", action="store_true", help="Só a última mudança de cada registro")
+    p_podar = sub.add_parser("podar", help="Descarta as mudanças já lidas.")
+    p_podar.add_argument("banco")
+    p_podar.add_argument("--ate", type=int, required=True, help="Maior seq a descartar")
+    args = parser.parse_args()
+
+    if args.comando == "ler":
+        with closing(sqlite3.connect(f"file:{args.banco}?mode=ro", uri=True)) as conn:
+            mudancas, cursor = mudancas_desde(conn, args.desde, args.limite)
+        for mudanca in compactar(mudancas) if args.compactar else mudancas:
+            print(json.dumps({
+                "seq": mudanca.seq, "tabela": mudanca.tabela, "operacao": mudanca.operacao,
+                "registro_id": mudanca.registro_id, "cliente_id": mudanca.cliente_id,
+                "dados": mudanca.dados, "criado_em": mudanca.criado_em,
+            }, ensure_ascii=False))
+        print(f"Cursor: {cursor}", file=sys.stderr)
+    elif args.comando == "podar":
+        with closing(sqlite3.connect(args.banco, timeout=30)) as conn:
+            removidas = podar(conn, args.ate)
+            conn.commit()
+        print(f"{removidas} mudança(s) descartada(s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import banco
+
+# ------------------------------------------------------------------
+# Particionamento do banco por cliente (modo opcional)
+# ------------------------------------------------------------------
+# Com o modo ativo, cada cliente fica em seu próprio arquivo SQLite dentro de
+# um diretório. O catálogo (catalogo.db, no mesmo diretório) mapeia
+# cliente_id -> arquivo e é quem gera os ids de novos clientes, para que
+# continuem únicos entre as partições. Recursos que atravessam clientes
+# (catálogo de layouts, contagem de uso) fazem fan-out sobre as partições.
+#
+# Uso para migrar um banco único:
+#   python particoes.py migrar processos.db particoes/
+
+ARQUIVO_CATALOGO = "catalogo.db"
+
+class ClienteSemParticao(KeyError):
+    """O cliente não está registrado no catálogo de partições."""
+
+class Roteador:
+    """Resolve o arquivo SQLite de cada cliente a partir do catálogo."""
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._caminhos = {}
+        with self._catalogo() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cliente_particao (
+                    cliente_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    arquivo TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._caminhos = {
+                cid: os.path.join(diretorio, arquivo)
+                for cid, arquivo in conn.execute("SELECT cliente_id, arquivo FROM cliente_particao").fetchall()
+            }
+
+    def _catalogo(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.diretorio, ARQUIVO_CATALOGO), timeout=30)
+
+    def caminho_cliente(self, cliente_id: int) -> str:
+        """Arquivo do cliente; levanta ClienteSemParticao se ele não existe no catálogo."""
+        caminho = self._caminhos.get(cliente_id)
+        if caminho is None:
+            # Outro processo do servidor pode ter criado o cliente depois da carga do catálogo
+            with self._catalogo() as conn:
+                row = conn.execute(
+                    "SELECT arquivo FROM cliente_particao WHERE cliente_id = ?", (cliente_id,)
+                ).fetchone()
+            if row is None:
+                raise ClienteSemParticao(cliente_id)
+            caminho = os.path.join(self.diretorio, row[0])
+            with self._lock:
+                self._caminhos[cliente_id] = caminho
+        return caminho
+
+    def novo_cliente(self, cliente_id: Optional[int] = None) -> Tuple[int, str]:
+        """
+        Registra um cliente no catálogo (gerando o id se não informado), cria o
+        arquivo da partição com o schema completo e retorna (cliente_id, caminho).
+        """
+        with self._lock, self._catalogo() as conn:
+            if cliente_id is None:
+                cliente_id = conn.execute("INSERT INTO cliente_particao (arquivo) VALUES ('')").lastrowid
+            else:
+                conn.execute("INSERT INTO cliente_particao (cliente_id, arquivo) VALUES (?, '')", (cliente_id,))
+            arquivo = f"cliente_{cliente_id}.db"
+            conn.execute("UPDATE cliente_particao SET arquivo = ? WHERE cliente_id = ?", (arquivo, cliente_id))
+            caminho = os.path.join(self.diretorio, arquivo)
+            with closing(sqlite3.connect(caminho)) as particao:
+                banco.criar_schema(particao)
+                particao.commit()
+            conn.commit()
+            self._caminhos[cliente_id] = caminho
+        return cliente_id, caminho
+
+    def remover_cliente(self, cliente_id: int) -> None:
+        """Tira o cliente do catálogo (após o expurgo); o arquivo da partição fica para arquivamento manual."""
+        with self._lock, self._catalogo() as conn:
+            conn.execute("DELETE FROM cliente_particao WHERE cliente_id = ?", (cliente_id,))
+            conn.commit()
+            self._caminhos.pop(cliente_id, None)
+
+    def caminhos(self) -> List[str]:
+        """Arquivos de todas as partições registradas."""
+        with self._catalogo() as conn:
+            rows = conn.execute("SELECT cliente_id, arquivo FROM cliente_particao ORDER BY cliente_id").fetchall()
+        with self._lock:
+            for cid, arquivo in rows:
+                self._caminhos.setdefault(cid, os.path.join(self.diretorio, arquivo))
+        return [os.path.join(self.diretorio, arquivo) for _, arquivo in rows]
+
+def fan_out(caminhos: List[str], sql: str, params: tuple = (),
+            conectar: Callable[[str], sqlite3.Connection] = sqlite3.connect) -> Iterator[tuple]:
+    """Executa a mesma consulta em cada banco e devolve as linhas de todos, em sequência."""
+    for caminho in caminhos:
+        conn = conectar(caminho)
+        try:
+            yield from conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+# ------------------------------------------------------------------
+# Migração de um banco único para partições
+# ------------------------------------------------------------------
+# tabela -> filtro que seleciona as linhas do cliente (? = cliente_id)
+_TABELAS_CLIENTE = [
+    ("cliente", "id = ?"),
+    ("cnpjs", "cliente_id = ?"),
+    ("processos", "cliente_id = ?"),
+    ("processo_config", "processo_id IN (SELECT id FROM origem.processos WHERE cliente_id = ?)"),
+    ("processo_encadeamento", "destino_id IN (SELECT id FROM origem.processos WHERE cliente_id = ?)"),
+    ("processo_layout", "processo_id IN (SELECT id FROM origem.processos WHERE cliente_id = ?)"),
+    ("processo_config_historico", "processo_id IN (SELECT id FROM origem.processos WHERE cliente_id = ?)"),
+    ("cliente_versao", "cliente_id = ?"),
+]
+
+def migrar(origem: str, diretorio: str) -> int:
+    """Copia cada cliente do banco único para sua partição. Retorna o número de clientes migrados."""
+    with sqlite3.connect(origem) as conn:
+        banco.criar_schema(conn)
+        conn.commit()
+        clientes = [row[0] for row in conn.execute("SELECT id FROM cliente ORDER BY id").fetchall()]
+    roteador = Roteador(diretorio)
+    for cliente_id in clientes:
+        _, caminho = roteador.novo_cliente(cliente_id)
+        copiar_cliente(origem, caminho, cliente_id)
+        print(f"Cliente {cliente_id} migrado para {caminho}")
+    return len(clientes)
+
+def copiar_cliente(origem: str, destino: str, cliente_id: int) -> None:
+    """
+    Copia todas as linhas do cliente do banco `origem` para `destino` (criando o schema
+    se preciso). A leitura da origem acontece em uma única transação, então a cópia é
+    um retrato consistente mesmo com o app gravando ao mesmo tempo.
+    """
+    with closing(sqlite3.connect(destino)) as copia:
+        banco.criar_schema(copia)
+        copia.commit()
+        copia.execute("ATTACH DATABASE ? AS origem", (origem,))
+        for tabela, filtro in _TABELAS_CLIENTE:
+            cols = ", ".join(banco.colunas(copia, tabela))
+            copia.execute(
+                f"INSERT OR REPLACE INTO main.{tabela} ({cols}) SELECT {cols} FROM origem.{tabela} WHERE {filtro}",
+                (cliente_id,)
+            )
+        copia.commit()
+        copia.execute("DETACH DATABASE origem")
+
+def main():
+    parser = argparse.ArgumentParser(description="Particionamento do banco de processos por cliente.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_migrar = sub.add_parser("migrar", help="Divide um banco único em uma partição por cliente.")
+    p_migrar.add_argument("origem", help="Banco único, ex.: processos.db")
+    p_migrar.add_argument("diretorio", help="Diretório das partições")
+    args = parser.parse_args()
+
+    if args.comando == "migrar":
+        total = migrar(args.origem, args.diretorio)
+        print(f"{total} cliente(s) migrado(s).")
+
+if __name__ == "__main__":
+    main()
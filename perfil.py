@@ -0,0 +1,379 @@
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import random
+import re
+import tempfile
+import zipfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+import formatos
+from tarefas import Tarefa
+
+# ------------------------------------------------------------------
+# Perfil de arquivos de amostra dos layouts
+# ------------------------------------------------------------------
+# O consultor anexa ao layout um arquivo de exemplo do cliente e o app
+# documenta as colunas: nome, tipo inferido, taxa de nulos e alguns exemplos,
+# além da quantidade de linhas. O perfil roda em segundo plano e usa memória
+# fixa, qualquer que seja o tamanho do arquivo:
+#   - CSV/TXT: o arquivo é mapeado em memória (mmap); as linhas são contadas
+#     em blocos e os tipos saem de uma amostra de AMOSTRA_LINHAS linhas lidas
+#     em posições aleatórias, sem percorrer o arquivo com o leitor de CSV;
+#   - Excel (.xlsx/.xlsm): a planilha é lida em fluxo direto do zip
+#     (iterparse, descartando cada linha após usá-la), com amostragem por
+#     reservatório; não depende do openpyxl.
+# Antes disso, formatos.detectar reconhece pelo conteúdo arquivos CNAB, OFX,
+# SPED, EDI e SWIFT, que em vez de colunas têm contagens por tipo de registro.
+# O resultado é guardado pelo hash SHA-256 do conteúdo: o mesmo arquivo
+# enviado de novo não é reprocessado.
+#
+# Uso:
+#   python perfil.py extrato.csv
+
+AMOSTRA_LINHAS = 2000
+LINHAS_INICIAIS = 200
+MAX_COLUNAS = 256
+MAX_EXEMPLOS = 3
+BLOCO = 8 * 1024 * 1024
+# Textos compartilhados do xlsx guardados para cabeçalho e exemplos; os demais só contam como texto
+MAX_TEXTOS_COMPARTILHADOS = 100_000
+EXTENSOES_TEXTO = {".csv", ".txt", ".tsv"}
+EXTENSOES_EXCEL = {".xlsx", ".xlsm"}
+
+class FormatoNaoSuportado(ValueError):
+    """Extensão de arquivo que o perfil não sabe ler."""
+
+# ------------------------------------------------------------------
+# Hash e cópia em blocos
+# ------------------------------------------------------------------
+def copiar_com_hash(origem: BinaryIO, destino: str) -> str:
+    """Copia o fluxo para `destino` em blocos, calculando o SHA-256 no caminho. Retorna o hash."""
+    sha = hashlib.sha256()
+    with open(destino, "wb") as saida:
+        while True:
+            bloco = origem.read(BLOCO)
+            if not bloco:
+                break
+            sha.update(bloco)
+            saida.write(bloco)
+    return sha.hexdigest()
+
+def hash_arquivo(caminho: str) -> str:
+    with open(caminho, "rb") as entrada:
+        return hashlib.file_digest(entrada, "sha256").hexdigest()
+
+def temporario(nome_original: str) -> str:
+    """Arquivo temporário com a mesma extensão do original (o perfil escolhe o leitor por ela)."""
+    descritor, caminho = tempfile.mkstemp(prefix="amostra_", suffix=os.path.splitext(nome_original)[1].lower())
+    os.close(descritor)
+    return caminho
+
+# ------------------------------------------------------------------
+# Tipos dos valores
+# ------------------------------------------------------------------
+_NULOS = {"", "null", "none", "na", "n/a", "nan", "-"}
+_INTEIRO = re.compile(r"^[+-]?\d+$")
+_DECIMAL = re.compile(r"^[+-]?(\d{1,3}(\.\d{3})+|\d+),\d+$|^[+-]?(\d{1,3}(,\d{3})+|\d+)\.\d+$")
+_DATA = re.compile(r"^(\d{2}/\d{2}/\d{4}|\d{4}-\d{2}-\d{2})([ T]\d{2}:\d{2}(:\d{2})?)?$")
+_BOOLEANO = {"true", "false", "verdadeiro", "falso", "sim", "nao", "não", "s", "n"}
+
+def tipo_valor(valor: Optional[str]) -> Optional[str]:
+    """Tipo de um valor textual; None para nulo. Inteiros com zero à esquerda (códigos, CNPJ) são texto."""
+    if valor is None:
+        return None
+    texto = valor.strip()
+    if texto.lower() in _NULOS:
+        return None
+    texto = texto.removeprefix("R$").strip()
+    if _INTEIRO.match(texto):
+        return "texto" if len(texto.lstrip("+-")) > 1 and texto.lstrip("+-").startswith("0") else "inteiro"
+    if _DECIMAL.match(texto):
+        return "decimal"
+    if _DATA.match(texto):
+        return "data"
+    if texto.lower() in _BOOLEANO:
+        return "booleano"
+    return "texto"
+
+def _tipo_coluna(contagem: Dict[str, int]) -> str:
+    tipos = set(contagem)
+    if not tipos:
+        return "vazio"
+    if len(tipos) == 1:
+        return tipos.pop()
+    if tipos == {"inteiro", "decimal"}:
+        return "decimal"
+    return "texto"
+
+def _colunas(cabecalho: Optional[List[str]], linhas: List[List[Optional[str]]]) -> List[dict]:
+    """Perfil de cada coluna a partir do cabeçalho e das linhas amostradas."""
+    largura = min(max([len(cabecalho or [])] + [len(linha) for linha in linhas]), MAX_COLUNAS)
+    colunas = []
+    for i in range(largura):
+        nome = (cabecalho[i] if cabecalho and i < len(cabecalho) else "") or f"coluna_{i + 1}"
+        contagem: Dict[str, int] = {}
+        nulos, exemplos = 0, []
+        for linha in linhas:
+            valor = linha[i] if i < len(linha) else None
+            tipo = tipo_valor(valor)
+            if tipo is None:
+                nulos += 1
+                continue
+            contagem[tipo] = contagem.get(tipo, 0) + 1
+            if len(exemplos) < MAX_EXEMPLOS and valor.strip()[:40] not in exemplos:
+                exemplos.append(valor.strip()[:40])
+        colunas.append({
+            "nome": nome.strip(),
+            "tipo": _tipo_coluna(contagem),
+            "nulos": round(nulos / len(linhas), 4) if linhas else 0.0,
+            "exemplos": exemplos,
+        })
+    return colunas
+
+# ------------------------------------------------------------------
+# CSV / TXT
+# ------------------------------------------------------------------
+def _codificacao(inicio: bytes) -> str:
+    if inicio.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    try:
+        # Descarta a última linha, que pode ter sido cortada no meio de um caractere
+        inicio[:inicio.rfind(b"\n") + 1 or len(inicio)].decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+def _dialeto(amostra: str) -> csv.Dialect:
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=";,\t|")
+    except csv.Error:
+        primeira = amostra.splitlines()[0] if amostra else ""
+        class Dialeto(csv.excel):
+            delimiter = max(";,\t|", key=primeira.count) if primeira else ";"
+        return Dialeto
+
+def _perfil_texto(tarefa: Optional[Tarefa], caminho: str) -> dict:
+    tamanho = os.path.getsize(caminho)
+    if tamanho == 0:
+        return {"formato": "Texto", "linhas": 0, "linhas_exatas": True, "amostra": 0, "colunas": []}
+    with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        inicio = mm[:min(tamanho, 256 * 1024)]
+        codificacao = _codificacao(inicio)
+        texto_inicio = inicio.decode(codificacao, errors="replace")
+        linhas_inicio = texto_inicio.splitlines()
+        if len(inicio) < tamanho and linhas_inicio:
+            linhas_inicio = linhas_inicio[:-1]
+        dialeto = _dialeto("\n".join(linhas_inicio[:50]))
+        lidas = list(csv.reader(linhas_inicio[:LINHAS_INICIAIS + 1], dialeto))
+        try:
+            tem_cabecalho = csv.Sniffer().has_header("\n".join(linhas_inicio[:50]))
+        except csv.Error:
+            tem_cabecalho = bool(lidas) and all(tipo_valor(v) in ("texto", None) for v in lidas[0])
+        cabecalho = lidas[0] if tem_cabecalho and lidas else None
+        amostra = lidas[1:] if cabecalho else lidas
+        fim_cabecalho = mm.find(b"\n") + 1 if cabecalho else 0
+
+        # Contagem das quebras de linha em blocos (rápida, sem decodificar)
+        quebras = 0
+        for posicao in range(0, tamanho, BLOCO):
+            quebras += mm[posicao:posicao + BLOCO].count(b"\n")
+            if tarefa is not None and posicao:
+                tarefa.atualizar(0.8 * posicao / tamanho, f"Contando linhas ({posicao / tamanho:.0%})...")
+        linhas = quebras + (0 if mm[tamanho - 1:tamanho] == b"\n" else 1) - (1 if cabecalho else 0)
+
+        # Amostra em posições aleatórias (reprodutível: a semente é o tamanho do arquivo)
+        if linhas > len(amostra):
+            sorteio = random.Random(tamanho)
+            inicios = set()
+            for _ in range(AMOSTRA_LINHAS * 2):
+                if len(inicios) >= AMOSTRA_LINHAS:
+                    break
+                quebra = mm.find(b"\n", sorteio.randrange(fim_cabecalho, tamanho))
+                if quebra != -1 and quebra + 1 < tamanho:
+                    inicios.add(quebra + 1)
+            if tarefa is not None:
+                tarefa.atualizar(0.9, f"Lendo {len(inicios)} linhas de amostra...")
+            for inicio_linha in sorted(inicios):
+                fim = mm.find(b"\n", inicio_linha)
+                bruto = mm[inicio_linha:fim if fim != -1 else tamanho].decode(codificacao, errors="replace")
+                amostra.extend(csv.reader([bruto.rstrip("\r")], dialeto))
+    return {
+        "formato": "Texto",
+        "codificacao": codificacao,
+        "delimitador": dialeto.delimiter,
+        "cabecalho": cabecalho is not None,
+        # Quebras de linha dentro de campos entre aspas contam como linhas
+        "linhas": max(linhas, 0),
+        "linhas_exatas": False,
+        "amostra": len(amostra),
+        "colunas": _colunas(cabecalho, amostra),
+    }
+
+# ------------------------------------------------------------------
+# Excel (.xlsx) em fluxo
+# ------------------------------------------------------------------
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+def _coluna_da_referencia(referencia: str) -> int:
+    indice = 0
+    for letra in referencia:
+        if not letra.isalpha():
+            break
+        indice = indice * 26 + (ord(letra.upper()) - 64)
+    return indice - 1
+
+def _primeira_planilha(zf: zipfile.ZipFile) -> Tuple[str, str]:
+    """(nome, caminho no zip) da primeira planilha da pasta de trabalho."""
+    livro = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    planilha = livro.find(f"{_NS}sheets/{_NS}sheet")
+    relacoes = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    alvo = next(
+        rel.get("Target") for rel in relacoes
+        if rel.get("Id") == planilha.get(f"{_NS_REL}id")
+    )
+    return planilha.get("name"), alvo.lstrip("/") if alvo.startswith("/") else f"xl/{alvo}"
+
+def _textos_compartilhados(zf: zipfile.ZipFile) -> List[Optional[str]]:
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    textos: List[Optional[str]] = []
+    with zf.open("xl/sharedStrings.xml") as fluxo:
+        for _, elemento in ElementTree.iterparse(fluxo):
+            if elemento.tag == f"{_NS}si":
+                textos.append(
+                    "".join(t.text or "" for t in elemento.iter(f"{_NS}t"))
+                    if len(textos) < MAX_TEXTOS_COMPARTILHADOS else None
+                )
+                elemento.clear()
+    return textos
+
+def _perfil_excel(tarefa: Optional[Tarefa], caminho: str) -> dict:
+    with zipfile.ZipFile(caminho) as zf:
+        nome_planilha, caminho_planilha = _primeira_planilha(zf)
+        textos = _textos_compartilhados(zf)
+        sorteio = random.Random(os.path.getsize(caminho))
+        cabecalho, amostra, linhas = None, [], 0
+        with zf.open(caminho_planilha) as fluxo:
+            for _, elemento in ElementTree.iterparse(fluxo):
+                if elemento.tag != f"{_NS}row":
+                    continue
+                valores: List[Optional[str]] = []
+                for celula in elemento.iter(f"{_NS}c"):
+                    indice = _coluna_da_referencia(celula.get("r", "")) if celula.get("r") else len(valores)
+                    if indice >= MAX_COLUNAS:
+                        continue
+                    valores.extend([None] * (indice - len(valores)))
+                    tipo, bruto = celula.get("t"), celula.findtext(f"{_NS}v")
+                    if tipo == "s" and bruto is not None:
+                        valor = textos[int(bruto)] if int(bruto) < len(textos) else None
+                        # Texto além do limite guardado: sabe-se só que é texto
+                        valores.append(valor if valor is not None else "(texto)")
+                    elif tipo == "inlineStr":
+                        valores.append("".join(t.text or "" for t in celula.iter(f"{_NS}t")))
+                    else:
+                        valores.append(bruto)
+                elemento.clear()
+                if cabecalho is None and linhas == 0 and valores and all(tipo_valor(v) in ("texto", None) for v in valores):
+                    cabecalho = [v or "" for v in valores]
+                    continue
+                linhas += 1
+                # Amostragem por reservatório: cada linha tem a mesma chance de estar na amostra
+                if len(amostra) < AMOSTRA_LINHAS:
+                    amostra.append(valores)
+                else:
+                    sorteada = sorteio.randrange(linhas)
+                    if sorteada < AMOSTRA_LINHAS:
+                        amostra[sorteada] = valores
+                if tarefa is not None and linhas % 10000 == 0:
+                    tarefa.atualizar(0.5, f"{linhas} linhas lidas...")
+    return {
+        "formato": "Excel",
+        "planilha": nome_planilha,
+        "cabecalho": cabecalho is not None,
+        "linhas": linhas,
+        "linhas_exatas": True,
+        "amostra": len(amostra),
+        "colunas": _colunas(cabecalho, amostra),
+    }
+
+# ------------------------------------------------------------------
+# Entrada principal
+# ------------------------------------------------------------------
+def perfilar(tarefa: Optional[Tarefa], caminho: str, nome_original: str, hash_conteudo: Optional[str] = None,
+             remover: bool = False) -> dict:
+    """
+    Perfil do arquivo (tarefa em segundo plano). Com `remover`, apaga o arquivo ao terminar
+    (cópia temporária de um upload). Levanta FormatoNaoSuportado para extensões desconhecidas.
+    """
+    try:
+        extensao = os.path.splitext(nome_original)[1].lower()
+        # Formatos bancários e fiscais são reconhecidos pelo conteúdo, qualquer que seja a extensão
+        resultado = formatos.detectar(tarefa, caminho) if extensao not in EXTENSOES_EXCEL else None
+        if resultado is None and extensao in EXTENSOES_TEXTO:
+            resultado = _perfil_texto(tarefa, caminho)
+            resultado.update(arquivo_tipo="TXT" if extensao == ".txt" else "CSV", detalhe="")
+        elif resultado is None and extensao in EXTENSOES_EXCEL:
+            resultado = _perfil_excel(tarefa, caminho)
+            resultado.update(arquivo_tipo="Excel", detalhe="")
+        elif resultado is None:
+            raise FormatoNaoSuportado(
+                f"Formato {extensao or 'sem extensão'} não reconhecido; use "
+                + ", ".join(sorted(EXTENSOES_TEXTO | EXTENSOES_EXCEL))
+                + " ou um arquivo CNAB, OFX, SPED, EDI ou SWIFT"
+            )
+        resultado.update({
+            "arquivo": os.path.basename(nome_original),
+            "hash": hash_conteudo or hash_arquivo(caminho),
+            "tamanho": os.path.getsize(caminho),
+        })
+        return resultado
+    finally:
+        if remover and os.path.exists(caminho):
+            os.remove(caminho)
+
+def resumo(perfil: dict) -> str:
+    """Uma linha com o essencial do perfil, para listas de layouts."""
+    linhas = f"{perfil.get('linhas', 0):,}".replace(",", ".")
+    if perfil.get("registros"):
+        return (
+            f"{perfil.get('arquivo', '?')}: {perfil.get('detalhe') or perfil.get('formato')}, "
+            f"{linhas} registro(s){'' if perfil.get('linhas_exatas') else ' (aprox.)'}"
+        )
+    return (
+        f"{perfil.get('arquivo', '?')}: {linhas} linha(s)"
+        f"{'' if perfil.get('linhas_exatas') else ' (aprox.)'}, {len(perfil.get('colunas', []))} coluna(s)"
+    )
+
+def preservar_perfis(novos: List[dict], anteriores: List[dict]) -> List[dict]:
+    """
+    Mantém nos layouts editados o perfil que já estava gravado (os editores só montam os
+    campos visíveis): pelo mesmo tipo de arquivo e nome, ou pela mesma posição.
+    """
+    def chave(layout):
+        return (layout.get("tipo"), layout.get("modo"), layout.get("arquivo_tipo"), layout.get("nome"), layout.get("arquivo"))
+    por_chave = {chave(l): l["perfil"] for l in anteriores if l.get("perfil")}
+    resultado = []
+    for posicao, layout in enumerate(novos):
+        if layout.get("tipo") == "Arquivo" and "perfil" not in layout:
+            perfil_anterior = por_chave.get(chave(layout))
+            if perfil_anterior is None and posicao < len(anteriores) and anteriores[posicao].get("tipo") == "Arquivo":
+                perfil_anterior = anteriores[posicao].get("perfil")
+            if perfil_anterior:
+                layout = {**layout, "perfil": perfil_anterior}
+        resultado.append(layout)
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil (colunas, tipos, nulos e linhas) de um arquivo de amostra.")
+    parser.add_argument("arquivo")
+    args = parser.parse_args()
+    print(json.dumps(perfilar(None, args.arquivo, args.arquivo), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
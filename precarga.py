@@ -0,0 +1,131 @@
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Hashable, Optional
+
+import modelos
+import relatorio
+import versoes
+from tarefas import Tarefa, TarefaCancelada
+
+# ------------------------------------------------------------------
+# Pré-carga do cliente após o login
+# ------------------------------------------------------------------
+# Depois do login o consultor quase sempre passa pela visão do cliente, pelos
+# processos, por alguns configs e pelo relatório. Uma tarefa em segundo plano
+# lê, enquanto a primeira tela é desenhada, os dados decodificados do cliente
+# (CNPJs, processos e configs) e monta o relatório com os diagramas de todos
+# os processos, na mesma versão dos dados. O resultado fica no CachePrecarga
+# até a primeira tela que o usar retirá-lo; dali em diante vale o cache
+# normal do app.
+#
+# O cache é único por processo do servidor e limitado por uma estimativa de
+# memória: a pré-carga mais antiga ainda não usada é descartada para dar lugar
+# à nova, e o que não cabe no orçamento simplesmente não é pré-carregado.
+# A tarefa é cancelada se a sessão terminar ou trocar de cliente.
+
+class CachePrecarga:
+    """LRU de valores pré-carregados, limitado pelo tamanho estimado; cada valor é retirado no primeiro uso."""
+
+    def __init__(self, orcamento_bytes: int):
+        self.orcamento_bytes = orcamento_bytes
+        self._valores: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._uso = 0
+        self._lock = threading.Lock()
+        self.estatisticas = {"guardados": 0, "acertos": 0, "descartados": 0, "recusados": 0}
+
+    @property
+    def uso_bytes(self) -> int:
+        return self._uso
+
+    def guardar(self, chave: Hashable, valor: Any, tamanho: int) -> bool:
+        """Guarda o valor, descartando os mais antigos se preciso. False se ele não cabe no orçamento."""
+        with self._lock:
+            if tamanho > self.orcamento_bytes:
+                self.estatisticas["recusados"] += 1
+                return False
+            anterior = self._valores.pop(chave, None)
+            if anterior is not None:
+                self._uso -= anterior[1]
+            while self._valores and self._uso + tamanho > self.orcamento_bytes:
+                _, (_, liberado) = self._valores.popitem(last=False)
+                self._uso -= liberado
+                self.estatisticas["descartados"] += 1
+            self._valores[chave] = (valor, tamanho)
+            self._uso += tamanho
+            self.estatisticas["guardados"] += 1
+            return True
+
+    def retirar(self, chave: Hashable) -> Optional[Any]:
+        """Devolve e remove o valor pré-carregado da chave (None se não houver)."""
+        with self._lock:
+            item = self._valores.pop(chave, None)
+            if item is None:
+                return None
+            self._uso -= item[1]
+            self.estatisticas["acertos"] += 1
+            return item[0]
+
+    def contem(self, chave: Hashable) -> bool:
+        with self._lock:
+            return chave in self._valores
+
+def tamanho_estimado(valor: Any, _vistos: Optional[set] = None) -> int:
+    """Bytes ocupados pelo valor e por tudo o que ele referencia (dataclasses, coleções, textos)."""
+    vistos = set() if _vistos is None else _vistos
+    if id(valor) in vistos:
+        return 0
+    vistos.add(id(valor))
+    total = sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        total += sum(tamanho_estimado(k, vistos) + tamanho_estimado(v, vistos) for k, v in valor.items())
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        total += sum(tamanho_estimado(item, vistos) for item in valor)
+    elif is_dataclass(valor) and not isinstance(valor, type):
+        total += sum(tamanho_estimado(getattr(valor, campo.name), vistos) for campo in fields(valor))
+    return total
+
+def precarregar_cliente(tarefa: Tarefa, conectar: Callable[[], sqlite3.Connection], cliente_id: int,
+                        cache: CachePrecarga, sessao_ativa: Callable[[], bool]) -> dict:
+    """
+    Tarefa em segundo plano: lê os dados do cliente e monta o relatório, guardando
+    ("dados", cliente_id, versao) e ("relatorio", cliente_id, versao) no cache.
+    Retorna a versão, os bytes guardados e o que ficou de fora do orçamento.
+    """
+    def continuar(progresso: float, mensagem: str) -> None:
+        if not sessao_ativa():
+            raise TarefaCancelada()
+        tarefa.atualizar(progresso, mensagem)
+
+    continuar(0.05, "Lendo dados do cliente...")
+    with closing(conectar()) as conn:
+        # Versão e dados no mesmo retrato, para a chave corresponder ao conteúdo
+        conn.execute("BEGIN")
+        versao = versoes.versao_cliente(conn, cliente_id)
+        dados = modelos.carregar_cliente(conn, cliente_id)
+        conn.rollback()
+    resultado = {"versao": versao, "bytes": 0, "fora_do_orcamento": []}
+
+    continuar(0.4, "Guardando dados do cliente...")
+    tamanho = tamanho_estimado(dados)
+    if cache.guardar(("dados", cliente_id, versao), dados, tamanho):
+        resultado["bytes"] += tamanho
+    else:
+        resultado["fora_do_orcamento"].append("dados")
+
+    continuar(0.5, "Montando relatório...")
+    resumo = relatorio.resumir(tarefa, dados)
+    continuar(0.95, "Guardando relatório...")
+    tamanho = tamanho_estimado(resumo)
+    if cache.guardar(("relatorio", cliente_id, versao), resumo, tamanho):
+        resultado["bytes"] += tamanho
+    else:
+        resultado["fora_do_orcamento"].append("relatorio")
+    print(
+        f"DEBUG: Cliente {cliente_id} pré-carregado (versão {versao}): {resultado['bytes'] / 1024:.0f} KB; "
+        f"cache em {cache.uso_bytes / 1024:.0f} de {cache.orcamento_bytes / 1024:.0f} KB"
+    )
+    return resultado
@@ -0,0 +1,380 @@
+import argparse
+import json
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Sequence
+
+import mudancas
+
+# ------------------------------------------------------------------
+# Recomendação de layouts por coocorrência
+# ------------------------------------------------------------------
+# Ao configurar um processo, sugere os layouts de entrada e os tipos de
+# arquivo de retorno que outros processos do mesmo tipo (Conciliação,
+# Pagamentos...) já usam. Cada processo vira um conjunto de itens:
+#   - "l:<rótulo>" para cada layout de arquivo, com o rótulo da lista de
+#     layouts existentes ("arquivo_tipo - nome");
+#   - "r:<tipo>" para o tipo do arquivo de retorno.
+# O índice guarda, por tipo de processo, quantos processos usam cada item
+# (recomendacao_item) e cada par de itens juntos (recomendacao_par, nas duas
+# ordens). A sugestão é a frequência do item no tipo, combinada com a maior
+# coocorrência com os itens que o processo já tem.
+#
+# Como o índice de semelhança, acompanha as gravações pelo registro de
+# mudanças: `sincronizar` desconta as contagens antigas dos processos tocados
+# (guardadas em recomendacao_processo) e soma as novas. A tela só consulta o
+# índice; nunca percorre processo_config.
+#
+# Com partições, cada arquivo tem o seu índice e as contagens são somadas.
+#
+# Uso:
+#   python recomendacao.py reconstruir processos.db
+#   python recomendacao.py sugerir processos.db --tipo Conciliação --item "l:CSV - Extrato"
+#   python recomendacao.py conferir processos.db
+
+PREFIXO_LAYOUT = "l:"
+PREFIXO_RETORNO = "r:"
+# Itens de um processo que entram nos pares (os pares crescem com o quadrado)
+MAX_ITENS_PARES = 40
+# Itens mais frequentes do tipo lidos de cada arquivo como candidatos
+MAX_CANDIDATOS = 200
+# Peso da coocorrência com os itens do processo; o restante é a frequência no tipo
+PESO_COOCORRENCIA = 0.6
+# Processos que precisam usar o item para ele ser sugerido
+MIN_PROCESSOS = 2
+
+def criar_tabelas(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recomendacao_processo (
+            processo_id INTEGER PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            itens TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recomendacao_tipo (
+            tipo TEXT PRIMARY KEY,
+            processos INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recomendacao_item (
+            tipo TEXT NOT NULL,
+            item TEXT NOT NULL,
+            processos INTEGER NOT NULL,
+            PRIMARY KEY (tipo, item)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recomendacao_item_frequencia ON recomendacao_item(tipo, processos)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recomendacao_par (
+            tipo TEXT NOT NULL,
+            item_a TEXT NOT NULL,
+            item_b TEXT NOT NULL,
+            processos INTEGER NOT NULL,
+            PRIMARY KEY (tipo, item_a, item_b)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recomendacao_cursor (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        )
+    ''')
+
+# ------------------------------------------------------------------
+# Itens de um processo
+# ------------------------------------------------------------------
+def itens(layouts: Iterable[dict], retorno: Optional[dict] = None) -> List[str]:
+    """Itens (layouts de arquivo e tipo de retorno) de um config, sem repetição e em ordem."""
+    encontrados = []
+    for layout in layouts:
+        if not isinstance(layout, dict) or layout.get("tipo", "Arquivo") != "Arquivo":
+            continue
+        if layout.get("modo") == "existente":
+            rotulo = str(layout.get("arquivo") or "").strip()
+        elif str(layout.get("nome") or "").strip():
+            rotulo = f"{layout.get('arquivo_tipo', 'Desconhecido')} - {str(layout['nome']).strip()}"
+        else:
+            rotulo = ""
+        if rotulo:
+            encontrados.append(PREFIXO_LAYOUT + rotulo)
+    if isinstance(retorno, dict) and retorno.get("tipo"):
+        encontrados.append(PREFIXO_RETORNO + str(retorno["tipo"]))
+    return sorted(set(encontrados))
+
+def _itens_json(layouts_json: Optional[str], retorno_json: Optional[str]) -> List[str]:
+    try:
+        layouts = json.loads(layouts_json) if layouts_json else []
+    except ValueError:
+        layouts = []
+    try:
+        retorno = json.loads(retorno_json) if retorno_json else {}
+    except ValueError:
+        retorno = {}
+    return itens(layouts if isinstance(layouts, list) else [], retorno)
+
+def _contribuicao(tipo: str, itens_: Sequence[str], sinal: int,
+                  por_tipo: Counter, por_item: Counter, por_par: Counter) -> None:
+    por_tipo[tipo] += sinal
+    for item in itens_:
+        por_item[(tipo, item)] += sinal
+    pares = list(itens_)[:MAX_ITENS_PARES]
+    for a in pares:
+        for b in pares:
+            if a != b:
+                por_par[(tipo, a, b)] += sinal
+
+# ------------------------------------------------------------------
+# Manutenção (mutações: rodam no escritor)
+# ------------------------------------------------------------------
+def reindexar(conn: sqlite3.Connection, processo_ids: Iterable[int]) -> int:
+    """Troca a contribuição dos processos pela do config atual (remove a dos que não existem mais)."""
+    ids = sorted(set(processo_ids))
+    por_tipo, por_item, por_par = Counter(), Counter(), Counter()
+    indexados = 0
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        marcas = ",".join("?" * len(lote))
+        for tipo, itens_json in conn.execute(
+            f"SELECT tipo, itens FROM recomendacao_processo WHERE processo_id IN ({marcas})", lote
+        ):
+            _contribuicao(tipo, json.loads(itens_json), -1, por_tipo, por_item, por_par)
+        conn.execute(f"DELETE FROM recomendacao_processo WHERE processo_id IN ({marcas})", lote)
+        registros = []
+        for pid, tipo, layouts_json, retorno_json in conn.execute(f"""
+            SELECT p.id, p.tipo, c.layouts, c.retorno
+            FROM processos p JOIN processo_config c ON c.id = (
+                SELECT id FROM processo_config WHERE processo_id = p.id ORDER BY id LIMIT 1
+            )
+            WHERE p.id IN ({marcas})
+        """, lote):
+            itens_ = _itens_json(layouts_json, retorno_json)
+            # Processos sem tipo ou ainda sem layouts não contam (nem no total do tipo)
+            if tipo and itens_:
+                registros.append((pid, tipo, json.dumps(itens_)))
+                _contribuicao(tipo, itens_, 1, por_tipo, por_item, por_par)
+        conn.executemany("INSERT INTO recomendacao_processo (processo_id, tipo, itens) VALUES (?, ?, ?)", registros)
+        indexados += len(registros)
+
+    conn.executemany("""
+        INSERT INTO recomendacao_tipo (tipo, processos) VALUES (?, ?)
+        ON CONFLICT (tipo) DO UPDATE SET processos = processos + excluded.processos
+    """, [(tipo, n) for tipo, n in por_tipo.items() if n])
+    conn.executemany("""
+        INSERT INTO recomendacao_item (tipo, item, processos) VALUES (?, ?, ?)
+        ON CONFLICT (tipo, item) DO UPDATE SET processos = processos + excluded.processos
+    """, [(*chave, n) for chave, n in por_item.items() if n])
+    conn.executemany("""
+        INSERT INTO recomendacao_par (tipo, item_a, item_b, processos) VALUES (?, ?, ?, ?)
+        ON CONFLICT (tipo, item_a, item_b) DO UPDATE SET processos = processos + excluded.processos
+    """, [(*chave, n) for chave, n in por_par.items() if n])
+    # Só as chaves descontadas podem ter zerado
+    conn.executemany(
+        "DELETE FROM recomendacao_tipo WHERE tipo = ? AND processos <= 0",
+        [(tipo,) for tipo, n in por_tipo.items() if n < 0]
+    )
+    conn.executemany(
+        "DELETE FROM recomendacao_item WHERE tipo = ? AND item = ? AND processos <= 0",
+        [chave for chave, n in por_item.items() if n < 0]
+    )
+    conn.executemany(
+        "DELETE FROM recomendacao_par WHERE tipo = ? AND item_a = ? AND item_b = ? AND processos <= 0",
+        [chave for chave, n in por_par.items() if n < 0]
+    )
+    return indexados
+
+def reconstruir(conn: sqlite3.Connection) -> int:
+    """Mutação que refaz o índice inteiro do arquivo e posiciona o cursor no registro de mudanças."""
+    for tabela in ("recomendacao_processo", "recomendacao_tipo", "recomendacao_item", "recomendacao_par"):
+        conn.execute(f"DELETE FROM {tabela}")
+    indexados = reindexar(conn, [pid for (pid,) in conn.execute("SELECT id FROM processos")])
+    conn.execute("INSERT OR REPLACE INTO recomendacao_cursor (id, seq) VALUES (1, ?)", (mudancas.ultimo_seq(conn),))
+    return indexados
+
+def sincronizar(conn: sqlite3.Connection, limite: int = 5000) -> int:
+    """Mutação que troca no índice as contagens dos processos alterados desde o cursor (ver similaridade.sincronizar)."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'recomendacao_cursor'").fetchone():
+        return 0
+    row = conn.execute("SELECT seq FROM recomendacao_cursor WHERE id = 1").fetchone()
+    tocados, cursor = mudancas.processos_tocados(conn, row[0] if row else None, limite)
+    if tocados is None:
+        return reconstruir(conn)
+    conn.execute("UPDATE recomendacao_cursor SET seq = ? WHERE id = 1", (cursor,))
+    return reindexar(conn, tocados) if tocados else 0
+
+# ------------------------------------------------------------------
+# Consultas
+# ------------------------------------------------------------------
+@dataclass
+class Contagens:
+    """Contagens de um tipo de processo lidas do índice (somáveis entre partições)."""
+    processos: int = 0
+    itens: Counter = field(default_factory=Counter)
+    pares: Counter = field(default_factory=Counter)  # (item do processo, candidato) -> processos
+
+    def somar(self, outra: "Contagens") -> "Contagens":
+        self.processos += outra.processos
+        self.itens.update(outra.itens)
+        self.pares.update(outra.pares)
+        return self
+
+@dataclass(frozen=True, slots=True)
+class Sugestao:
+    item: str
+    pontuacao: float
+    processos: int  # processos do tipo que usam o item
+    total: int  # processos do tipo no índice
+    junto_com: Optional[str]  # item do processo com a maior coocorrência
+    coocorrencia: float  # fração dos processos com `junto_com` que também usam o item
+
+    @property
+    def retorno(self) -> bool:
+        return self.item.startswith(PREFIXO_RETORNO)
+
+    @property
+    def rotulo(self) -> str:
+        return self.item[len(PREFIXO_RETORNO if self.retorno else PREFIXO_LAYOUT):]
+
+def contagens(conn: sqlite3.Connection, tipo: str, itens_processo: Sequence[str]) -> Contagens:
+    """Contagens do tipo no arquivo: os itens mais frequentes, os do processo e os pares com eles."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'recomendacao_tipo'").fetchone():
+        return Contagens()
+    row = conn.execute("SELECT processos FROM recomendacao_tipo WHERE tipo = ?", (tipo,)).fetchone()
+    if row is None:
+        return Contagens()
+    resultado = Contagens(row[0])
+    # Atribuição, não Counter.update: um item do processo que também está entre os
+    # mais frequentes vem nas duas consultas e não pode ser contado duas vezes
+    for item, n in conn.execute(
+        "SELECT item, processos FROM recomendacao_item WHERE tipo = ? ORDER BY processos DESC LIMIT ?",
+        (tipo, MAX_CANDIDATOS)
+    ):
+        resultado.itens[item] = n
+    proprios = list(itens_processo)
+    if proprios:
+        marcas = ",".join("?" * len(proprios))
+        for item, n in conn.execute(
+            f"SELECT item, processos FROM recomendacao_item WHERE tipo = ? AND item IN ({marcas})", [tipo, *proprios]
+        ):
+            resultado.itens[item] = n
+        for a, b, n in conn.execute(
+            f"SELECT item_a, item_b, processos FROM recomendacao_par WHERE tipo = ? AND item_a IN ({marcas})",
+            [tipo, *proprios]
+        ):
+            resultado.pares[(a, b)] = n
+    return resultado
+
+def recomendar(contagens_: Contagens, itens_processo: Sequence[str], limite: int = 5,
+               minimo: int = MIN_PROCESSOS) -> List[Sugestao]:
+    """
+    Itens que o processo ainda não tem, do mais provável ao menos. A pontuação é a
+    frequência do item no tipo; se o processo já tem itens conhecidos do índice, ela
+    é combinada (PESO_COOCORRENCIA) com a maior fração de coocorrência com eles.
+    """
+    total = contagens_.processos
+    proprios = set(itens_processo)
+    conhecidos = [item for item in proprios if contagens_.itens.get(item, 0) > 0]
+    sugestoes = []
+    for item, n in contagens_.itens.items():
+        if item in proprios or n < minimo or total <= 0:
+            continue
+        frequencia = n / total
+        melhor, coocorrencia = None, 0.0
+        for proprio in conhecidos:
+            valor = contagens_.pares.get((proprio, item), 0) / contagens_.itens[proprio]
+            if valor > coocorrencia:
+                melhor, coocorrencia = proprio, valor
+        pontuacao = (
+            PESO_COOCORRENCIA * coocorrencia + (1 - PESO_COOCORRENCIA) * frequencia if conhecidos else frequencia
+        )
+        sugestoes.append(Sugestao(item, pontuacao, n, total, melhor, coocorrencia))
+    return sorted(sugestoes, key=lambda s: (-s.pontuacao, -s.processos, s.item))[:limite]
+
+def conferir(conn: sqlite3.Connection, amostra: int = 20) -> List[str]:
+    """
+    Confere as sugestões com frações calculadas à mão a partir de processo_config (a
+    fonte, não o índice): para até `amostra` processos de cada tipo, total do tipo,
+    processos de cada item sugerido e a coocorrência. Lista vazia se tudo bate.
+    """
+    conjuntos = {}
+    for tipo, layouts_json, retorno_json in conn.execute("""
+        SELECT p.tipo, c.layouts, c.retorno
+        FROM processos p JOIN processo_config c ON c.id = (
+            SELECT id FROM processo_config WHERE processo_id = p.id ORDER BY id LIMIT 1
+        )
+    """):
+        itens_ = _itens_json(layouts_json, retorno_json)
+        if tipo and itens_:
+            # Como em _contribuicao, só os primeiros MAX_ITENS_PARES itens formam pares
+            conjuntos.setdefault(tipo, []).append((set(itens_), set(itens_[:MAX_ITENS_PARES])))
+    problemas = []
+    for tipo, processos in conjuntos.items():
+        def usam(item):
+            return sum(1 for conjunto, _ in processos if item in conjunto)
+        def usam_juntos(a, b):
+            return sum(1 for _, pares in processos if a in pares and b in pares)
+        for proprios, _ in processos[:amostra]:
+            for sugestao in recomendar(contagens(conn, tipo, sorted(proprios)), sorted(proprios), MAX_CANDIDATOS, 1):
+                esperada = max(
+                    (usam_juntos(proprio, sugestao.item) / usam(proprio) for proprio in proprios), default=0.0
+                )
+                calculado = (sugestao.total, sugestao.processos, round(sugestao.coocorrencia, 9))
+                manual = (len(processos), usam(sugestao.item), round(esperada, 9))
+                if calculado != manual:
+                    problemas.append(
+                        f"{tipo} / {sugestao.item}: índice (total, processos, coocorrência) = {calculado}, à mão = {manual}"
+                    )
+    return problemas
+
+def motivo(sugestao: Sugestao, tipo: str) -> str:
+    """Explicação curta da sugestão para a tela."""
+    texto = f"usado em {sugestao.processos} de {sugestao.total} processo(s) de {tipo}"
+    if sugestao.junto_com:
+        texto += f"; {sugestao.coocorrencia:.0%} dos que usam {sugestao.junto_com.split(':', 1)[1]} também o usam"
+    return texto
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice de recomendação de layouts por coocorrência.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_rec = sub.add_parser("reconstruir", help="Refaz o índice de cada banco.")
+    p_rec.add_argument("bancos", nargs="+")
+    p_sug = sub.add_parser("sugerir", help="Sugere itens para um processo do tipo informado.")
+    p_sug.add_argument("bancos", nargs="+")
+    p_sug.add_argument("--tipo", required=True)
+    p_sug.add_argument("--item", action="append", default=[], help="Item que o processo já tem (ex.: 'l:CSV - Extrato')")
+    p_sug.add_argument("--limite", type=int, default=5)
+    p_conf = sub.add_parser("conferir", help="Compara as sugestões com frações calculadas à mão a partir dos configs.")
+    p_conf.add_argument("bancos", nargs="+")
+    args = parser.parse_args()
+
+    if args.comando == "reconstruir":
+        for caminho in args.bancos:
+            inicio = time.perf_counter()
+            with closing(sqlite3.connect(caminho, timeout=30)) as conn:
+                criar_tabelas(conn)
+                indexados = reconstruir(conn)
+                conn.commit()
+            print(f"{caminho}: {indexados} processo(s) indexado(s) em {time.perf_counter() - inicio:.2f}s")
+    elif args.comando == "sugerir":
+        inicio = time.perf_counter()
+        total = Contagens()
+        for caminho in args.bancos:
+            with closing(sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)) as conn:
+                total.somar(contagens(conn, args.tipo, args.item))
+        for sugestao in recomendar(total, args.item, args.limite):
+            print(f"{sugestao.pontuacao:.2f}  {sugestao.item}  ({motivo(sugestao, args.tipo)})")
+        print(f"{total.processos} processo(s) de {args.tipo} em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    elif args.comando == "conferir":
+        for caminho in args.bancos:
+            with closing(sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)) as conn:
+                problemas = conferir(conn)
+            print(f"{caminho}: " + ("sugestões conferem" if not problemas else f"{len(problemas)} divergência(s)"))
+            for problema in problemas[:20]:
+                print(f"  {problema}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+from contextlib import closing
+from typing import Callable, Optional
+
+import diagramas
+import modelos
+from tarefas import Tarefa
+
+# ------------------------------------------------------------------
+# Montagem do relatório de quantidades e diagramas
+# ------------------------------------------------------------------
+# Roda fora da thread do Streamlit (via GerenciadorTarefas), por isso não
+# usa nenhuma função st.*: recebe a fábrica de conexões e devolve apenas
+# dados prontos para exibição.
+
+ENTRADAS = [
+    ("Excel", "Excel"),
+    ("Arquivos texto", "Arquivos texto (CSV, TXT, OFX, etc.)"),
+    ("Arquivos padrões especiais", "Arquivos com padrões especiais (CNAB, SPED, EDI, XML, SWIFT, etc.)"),
+    ("API / Banco de Dados", "API / Banco de Dados"),
+    ("PDF", "PDF"),
+]
+
+ANALISES = [
+    "Análise Tabular (Resultados)",
+    "Análise Comparativa (Conciliações)",
+    "Análise Composição (Saldos)",
+    "Análise Meios Pagamento",
+]
+
+SAIDAS = [
+    "Excel",
+    "Texto (CSV, TXT simples, OFX, etc.)",
+    "Texto Multi-estrutural (CNAB, SPED, EDI, XML, SWIFT, etc.)",
+    "API / Banco de Dados",
+    "PDF",
+    "HTML (Dashboard)",
+]
+
+def categoriza_layout_entrada(arquivo_tipo: str) -> str:
+    arquivo_tipo_lower = arquivo_tipo.lower()
+    if "excel" in arquivo_tipo_lower:
+        return "Excel"
+    if arquivo_tipo_lower in ["csv", "txt", "ofx"]:
+        return "Arquivos texto"
+    if arquivo_tipo_lower in ["cnab", "sped", "edi", "xml", "swift", "extrato adquirente"]:
+        return "Arquivos padrões especiais"
+    if arquivo_tipo_lower in ["api", "banco de dados"]:
+        return "API / Banco de Dados"
+    if arquivo_tipo_lower == "pdf":
+        return "PDF"
+    return "Arquivos texto"
+
+def categoriza_processo(tipo: str) -> Optional[str]:
+    tipo_lower = tipo.lower()
+    if tipo_lower == "análise tabular":
+        return "Análise Tabular (Resultados)"
+    if tipo_lower == "conciliação":
+        return "Análise Comparativa (Conciliações)"
+    if tipo_lower == "composição de saldos":
+        return "Análise Composição (Saldos)"
+    if tipo_lower == "pagamentos":
+        return "Análise Meios Pagamento"
+    return None
+
+def categoriza_saida(retorno_tipo: str) -> str:
+    r_lower = retorno_tipo.lower()
+    if "excel" in r_lower:
+        return "Excel"
+    if r_lower in ["csv", "txt", "ofx"]:
+        return "Texto (CSV, TXT simples, OFX, etc.)"
+    if r_lower in ["cnab", "sped", "edi", "xml", "swift", "extrato adquirente"]:
+        return "Texto Multi-estrutural (CNAB, SPED, EDI, XML, SWIFT, etc.)"
+    if r_lower in ["api", "banco de dados"]:
+        return "API / Banco de Dados"
+    if r_lower == "pdf":
+        return "PDF"
+    if r_lower == "html":
+        return "HTML (Dashboard)"
+    return "Texto (CSV, TXT simples, OFX, etc.)"
+
+def montar_relatorio(tarefa: Tarefa, get_db_connection: Callable, cliente_id: int) -> dict:
+    """
+    Calcula as tabelas de quantidades e o código Mermaid de cada processo do cliente.
+    Retorna {"entrada": [...], "analise": [...], "saida": [...], "diagramas": [(nome, codigo|None)]}.
+    """
+    tarefa.atualizar(0.05, "Lendo processos...")
+    with closing(get_db_connection()) as conn:
+        dados = modelos.carregar_cliente(conn, cliente_id)
+    return resumir(tarefa, dados)
+
+def resumir(tarefa: Tarefa, dados: modelos.DadosCliente) -> dict:
+    """Quantidades e diagramas a partir dos dados já carregados do cliente (ver montar_relatorio)."""
+    entrada_counts = {chave: 0 for chave, _ in ENTRADAS}
+    analise_counts = {chave: 0 for chave in ANALISES}
+    saida_counts = {chave: 0 for chave in SAIDAS}
+    diagramas_processos = []
+
+    total = max(len(dados.processos), 1)
+    for i, proc in enumerate(dados.processos, start=1):
+        tarefa.atualizar(0.05 + 0.9 * i / total, f"Processando {i}/{len(dados.processos)}: {proc.nome}")
+
+        cat_analise = categoriza_processo(proc.tipo or "")
+        if cat_analise:
+            analise_counts[cat_analise] += 1
+
+        config = dados.configs.get(proc.id)
+        if config is None:
+            diagramas_processos.append((proc.nome, None))
+            continue
+        for layout in config.layouts:
+            if layout.tipo == "Arquivo":
+                entrada_counts[categoriza_layout_entrada(layout.arquivo_tipo or "")] += 1
+        if config.retorno:
+            saida_counts[categoriza_saida(config.retorno.tipo)] += 1
+        diagramas_processos.append((proc.nome, diagramas.diagrama_processo(proc.nome, config.layouts, config.retorno)))
+
+    return {
+        "entrada": [{"TIPO ENTRADA": rotulo, "QUANTIDADE": entrada_counts[chave]} for chave, rotulo in ENTRADAS],
+        "analise": [{"TIPO ANÁLISE": chave, "QUANTIDADE": analise_counts[chave]} for chave in ANALISES],
+        "saida": [{"TIPO SAÍDA": chave, "QUANTIDADE": saida_counts[chave]} for chave in SAIDAS],
+        "diagramas": diagramas_processos,
+    }
@@ -0,0 +1,357 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import struct
+import time
+import unicodedata
+from collections import defaultdict
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+import mudancas
+
+# ------------------------------------------------------------------
+# Índice de semelhança entre processos (MinHash + LSH)
+# ------------------------------------------------------------------
+# Cada processo vira dois conjuntos de características, sem acentos nem
+# maiúsculas: os trigramas do nome e o "conteúdo" (palavras da descrição e
+# rótulos dos layouts). De cada conjunto sai uma assinatura MinHash de
+# NUM_HASHES valores, dividida em BANDAS faixas; processos que coincidem em
+# alguma faixa (mesma chave na tabela similaridade_banda) são candidatos, e só
+# os candidatos têm a semelhança calculada de fato. Assim a busca por
+# parecidos não compara todos os pares de processos.
+#
+# O índice acompanha as gravações pelo registro de mudanças (mudancas.py):
+# `sincronizar` lê as mudanças desde o último seq aplicado e reindexa só os
+# processos tocados. Se o registro foi podado além do cursor (ou o índice
+# ainda não existe), o índice é reconstruído.
+#
+# Com partições, cada arquivo tem o seu índice; as consultas percorrem todos.
+#
+# Uso:
+#   python similaridade.py duplicados processos.db --limiar 0.6
+#   python similaridade.py reconstruir processos.db
+
+NUM_HASHES = 64
+BANDAS = 16
+LINHAS_POR_BANDA = NUM_HASHES // BANDAS
+# Peso do nome na semelhança final; o restante vem do conteúdo, quando os dois processos têm conteúdo
+PESO_NOME = 0.7
+LIMIAR_PADRAO = 0.6
+# Rótulos de layout por faixa comparados dois a dois (catálogo pequeno; o excedente é ignorado)
+MAX_COMPARACOES_FAIXA = 50
+
+# Palavras que não distinguem processos
+_IRRELEVANTES = {"de", "da", "do", "das", "dos", "e", "a", "o", "em", "para", "x", "vs"}
+# Sufixo "- Grupo N" que o agrupamento de CNPJs acrescenta ao nome
+_SUFIXO_GRUPO = re.compile(r"\bgrupo\s+\S+$")
+_PRIMO = (1 << 61) - 1
+_gerador = random.Random(20240611)
+_PARAMETROS = [(_gerador.randrange(1, _PRIMO), _gerador.randrange(0, _PRIMO)) for _ in range(NUM_HASHES)]
+
+def criar_tabelas(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS similaridade_processo (
+            processo_id INTEGER PRIMARY KEY,
+            cliente_id INTEGER,
+            nome TEXT NOT NULL,
+            tipo TEXT,
+            caracteristicas TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS similaridade_banda (
+            banda INTEGER NOT NULL,
+            chave INTEGER NOT NULL,
+            processo_id INTEGER NOT NULL,
+            PRIMARY KEY (banda, chave, processo_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_similaridade_banda_processo ON similaridade_banda(processo_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS similaridade_cursor (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        )
+    ''')
+
+# ------------------------------------------------------------------
+# Características e assinaturas
+# ------------------------------------------------------------------
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas, sem acentos, pontuação, palavras irrelevantes e o sufixo de grupo."""
+    nfkd = unicodedata.normalize("NFKD", texto or "")
+    sem_acento = "".join(c for c in nfkd if not unicodedata.combining(c)).lower()
+    texto = _SUFIXO_GRUPO.sub("", " ".join(re.sub(r"[^a-z0-9]+", " ", sem_acento).split()))
+    return " ".join(p for p in texto.split() if p not in _IRRELEVANTES)
+
+def trigramas(texto: str) -> FrozenSet[str]:
+    """Trigramas de caracteres do texto normalizado (com bordas, para nomes curtos)."""
+    texto = f" {normalizar(texto)} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2)) if texto.strip() else frozenset()
+
+def conteudo(descricao: Optional[str], layouts: Iterable[dict]) -> FrozenSet[str]:
+    """Palavras da descrição e rótulos normalizados dos layouts."""
+    itens = {f"d:{palavra}" for palavra in normalizar(descricao).split()}
+    for layout in layouts:
+        if layout.get("tipo") == "Arquivo":
+            if layout.get("modo") == "existente":
+                rotulo = layout.get("arquivo")
+            else:
+                rotulo = f"{layout.get('arquivo_tipo', '')} {layout.get('nome', '')}"
+        else:
+            rotulo = f"encadeamento {layout.get('processo') or ''}"
+        if normalizar(rotulo):
+            itens.add(f"l:{normalizar(rotulo)}")
+    return frozenset(itens)
+
+def _hash(texto: str) -> int:
+    return int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), "little")
+
+def assinatura(caracteristicas: Iterable[str]) -> Tuple[int, ...]:
+    """MinHash do conjunto: para cada função de hash, o menor valor entre as características."""
+    hashes = [_hash(c) for c in set(caracteristicas)]
+    if not hashes:
+        return ()
+    return tuple(min((a * h + b) % _PRIMO for h in hashes) for a, b in _PARAMETROS)
+
+def chaves_bandas(assinatura_: Sequence[int], deslocamento: int = 0) -> List[Tuple[int, int]]:
+    """(banda, chave) de cada faixa da assinatura; `deslocamento` separa as faixas do nome e do conteúdo."""
+    chaves = []
+    for banda in range(BANDAS if assinatura_ else 0):
+        faixa = assinatura_[banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA]
+        digest = hashlib.blake2b(struct.pack(f"{LINHAS_POR_BANDA}Q", *faixa), digest_size=8).digest()
+        chaves.append((deslocamento + banda, int.from_bytes(digest, "little", signed=True)))
+    return chaves
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if (a or b) else 0.0
+
+def semelhanca(nome_a: FrozenSet[str], conteudo_a: FrozenSet[str],
+               nome_b: FrozenSet[str], conteudo_b: FrozenSet[str]) -> float:
+    """Semelhança de 0 a 1: o nome pesa PESO_NOME; sem conteúdo em um dos lados, vale só o nome."""
+    if not conteudo_a or not conteudo_b:
+        return jaccard(nome_a, nome_b)
+    return PESO_NOME * jaccard(nome_a, nome_b) + (1 - PESO_NOME) * jaccard(conteudo_a, conteudo_b)
+
+def _caracteristicas(nome: str, descricao: Optional[str], layouts_json: Optional[str]) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    try:
+        layouts = json.loads(layouts_json) if layouts_json else []
+    except ValueError:
+        layouts = []
+    return trigramas(nome), conteudo(descricao, layouts if isinstance(layouts, list) else [])
+
+# ------------------------------------------------------------------
+# Manutenção (mutações: rodam no escritor)
+# ------------------------------------------------------------------
+def reindexar(conn: sqlite3.Connection, processo_ids: Iterable[int]) -> int:
+    """Recalcula as entradas dos processos (remove as dos que não existem mais). Retorna quantos indexou."""
+    ids = sorted(set(processo_ids))
+    indexados = 0
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        marcas = ",".join("?" * len(lote))
+        conn.execute(f"DELETE FROM similaridade_banda WHERE processo_id IN ({marcas})", lote)
+        conn.execute(f"DELETE FROM similaridade_processo WHERE processo_id IN ({marcas})", lote)
+        linhas = conn.execute(f"""
+            SELECT p.id, p.cliente_id, p.nome, p.tipo, p.descricao,
+                   (SELECT c.layouts FROM processo_config c WHERE c.processo_id = p.id ORDER BY c.id LIMIT 1)
+            FROM processos p WHERE p.id IN ({marcas})
+        """, lote).fetchall()
+        registros, bandas = [], []
+        for pid, cliente_id, nome, tipo, descricao, layouts_json in linhas:
+            nome_c, conteudo_c = _caracteristicas(nome, descricao, layouts_json)
+            registros.append((pid, cliente_id, nome or "", tipo, json.dumps([sorted(nome_c), sorted(conteudo_c)])))
+            for banda, chave in chaves_bandas(assinatura(nome_c)) + chaves_bandas(assinatura(conteudo_c), BANDAS):
+                bandas.append((banda, chave, pid))
+        conn.executemany(
+            "INSERT INTO similaridade_processo (processo_id, cliente_id, nome, tipo, caracteristicas) VALUES (?, ?, ?, ?, ?)",
+            registros
+        )
+        conn.executemany("INSERT OR IGNORE INTO similaridade_banda (banda, chave, processo_id) VALUES (?, ?, ?)", bandas)
+        indexados += len(registros)
+    return indexados
+
+def reconstruir(conn: sqlite3.Connection) -> int:
+    """Mutação que refaz o índice inteiro do arquivo e posiciona o cursor no registro de mudanças."""
+    conn.execute("DELETE FROM similaridade_banda")
+    conn.execute("DELETE FROM similaridade_processo")
+    indexados = reindexar(conn, [pid for (pid,) in conn.execute("SELECT id FROM processos")])
+    conn.execute("INSERT OR REPLACE INTO similaridade_cursor (id, seq) VALUES (1, ?)", (mudancas.ultimo_seq(conn),))
+    return indexados
+
+def sincronizar(conn: sqlite3.Connection, limite: int = 5000) -> int:
+    """
+    Mutação que aplica ao índice as mudanças registradas desde o último seq lido.
+    Processos tocados por mudanças em processos ou processo_config são reindexados.
+    Arquivos sem o índice (ex.: o catálogo das partições) são ignorados.
+    Retorna quantos processos foram reindexados.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'similaridade_cursor'").fetchone():
+        return 0
+    row = conn.execute("SELECT seq FROM similaridade_cursor WHERE id = 1").fetchone()
+    tocados, cursor = mudancas.processos_tocados(conn, row[0] if row else None, limite)
+    if tocados is None:
+        # Sem índice, ou mudanças ainda não lidas já foram podadas
+        return reconstruir(conn)
+    conn.execute("UPDATE similaridade_cursor SET seq = ? WHERE id = 1", (cursor,))
+    return reindexar(conn, tocados) if tocados else 0
+
+# ------------------------------------------------------------------
+# Consultas
+# ------------------------------------------------------------------
+@dataclass(frozen=True, slots=True)
+class Semelhante:
+    arquivo: str
+    processo_id: int
+    cliente_id: Optional[int]
+    cliente: str
+    nome: str
+    tipo: Optional[str]
+    semelhanca: float
+
+def _carregar(conn: sqlite3.Connection, processo_ids: Iterable[int]) -> Dict[int, tuple]:
+    """processo_id -> (cliente_id, cliente, nome, tipo, trigramas do nome, conteúdo)."""
+    ids = list(processo_ids)
+    resultado = {}
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        for pid, cliente_id, cliente, nome, tipo, caracteristicas in conn.execute(f"""
+            SELECT s.processo_id, s.cliente_id, COALESCE(c.nome_empresa, ''), s.nome, s.tipo, s.caracteristicas
+            FROM similaridade_processo s LEFT JOIN cliente c ON c.id = s.cliente_id
+            WHERE s.processo_id IN ({','.join('?' * len(lote))})
+        """, lote):
+            nome_c, conteudo_c = json.loads(caracteristicas)
+            resultado[pid] = (cliente_id, cliente, nome, tipo, frozenset(nome_c), frozenset(conteudo_c))
+    return resultado
+
+def sugerir(conn: sqlite3.Connection, arquivo: str, nome: str, descricao: str = "", layouts: Iterable[dict] = (),
+            limite: int = 5, limiar: float = 0.4) -> List[Semelhante]:
+    """
+    Processos do arquivo mais parecidos com o informado (por exemplo, ao criar um
+    processo novo), do mais parecido ao menos. Com partições, consulte cada arquivo.
+    """
+    nome_c, conteudo_c = trigramas(nome), conteudo(descricao, layouts)
+    chaves = chaves_bandas(assinatura(nome_c)) + chaves_bandas(assinatura(conteudo_c), BANDAS)
+    if not chaves:
+        return []
+    filtro = " OR ".join("(banda = ? AND chave = ?)" for _ in chaves)
+    candidatos = [pid for (pid,) in conn.execute(
+        f"SELECT DISTINCT processo_id FROM similaridade_banda WHERE {filtro}", [v for chave in chaves for v in chave]
+    )]
+    encontrados = []
+    for pid, (cliente_id, cliente, nome_p, tipo, nome_i, conteudo_i) in _carregar(conn, candidatos).items():
+        valor = semelhanca(nome_c, conteudo_c, nome_i, conteudo_i)
+        if valor >= limiar:
+            encontrados.append(Semelhante(arquivo, pid, cliente_id, cliente, nome_p, tipo, valor))
+    return sorted(encontrados, key=lambda s: -s.semelhanca)[:limite]
+
+def grupos_duplicados(caminhos: Iterable[str], limiar: float = LIMIAR_PADRAO) -> List[List[Semelhante]]:
+    """
+    Grupos de processos prováveis duplicados em todos os arquivos. Em cada faixa
+    coincidente, os processos são comparados com o primeiro dela (e não todos com
+    todos); pares confirmados pela semelhança unem grupos, e os grupos se completam
+    pelas outras faixas. Em cada grupo, `semelhanca` é a maior semelhança confirmada
+    do processo com outro do grupo.
+    """
+    faixas: Dict[Tuple[int, int], List[Tuple[str, int]]] = defaultdict(list)
+    dados: Dict[Tuple[str, int], tuple] = {}
+    for caminho in caminhos:
+        with closing(sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)) as conn:
+            # Só as faixas com mais de um processo; o agrupamento percorre a chave primária
+            for banda, chave, ids in conn.execute("""
+                SELECT banda, chave, group_concat(processo_id) FROM similaridade_banda
+                GROUP BY banda, chave HAVING COUNT(*) > 1
+            """):
+                faixas[(banda, chave)].extend((caminho, int(pid)) for pid in ids.split(","))
+            dados.update({(caminho, pid): valor for pid, valor in _carregar(
+                conn, [pid for (pid,) in conn.execute("SELECT processo_id FROM similaridade_processo")]
+            ).items()})
+
+    pai: Dict[Tuple[str, int], Tuple[str, int]] = {}
+    def raiz(item):
+        topo = item
+        while pai.get(topo, topo) != topo:
+            topo = pai[topo]
+        while item != topo:
+            pai[item], item = topo, pai[item]
+        return topo
+
+    melhor: Dict[Tuple[str, int], float] = {}
+    comparados = set()
+    for membros in faixas.values():
+        a = min(membros)
+        if a not in dados:
+            continue
+        _, _, _, _, nome_a, conteudo_a = dados[a]
+        raiz_a = raiz(a)
+        for b in membros:
+            if b == a or (a, b) in comparados or b not in dados:
+                continue
+            comparados.add((a, b))
+            raiz_b = raiz(b)
+            if raiz_b == raiz_a:
+                continue
+            valor = semelhanca(nome_a, conteudo_a, dados[b][4], dados[b][5])
+            if valor < limiar:
+                continue
+            melhor[a] = max(melhor.get(a, 0.0), valor)
+            melhor[b] = max(melhor.get(b, 0.0), valor)
+            pai[raiz_b] = raiz_a
+
+    grupos: Dict[Tuple[str, int], List[Semelhante]] = defaultdict(list)
+    for item, valor in melhor.items():
+        cliente_id, cliente, nome, tipo, _, _ = dados[item]
+        grupos[raiz(item)].append(Semelhante(item[0], item[1], cliente_id, cliente, nome, tipo, valor))
+    return sorted(
+        (sorted(grupo, key=lambda s: (s.cliente, s.nome)) for grupo in grupos.values()),
+        key=lambda grupo: (-max(s.semelhanca for s in grupo), -len(grupo))
+    )
+
+def rotulos_parecidos(rotulos: Iterable[str], limiar: float = LIMIAR_PADRAO) -> List[Tuple[str, str, float]]:
+    """Pares de rótulos de layout quase iguais (ex.: "Extrato Banco" e "Extrato bancario"), com a semelhança."""
+    conjuntos = {rotulo: trigramas(rotulo) for rotulo in set(rotulos)}
+    faixas: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+    for rotulo, conjunto in conjuntos.items():
+        for faixa in chaves_bandas(assinatura(conjunto)):
+            faixas[faixa].append(rotulo)
+    pares = {}
+    for membros in faixas.values():
+        membros = sorted(membros)[:MAX_COMPARACOES_FAIXA]
+        for i, a in enumerate(membros):
+            for b in membros[i + 1:]:
+                if (a, b) not in pares:
+                    pares[(a, b)] = jaccard(conjuntos[a], conjuntos[b])
+    return sorted(((a, b, v) for (a, b), v in pares.items() if v >= limiar), key=lambda par: -par[2])
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice de semelhança entre processos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_rec = sub.add_parser("reconstruir", help="Refaz o índice de cada banco.")
+    p_rec.add_argument("bancos", nargs="+")
+    p_dup = sub.add_parser("duplicados", help="Lista os grupos de prováveis duplicados.")
+    p_dup.add_argument("bancos", nargs="+")
+    p_dup.add_argument("--limiar", type=float, default=LIMIAR_PADRAO)
+    args = parser.parse_args()
+
+    if args.comando == "reconstruir":
+        for caminho in args.bancos:
+            inicio = time.perf_counter()
+            with closing(sqlite3.connect(caminho, timeout=30)) as conn:
+                criar_tabelas(conn)
+                indexados = reconstruir(conn)
+                conn.commit()
+            print(f"{caminho}: {indexados} processo(s) indexado(s) em {time.perf_counter() - inicio:.2f}s")
+    elif args.comando == "duplicados":
+        inicio = time.perf_counter()
+        grupos = grupos_duplicados(args.bancos, args.limiar)
+        for grupo in grupos:
+            print(" | ".join(f"{s.cliente} / {s.nome} ({s.semelhanca:.0%})" for s in grupo))
+        print(f"{len(grupos)} grupo(s) em {time.perf_counter() - inicio:.2f}s")
+
+if __name__ == "__main__":
+    main()
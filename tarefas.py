@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+# ------------------------------------------------------------------
+# Execução de tarefas pesadas em segundo plano
+# ------------------------------------------------------------------
+# O gerenciador é um objeto de processo (criado via st.cache_resource no app),
+# compartilhado entre sessões. Cada tarefa é identificada por uma chave, por
+# exemplo ("relatorio", cliente_id, versao): enquanto a chave não muda, a
+# mesma tarefa (em andamento ou concluída) é reaproveitada.
+#
+# Há duas filas: a das tarefas interativas (relatório, pré-carga do login) e a
+# das pesadas (backup, perfil de amostras, exportação do portfólio), submetidas
+# com `pesada=True`. Um backup longo ou o perfil de um arquivo grande ocupam só
+# a fila das pesadas e não atrasam os relatórios que alguém está esperando.
+
+class TarefaCancelada(Exception):
+    """Levantada dentro da tarefa quando o cancelamento foi solicitado."""
+
+class Tarefa:
+    """Estado de uma tarefa: progresso, cancelamento e resultado."""
+
+    def __init__(self, chave: Hashable):
+        self.chave = chave
+        self.progresso = 0.0
+        self.mensagem = "Na fila..."
+        self.resultado: Any = None
+        self.erro: Optional[BaseException] = None
+        self.inicio = time.time()
+        self.fim: Optional[float] = None
+        self._cancelar = threading.Event()
+
+    @property
+    def concluida(self) -> bool:
+        return self.fim is not None and self.erro is None and not self.cancelada
+
+    @property
+    def em_andamento(self) -> bool:
+        return self.fim is None
+
+    @property
+    def cancelada(self) -> bool:
+        return self._cancelar.is_set()
+
+    def cancelar(self) -> None:
+        self._cancelar.set()
+
+    def atualizar(self, progresso: float, mensagem: str = "") -> None:
+        """Registra o progresso (0 a 1) e interrompe a tarefa se ela foi cancelada."""
+        if self._cancelar.is_set():
+            raise TarefaCancelada()
+        self.progresso = max(0.0, min(1.0, progresso))
+        if mensagem:
+            self.mensagem = mensagem
+
+class GerenciadorTarefas:
+    """
+    Pools de threads (interativas e pesadas) com registro das tarefas por chave.
+    Guarda no máximo `max_resultados` tarefas finalizadas; as mais antigas são descartadas.
+    """
+
+    def __init__(self, max_workers: int = 2, max_resultados: int = 64, max_workers_pesadas: int = 1):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tarefa")
+        self._pool_pesadas = ThreadPoolExecutor(max_workers=max_workers_pesadas, thread_name_prefix="tarefa-pesada")
+        self._tarefas: "OrderedDict[Hashable, Tarefa]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_resultados = max_resultados
+
+    def obter(self, chave: Hashable) -> Optional[Tarefa]:
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                self._tarefas.move_to_end(chave)
+            return tarefa
+
+    def submeter(self, chave: Hashable, funcao: Callable[..., Any], *args, pesada: bool = False, **kwargs) -> Tarefa:
+        """
+        Agenda `funcao(tarefa, *args, **kwargs)` em segundo plano, a menos que já
+        exista uma tarefa em andamento ou concluída com a mesma chave.
+        Tarefas canceladas ou com erro são substituídas por uma nova execução.
+        `pesada` usa a fila própria das tarefas longas.
+        """
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None and (tarefa.em_andamento or tarefa.concluida):
+                self._tarefas.move_to_end(chave)
+                return tarefa
+            tarefa = Tarefa(chave)
+            self._tarefas[chave] = tarefa
+            self._descartar_excedentes()
+        (self._pool_pesadas if pesada else self._pool).submit(self._executar, tarefa, funcao, args, kwargs)
+        return tarefa
+
+    def guardar_resultado(self, chave: Hashable, resultado: Any) -> Tarefa:
+        """
+        Registra como concluída uma tarefa cujo resultado já foi calculado (ex.: pela
+        pré-carga), a menos que a chave já tenha uma tarefa em andamento ou concluída.
+        """
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None and (tarefa.em_andamento or tarefa.concluida):
+                return tarefa
+            tarefa = Tarefa(chave)
+            tarefa.resultado = resultado
+            tarefa.progresso = 1.0
+            tarefa.mensagem = "Concluído"
+            tarefa.fim = time.time()
+            self._tarefas[chave] = tarefa
+            self._descartar_excedentes()
+        return tarefa
+
+    def cancelar(self, chave: Hashable) -> None:
+        tarefa = self.obter(chave)
+        if tarefa is not None:
+            tarefa.cancelar()
+
+    def descartar(self, chave: Hashable) -> None:
+        with self._lock:
+            tarefa = self._tarefas.pop(chave, None)
+        if tarefa is not None:
+            tarefa.cancelar()
+
+    def descartar_anteriores(self, prefixo: tuple, manter: Hashable) -> None:
+        """Remove tarefas cuja chave começa por `prefixo`, exceto `manter` (versões antigas)."""
+        with self._lock:
+            antigas = [
+                chave for chave in self._tarefas
+                if chave != manter and isinstance(chave, tuple) and chave[:len(prefixo)] == prefixo
+            ]
+            for chave in antigas:
+                self._tarefas.pop(chave).cancelar()
+
+    def _descartar_excedentes(self) -> None:
+        finalizadas = [chave for chave, t in self._tarefas.items() if not t.em_andamento]
+        while len(finalizadas) > self._max_resultados:
+            self._tarefas.pop(finalizadas.pop(0), None)
+
+    def _executar(self, tarefa: Tarefa, funcao: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        try:
+            tarefa.atualizar(0.0, "Iniciando...")
+            tarefa.resultado = funcao(tarefa, *args, **kwargs)
+            tarefa.progresso = 1.0
+            tarefa.mensagem = "Concluído"
+        except TarefaCancelada:
+            tarefa.mensagem = "Cancelado"
+        except Exception as e:
+            print(f"DEBUG: Erro na tarefa {tarefa.chave}:", e)
+            tarefa.erro = e
+            tarefa.mensagem = f"Erro: {e}"
+        finally:
+            tarefa.fim = time.time()
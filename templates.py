@@ -0,0 +1,217 @@
+import json
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import encadeamento
+import historico
+import modelos
+
+# ------------------------------------------------------------------
+# Biblioteca de templates de processos
+# ------------------------------------------------------------------
+# Um template é um conjunto de processos com seus layouts e retorno, salvo a
+# partir de um cliente e aplicável a outros. Os encadeamentos entre processos
+# do próprio template são gravados pela posição (processo_ordem) em vez do id;
+# ao aplicar, viram os ids dos processos recém-criados no cliente de destino.
+# Encadeamentos para processos fora do template ficam só com o rótulo
+# "nome - tipo" e são resolvidos pelo nome no cliente de destino, se existir.
+#
+# Com partições, os templates ficam no catálogo (são de todos os clientes);
+# sem partições, no próprio banco único.
+
+@dataclass(frozen=True, slots=True)
+class ProcessoTemplate:
+    ordem: int
+    nome: str
+    tipo: str
+    frequencia: str
+    descricao: str = ""
+    layouts: Tuple[dict, ...] = ()
+    retorno: Optional[dict] = None
+
+    @property
+    def rotulo(self) -> str:
+        return encadeamento.rotulo_processo(self.nome, self.tipo)
+
+@dataclass(frozen=True, slots=True)
+class Template:
+    id: int
+    nome: str
+    descricao: str
+    criado_em: str
+    processos: Tuple[ProcessoTemplate, ...] = ()
+
+def criar_tabelas(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS template (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL UNIQUE,
+            descricao TEXT,
+            criado_em TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS template_processo (
+            template_id INTEGER NOT NULL,
+            ordem INTEGER NOT NULL,
+            nome TEXT NOT NULL,
+            tipo TEXT,
+            frequencia TEXT,
+            descricao TEXT,
+            layouts TEXT NOT NULL,
+            retorno TEXT,
+            PRIMARY KEY (template_id, ordem),
+            FOREIGN KEY(template_id) REFERENCES template(id) ON DELETE CASCADE
+        )
+    ''')
+
+# ------------------------------------------------------------------
+# Criação e consulta
+# ------------------------------------------------------------------
+def processos_do_cliente(dados: modelos.DadosCliente, processo_ids: Iterable[int]) -> List[ProcessoTemplate]:
+    """Converte processos de um cliente em processos de template, trocando ids de encadeamento por posições."""
+    selecionados = [proc for proc in dados.processos if proc.id in set(processo_ids)]
+    ordem_por_id = {proc.id: ordem for ordem, proc in enumerate(selecionados)}
+    resultado = []
+    for ordem, proc in enumerate(selecionados):
+        config = dados.config(proc.id)
+        layouts = []
+        for layout in config.layouts_dicts():
+            # O perfil traz valores reais do arquivo de amostra deste cliente; o cliente
+            # que receber o template anexa a própria amostra
+            layout.pop("perfil", None)
+            if layout.get("tipo") == "Encadeamento":
+                origem = layout.pop("processo_id", None)
+                if origem in ordem_por_id:
+                    layout["processo_ordem"] = ordem_por_id[origem]
+            layouts.append(layout)
+        resultado.append(ProcessoTemplate(
+            ordem, proc.nome, proc.tipo, proc.frequencia, proc.descricao,
+            tuple(layouts), config.retorno_dict() or None
+        ))
+    return resultado
+
+def salvar_template(conn: sqlite3.Connection, nome: str, descricao: str, processos: List[ProcessoTemplate]) -> int:
+    """Mutação que grava (ou substitui, pelo nome) um template. Retorna o id."""
+    conn.execute("DELETE FROM template WHERE nome = ?", (nome,))
+    conn.execute("DELETE FROM template_processo WHERE template_id NOT IN (SELECT id FROM template)")
+    template_id = conn.execute(
+        "INSERT INTO template (nome, descricao, criado_em) VALUES (?, ?, ?)",
+        (nome, descricao, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO template_processo (template_id, ordem, nome, tipo, frequencia, descricao, layouts, retorno) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (template_id, p.ordem, p.nome, p.tipo, p.frequencia, p.descricao,
+             json.dumps(list(p.layouts)), json.dumps(p.retorno) if p.retorno else None)
+            for p in processos
+        ]
+    )
+    return template_id
+
+def excluir_template(conn: sqlite3.Connection, template_id: int) -> None:
+    """Mutação que exclui o template e seus processos."""
+    conn.execute("DELETE FROM template_processo WHERE template_id = ?", (template_id,))
+    conn.execute("DELETE FROM template WHERE id = ?", (template_id,))
+
+def listar_templates(conn: sqlite3.Connection) -> List[Tuple[int, str, str, int]]:
+    """(id, nome, descricao, quantidade de processos) de cada template, por nome."""
+    return conn.execute("""
+        SELECT t.id, t.nome, COALESCE(t.descricao, ''), COUNT(tp.ordem)
+        FROM template t
+        LEFT JOIN template_processo tp ON tp.template_id = t.id
+        GROUP BY t.id
+        ORDER BY t.nome
+    """).fetchall()
+
+def carregar_template(conn: sqlite3.Connection, template_id: int) -> Optional[Template]:
+    row = conn.execute("SELECT id, nome, COALESCE(descricao, ''), criado_em FROM template WHERE id = ?", (template_id,)).fetchone()
+    if not row:
+        return None
+    processos = tuple(
+        ProcessoTemplate(ordem, nome, tipo, frequencia, descricao or "",
+                         tuple(json.loads(layouts)), json.loads(retorno) if retorno else None)
+        for ordem, nome, tipo, frequencia, descricao, layouts, retorno in conn.execute(
+            "SELECT ordem, nome, tipo, frequencia, descricao, layouts, retorno "
+            "FROM template_processo WHERE template_id = ? ORDER BY ordem",
+            (template_id,)
+        )
+    )
+    return Template(*row, processos=processos)
+
+# ------------------------------------------------------------------
+# Aplicação em um cliente
+# ------------------------------------------------------------------
+def _proximo_id(conn: sqlite3.Connection, tabela: str) -> int:
+    """Próximo id de uma tabela AUTOINCREMENT, para inserir em lote com ids conhecidos."""
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabela,)).fetchone()
+    maior = conn.execute(f"SELECT MAX(id) FROM {tabela}").fetchone()[0]
+    return max(seq[0] if seq else 0, maior or 0) + 1
+
+def aplicar_template(conn: sqlite3.Connection, template: Template, cliente_id: int) -> Dict[str, int]:
+    """
+    Mutação que cria no cliente os processos do template, com configs, encadeamentos
+    e a primeira versão do histórico, em inserções em lote na transação do escritor.
+    Processos que o cliente já tem (mesmo nome e tipo) não são duplicados: os
+    encadeamentos do template passam a apontar para eles.
+    Retorna {"criados": n, "existentes": n, "encadeamentos": n}.
+    """
+    rotulos = {
+        encadeamento.rotulo_processo(nome, tipo): pid
+        for pid, nome, tipo in conn.execute("SELECT id, nome, tipo FROM processos WHERE cliente_id = ?", (cliente_id,))
+    }
+    # Os ids são atribuídos aqui: o escritor é o único a gravar no arquivo, então não há disputa
+    proximo = _proximo_id(conn, "processos")
+    id_por_ordem = {}
+    novos = []
+    for processo in template.processos:
+        existente = rotulos.get(processo.rotulo)
+        if existente is not None:
+            id_por_ordem[processo.ordem] = existente
+            continue
+        id_por_ordem[processo.ordem] = proximo
+        rotulos[processo.rotulo] = proximo
+        novos.append((proximo, processo))
+        proximo += 1
+    conn.executemany(
+        "INSERT INTO processos (id, nome, tipo, frequencia, cliente_id, configurado, descricao) VALUES (?, ?, ?, ?, ?, 1, ?)",
+        [(pid, p.nome, p.tipo, p.frequencia, cliente_id, p.descricao) for pid, p in novos]
+    )
+
+    rotulo_por_ordem = {p.ordem: p.rotulo for p in template.processos}
+    configs, arestas, estados = [], set(), []
+    for pid, processo in novos:
+        layouts = []
+        for layout in processo.layouts:
+            layout = dict(layout)
+            # Templates gravados antes de processos_do_cliente descartar o perfil ainda o trazem
+            layout.pop("perfil", None)
+            if layout.get("tipo") == "Encadeamento":
+                ordem = layout.pop("processo_ordem", None)
+                if ordem in id_por_ordem:
+                    layout["processo_id"] = id_por_ordem[ordem]
+                    layout["processo"] = rotulo_por_ordem[ordem]
+                elif layout.get("processo") in rotulos:
+                    layout["processo_id"] = rotulos[layout["processo"]]
+                origem = layout.get("processo_id")
+                if origem is not None and origem != pid:
+                    arestas.add((origem, pid))
+            layouts.append(layout)
+        retorno = processo.retorno or {}
+        configs.append((pid, json.dumps(layouts), json.dumps(retorno)))
+        estados.append((pid, historico.estado(layouts, retorno, [])))
+    conn.executemany(
+        "INSERT INTO processo_config (processo_id, cnpjs, layouts, encadeamento, retorno, versao) VALUES (?, '[]', ?, '', ?, 1)",
+        configs
+    )
+    # Origens de fora do template já existem e não dependem dos processos novos: não fecham ciclos
+    conn.executemany("INSERT OR IGNORE INTO processo_encadeamento (origem_id, destino_id) VALUES (?, ?)", sorted(arestas))
+    conn.executemany(
+        "INSERT OR IGNORE INTO processo_layout (rotulo, processo_id) VALUES (?, ?)",
+        [(rotulo, pid) for pid, layouts_json, _ in configs for rotulo in encadeamento.rotulos_layouts(json.loads(layouts_json))]
+    )
+    historico.registrar_iniciais(conn, estados)
+    return {"criados": len(novos), "existentes": len(template.processos) - len(novos), "encadeamentos": len(arestas)}
@@ -0,0 +1,152 @@
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# ------------------------------------------------------------------
+# Unidade de trabalho por execução do script
+# ------------------------------------------------------------------
+# Cada execução (rerun) do app cria uma unidade e a conclui ao terminar de
+# desenhar a tela. Dentro dela:
+#   - as leituras de um arquivo usam uma única conexão com uma transação de
+#     leitura aberta: todas as consultas da execução enxergam o mesmo retrato
+#     do banco, mesmo que outra sessão grave no meio do caminho;
+#   - o mapa de identidade guarda o resultado de cada consulta pela chave, de
+#     modo que a segunda busca pelo mesmo cliente, versão ou catálogo de
+#     layouts devolve o mesmo objeto sem voltar ao banco (nem ao cache do
+#     Streamlit, que copia os valores a cada leitura);
+#   - escritas de manutenção, cujo resultado a tela não usa, são acumuladas e
+#     gravadas juntas, em uma transação por arquivo, ao concluir.
+# Escritas cujo resultado ou erro a tela precisa (conflito de versão, ciclo de
+# encadeamento, id criado) continuam síncronas e descartam o retrato do
+# arquivo, para que as leituras seguintes já vejam a gravação. Mutações de
+# manutenção derivadas das gravações (ex.: o índice de semelhança) são
+# registradas em `apos_escrita` e entram, uma vez por arquivo, nas adiadas.
+#
+# Depois de concluída, a unidade continua utilizável por callbacks (on_click),
+# que o Streamlit executa antes da próxima execução com as funções da anterior:
+# leituras abrem e fecham uma conexão cada e escritas adiadas gravam na hora.
+
+class UnidadeDeTrabalho:
+    def __init__(self, conectar: Callable[[str], sqlite3.Connection], escritor_de: Callable[[str], Any],
+                 apos_escrita: Tuple[Callable[[sqlite3.Connection], Any], ...] = (), registrar: bool = False):
+        self._conectar = conectar
+        # Com `registrar`, cada conclusão imprime o tempo e as contagens da execução (diagnóstico)
+        self._registrar = registrar
+        self._escritor_de = escritor_de
+        self._apos_escrita = apos_escrita
+        self._conexoes: Dict[str, sqlite3.Connection] = {}
+        self._mapa: Dict[Tuple[Optional[str], Hashable], Any] = {}
+        self._adiadas: Dict[str, List[tuple]] = {}
+        self.ativa = True
+        self.estatisticas = {"consultas": 0, "acertos": 0, "escritas": 0, "adiadas": 0}
+        self._inicio = time.perf_counter()
+
+    # ------------------------------------------------------------------
+    # Leituras
+    # ------------------------------------------------------------------
+    def conexao(self, caminho: str) -> sqlite3.Connection:
+        """Conexão de leitura do arquivo, com o retrato desta execução já fixado."""
+        conn = self._conexoes.get(caminho)
+        if conn is None:
+            conn = self._conectar(caminho)
+            conn.execute("BEGIN")
+            # O retrato é tirado na primeira leitura da transação
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+            self._conexoes[caminho] = conn
+        return conn
+
+    def obter(self, chave: Hashable, carregar: Callable[[], Any], caminho: Optional[str] = None) -> Any:
+        """
+        Valor da chave no mapa de identidade; na primeira busca, `carregar()`.
+        `caminho` indica o arquivo de onde o valor veio (descartado junto com o retrato dele).
+        """
+        if not self.ativa:
+            return carregar()
+        if (caminho, chave) in self._mapa:
+            self.estatisticas["acertos"] += 1
+            return self._mapa[(caminho, chave)]
+        valor = carregar()
+        self._mapa[(caminho, chave)] = valor
+        return valor
+
+    def ler(self, caminho: str, chave: Optional[Hashable], consulta: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        Resultado de `consulta(conn)` no retrato do arquivo. A mesma chave é consultada
+        uma única vez por execução; chave None não guarda o resultado.
+        """
+        def consultar():
+            self.estatisticas["consultas"] += 1
+            if not self.ativa:
+                with closing(self._conectar(caminho)) as conn:
+                    return consulta(conn)
+            return consulta(self.conexao(caminho))
+        if chave is None:
+            return consultar()
+        return self.obter(chave, consultar, caminho)
+
+    def invalidar(self, caminho: Optional[str] = None) -> None:
+        """Descarta o retrato e os valores lidos do arquivo (de todos, sem caminho)."""
+        for arquivo in [caminho] if caminho is not None else list(self._conexoes):
+            conn = self._conexoes.pop(arquivo, None)
+            if conn is not None:
+                conn.rollback()
+                conn.close()
+        for chave in [chave for chave in self._mapa if caminho is None or chave[0] in (caminho, None)]:
+            del self._mapa[chave]
+
+    # ------------------------------------------------------------------
+    # Escritas
+    # ------------------------------------------------------------------
+    def escrever(self, caminho: str, funcao: Callable[..., Any], *args, **kwargs) -> Any:
+        """Grava já, pelo escritor do arquivo, e devolve o resultado; as leituras seguintes veem a gravação."""
+        self.estatisticas["escritas"] += 1
+        try:
+            return self._escritor_de(caminho).executar(funcao, *args, **kwargs)
+        finally:
+            self.invalidar(caminho)
+            for manutencao in self._apos_escrita:
+                self.adiar(caminho, manutencao)
+
+    def adiar(self, caminho: str, funcao: Callable[..., Any], *args) -> None:
+        """
+        Acumula uma escrita para gravar ao concluir (na hora, se a unidade já foi concluída).
+        A mesma escrita adiada mais de uma vez no arquivo é gravada uma vez só.
+        """
+        if not self.ativa:
+            self.estatisticas["adiadas"] += 1
+            self._escritor_de(caminho).enviar(funcao, *args)
+            return
+        pendentes = self._adiadas.setdefault(caminho, [])
+        if (funcao, args) not in pendentes:
+            self.estatisticas["adiadas"] += 1
+            pendentes.append((funcao, args))
+
+    def _gravar_adiadas(self) -> None:
+        for caminho, mutacoes in self._adiadas.items():
+            def lote(conn, mutacoes=mutacoes):
+                return [funcao(conn, *args) for funcao, args in mutacoes]
+            try:
+                self._escritor_de(caminho).executar(lote)
+            except Exception as e:
+                print(f"DEBUG: Erro ao gravar {len(mutacoes)} escrita(s) adiada(s) em {caminho}: {e}")
+        self._adiadas.clear()
+
+    # ------------------------------------------------------------------
+    # Conclusão
+    # ------------------------------------------------------------------
+    def concluir(self) -> None:
+        """Encerra os retratos, grava as escritas adiadas e esvazia o mapa de identidade."""
+        if not self.ativa:
+            return
+        self.ativa = False
+        self.invalidar()
+        self._gravar_adiadas()
+        if not self._registrar:
+            return
+        e = self.estatisticas
+        print(
+            f"DEBUG: Execução concluída em {(time.perf_counter() - self._inicio) * 1000:.0f} ms "
+            f"({e['consultas']} consulta(s), {e['acertos']} repetida(s) no mapa, "
+            f"{e['escritas']} escrita(s), {e['adiadas']} adiada(s))"
+        )
@@ -0,0 +1,51 @@
+import sqlite3
+
+# ------------------------------------------------------------------
+# Versão de dados por cliente
+# ------------------------------------------------------------------
+# Cada escrita em cliente, cnpjs, processos, processo_config ou no índice de
+# encadeamentos incrementa a versão do cliente dono do registro, via triggers.
+# Resultados calculados (relatórios, caches) podem então ser guardados pela
+# chave (cliente_id, versao) e reaproveitados enquanto nada mudar.
+
+# tabela -> expressão SQL que encontra o cliente a partir da linha (REG = NEW/OLD)
+_ORIGEM_CLIENTE = {
+    "cliente": "SELECT REG.id AS cid",
+    "cnpjs": "SELECT REG.cliente_id AS cid",
+    "processos": "SELECT REG.cliente_id AS cid",
+    "processo_config": "SELECT cliente_id AS cid FROM processos WHERE id = REG.processo_id",
+    "processo_encadeamento": "SELECT cliente_id AS cid FROM processos WHERE id = REG.destino_id",
+}
+
+def criar_tabela(conn: sqlite3.Connection) -> None:
+    """Cria a tabela de versões e as triggers que a mantêm."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cliente_versao (
+            cliente_id INTEGER PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for tabela, origem in _ORIGEM_CLIENTE.items():
+        for evento, reg in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            consulta = origem.replace("REG.", f"{reg}.")
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    INSERT INTO cliente_versao (cliente_id, versao)
+                    SELECT cid, 1 FROM ({consulta}) WHERE cid IS NOT NULL
+                    ON CONFLICT(cliente_id) DO UPDATE SET versao = versao + 1;
+                END
+            ''')
+
+def remover_triggers(conn: sqlite3.Connection) -> None:
+    """Remove as triggers de versão (antes de reconstruir tabelas; criar_tabela as recria)."""
+    for (nome,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_versao_%'"
+    ).fetchall():
+        conn.execute(f"DROP TRIGGER {nome}")
+
+def versao_cliente(conn: sqlite3.Connection, cliente_id: int) -> int:
+    """Versão atual dos dados do cliente (0 se nunca houve escrita)."""
+    row = conn.execute("SELECT versao FROM cliente_versao WHERE cliente_id = ?", (cliente_id,)).fetchone()
+    return row[0] if row else 0